@@ -0,0 +1,39 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+# The benchmarks run without a display, so Qt is told to use its offscreen platform unless something else is set.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.suite import run_benchmarks  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Runs the performance benchmarks against a local fake reddit server "
+                                                 "and prints the results as JSON.")
+    parser.add_argument("names", nargs="*", help="the benchmarks to run, by default all of them: download_scaling, "
+                                                 "subreddit_fetch, change_background, model_paint, delete_images, "
+                                                 "startup")
+    parser.add_argument("--quick", action="store_true", help="use small sizes so the benchmarks finish quickly")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="the latency in seconds of every request to the fake reddit server")
+    parser.add_argument("--output", help="write the results to this file instead of standard output")
+    arguments = parser.parse_args()
+
+    # Sending the messages that the application prints to standard error so standard output only contains the results.
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmarks(arguments.names, arguments.quick, arguments.latency)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import json
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QRect, Qt
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+# The sizes of the original images in the synthetic listings. The portrait and small sizes are not viable as desktop
+# backgrounds, so the listings also exercise the viability check.
+SOURCE_SIZES = [(3840, 2160), (2560, 1440), (1920, 1080), (5120, 2880), (1080, 1920), (800, 600)]
+
+# The widths of the downscaled variants that reddit includes in the preview of a submission.
+RESOLUTION_WIDTHS = [108, 216, 320, 640, 960, 1080]
+
+
+class BenchmarkHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 makes connections from many download workers wait for a retry.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeRedditServer:
+    """
+    Class for a local stand-in for the parts of reddit that the application uses. The server serves the OAuth token
+    endpoint, subreddit search and about pages, synthetic "top" listings with previews, subreddit icons and image
+    bytes, which means that the whole fetch path can be measured without touching the real reddit.
+
+    Every request is delayed by the configured latency and the server answers with status 429 once more than the
+    configured number of requests have been made within a minute, including the same rate limit headers as reddit.
+    """
+    def __init__(self, subreddits=None, posts_per_subreddit=200, latency=0.0, requests_per_minute=None,
+                 image_bytes=None, seed=0):
+        """
+        :param subreddits: The names of the subreddits that exist on the server.
+        :param posts_per_subreddit: The number of submissions in the listing of each subreddit.
+        :param latency: The number of seconds each request is delayed.
+        :param requests_per_minute: The number of API requests allowed per minute or None for no limit.
+        :param image_bytes: The number of bytes the full size images are padded to or None to not pad them.
+        :param seed: The seed of the random generator that creates the listings.
+        """
+        self.subreddits = {name.lower(): name for name in (subreddits or ["wallpapers"])}
+        self.posts_per_subreddit = posts_per_subreddit
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.image_bytes = image_bytes
+        self.seed = seed
+
+        # The number of requests per endpoint, used to report how many requests a benchmark needed.
+        self.request_counts = Counter()
+        self.rate_limited_requests = 0
+
+        # The number of requests that are being handled, the most that were handled at the same time and the client
+        # addresses of the connections, which show how concurrent the client is and whether it reuses connections.
+        self.in_flight_requests = 0
+        self.peak_in_flight_requests = 0
+        self.client_addresses = set()
+
+        self.lock = threading.Lock()
+        self.rate_limit_window_start = time.time()
+        self.rate_limit_used = 0
+
+        self.listings = {}
+        self.image_cache = {}
+
+        self.http_server = BenchmarkHTTPServer(("127.0.0.1", 0), self.create_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base url of the server."""
+        return "http://127.0.0.1:{}".format(self.http_server.server_port)
+
+    def start(self):
+        """Starts serving requests in a background thread."""
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving requests."""
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def write_praw_ini(self, path="praw.ini"):
+        """Writes a praw.ini file that points PRAW at the server. PRAW reads praw.ini from the working directory."""
+        with open(path, "w") as praw_file:
+            praw_file.write("[DEFAULT]\noauth_url={0}\nreddit_url={0}\ncheck_for_updates=False\n".format(self.url))
+
+    def reset_counts(self):
+        """Resets the request counters."""
+        with self.lock:
+            self.request_counts.clear()
+            self.rate_limited_requests = 0
+            self.peak_in_flight_requests = self.in_flight_requests
+            self.client_addresses.clear()
+
+    def get_listing(self, subreddit_name):
+        """Returns the synthetic submissions of the given subreddit, creating them the first time."""
+        key = subreddit_name.lower()
+
+        with self.lock:
+            if key not in self.listings:
+                generator = random.Random("{}-{}".format(self.seed, key))
+                self.listings[key] = [self.create_submission(self.subreddits[key], index, generator)
+                                      for index in range(self.posts_per_subreddit)]
+
+            return self.listings[key]
+
+    def create_submission(self, subreddit_name, index, generator):
+        """Creates the data of a single synthetic submission."""
+        submission_id = "{}{:05d}".format(subreddit_name.lower()[:3], index)
+        width, height = generator.choice(SOURCE_SIZES)
+        is_video = generator.random() < 0.05
+
+        def image_url(image_width, image_height):
+            return "{}/images/{}/{}/{}x{}.jpg".format(self.url, subreddit_name, submission_id, image_width,
+                                                     image_height)
+
+        resolutions = [{"url": image_url(variant_width, variant_width * height // width),
+                        "width": variant_width, "height": variant_width * height // width}
+                       for variant_width in RESOLUTION_WIDTHS if variant_width < width]
+
+        return {
+            "id": submission_id,
+            "name": "t3_" + submission_id,
+            "title": "Synthetic wallpaper {}".format(index),
+            "subreddit": subreddit_name,
+            "author": "benchmark",
+            "url": image_url(width, height),
+            "is_reddit_media_domain": generator.random() < 0.95,
+            "is_video": is_video,
+            "score": self.posts_per_subreddit - index,
+            "created_utc": 1600000000 + index,
+            "preview": {"images": [{"id": submission_id,
+                                    "source": {"url": image_url(width, height), "width": width, "height": height},
+                                    "resolutions": resolutions}],
+                        "enabled": True}
+        }
+
+    def get_image(self, submission_id, width, height):
+        """
+        Returns the JPEG bytes of a synthetic image. Thumbnails are unique per submission so they have different
+        perceptual hashes, while the larger variants are shared between submissions to keep the server fast.
+        """
+        is_thumbnail = width <= 108
+        key = (submission_id if is_thumbnail else None, width, height)
+
+        with self.lock:
+            if key not in self.image_cache:
+                self.image_cache[key] = create_jpeg(width, height, submission_id if is_thumbnail else "shared",
+                                                    None if is_thumbnail else self.image_bytes)
+
+            return self.image_cache[key]
+
+    def check_rate_limit(self):
+        """
+        Registers an API request against the rate limit.
+
+        :return: A tuple with whether the request is allowed and the rate limit headers.
+        """
+        with self.lock:
+            now = time.time()
+            if now - self.rate_limit_window_start >= 60:
+                self.rate_limit_window_start = now
+                self.rate_limit_used = 0
+
+            self.rate_limit_used += 1
+            reset = int(60 - (now - self.rate_limit_window_start))
+
+            if self.requests_per_minute is None:
+                return True, {}
+
+            remaining = max(self.requests_per_minute - self.rate_limit_used, 0)
+            headers = {"X-Ratelimit-Used": str(self.rate_limit_used),
+                       "X-Ratelimit-Remaining": str(remaining),
+                       "X-Ratelimit-Reset": str(reset)}
+
+            allowed = self.rate_limit_used <= self.requests_per_minute
+            if not allowed:
+                self.rate_limited_requests += 1
+
+            return allowed, headers
+
+    def create_handler(self):
+        """Creates the request handler class that is bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_request()
+
+            def do_POST(self):
+                self.handle_request()
+
+            def handle_request(self):
+                with server.lock:
+                    server.in_flight_requests += 1
+                    server.peak_in_flight_requests = max(server.peak_in_flight_requests, server.in_flight_requests)
+                    server.client_addresses.add(self.client_address)
+
+                try:
+                    self.respond()
+                finally:
+                    with server.lock:
+                        server.in_flight_requests -= 1
+
+            def respond(self):
+                url = urlparse(self.path)
+                parameters = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+                # Reading the body so keep-alive connections stay in sync.
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    parameters.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                path = url.path.rstrip("/")
+                if path.endswith(".json"):
+                    path = path[:-5]
+
+                endpoint = re.sub(r"/r/[^/]+", "/r/{subreddit}", path)
+                endpoint = re.sub(r"^/(images|icons)/.*", r"/\1", endpoint)
+                with server.lock:
+                    server.request_counts[endpoint] += 1
+
+                if path.startswith("/images/"):
+                    _, _, _, submission_id, size = path.split("/")
+                    width, height = (int(value) for value in size[:-4].split("x"))
+                    return self.send_bytes(server.get_image(submission_id, width, height), "image/jpeg")
+
+                if path.startswith("/icons/"):
+                    return self.send_bytes(server.get_image("icon-" + path, 64, 64), "image/jpeg")
+
+                if path == "/api/v1/access_token":
+                    return self.send_json({"access_token": "benchmark", "token_type": "bearer",
+                                           "expires_in": 3600, "scope": "*"})
+
+                allowed, headers = server.check_rate_limit()
+                if not allowed:
+                    return self.send_json({"message": "Too Many Requests", "error": 429}, 429, headers)
+
+                if path == "/api/search_reddit_names":
+                    query = parameters.get("query", "").lower()
+                    if query in server.subreddits:
+                        return self.send_json({"names": [server.subreddits[query]]}, headers=headers)
+                    return self.send_json({"message": "Not Found", "error": 404}, 404, headers)
+
+                if path == "/api/info":
+                    names = [name for name in parameters.get("sr_name", "").split(",") if name]
+                    children = [{"kind": "t5", "data": self.about_data(server.subreddits[name.lower()])}
+                                for name in names if name.lower() in server.subreddits]
+                    return self.send_json({"kind": "Listing", "data": {"children": children, "after": None,
+                                                                       "before": None}}, headers=headers)
+
+                match = re.match(r"^/r/([^/]+)(/about|/top)?$", path)
+                if match and match.group(1).lower() in server.subreddits:
+                    name = server.subreddits[match.group(1).lower()]
+                    if match.group(2) == "/top":
+                        return self.send_json(self.listing(name, parameters), headers=headers)
+                    return self.send_json({"kind": "t5", "data": self.about_data(name)}, headers=headers)
+
+                return self.send_json({"message": "Not Found", "error": 404}, 404, headers)
+
+            def about_data(self, name):
+                return {"display_name": name, "name": "t5_" + name.lower(), "id": name.lower(),
+                        "icon_img": "{}/icons/{}.png".format(server.url, name), "subscribers": 1000}
+
+            def listing(self, name, parameters):
+                submissions = server.get_listing(name)
+                limit = min(int(parameters.get("limit", 25)), 100)
+
+                # Continuing after the submission with the given fullname, like the reddit listings.
+                start = 0
+                after = parameters.get("after")
+                if after:
+                    fullnames = [submission["name"] for submission in submissions]
+                    start = fullnames.index(after) + 1 if after in fullnames else len(submissions)
+
+                page = submissions[start:start + limit]
+                next_after = page[-1]["name"] if page and start + limit < len(submissions) else None
+
+                return {"kind": "Listing",
+                        "data": {"children": [{"kind": "t3", "data": submission} for submission in page],
+                                 "after": next_after, "before": None, "dist": len(page)}}
+
+            def send_json(self, data, status=200, headers=None):
+                self.send_bytes(json.dumps(data).encode(), "application/json", status, headers)
+
+            def send_bytes(self, body, content_type, status=200, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def create_jpeg(width, height, seed, target_bytes=None):
+    """
+    Creates the bytes of a JPEG image with a random pattern of rectangles.
+
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :param seed: The seed of the pattern, images with the same seed look the same.
+    :param target_bytes: The size the image is padded to with comment segments, or None to not pad it.
+    :return: The JPEG bytes.
+    """
+    generator = random.Random(seed)
+
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(Qt.white)
+
+    painter = QPainter(image)
+    for _ in range(24):
+        painter.fillRect(QRect(int(generator.random() * width), int(generator.random() * height),
+                               width // 4, height // 4),
+                         QColor(generator.randint(0, 255), generator.randint(0, 255), generator.randint(0, 255)))
+    painter.end()
+
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "JPG", 90)
+    jpeg = bytes(data)
+
+    if target_bytes is None or target_bytes <= len(jpeg):
+        return jpeg
+
+    # Padding with comment segments right after the start of image marker, which decoders skip.
+    padding = bytearray()
+    remaining = target_bytes - len(jpeg)
+    while remaining > 4:
+        segment_length = min(remaining - 2, 65535)
+        padding += b"\xff\xfe" + struct.pack(">H", segment_length) + b"\0" * (segment_length - 2)
+        remaining -= segment_length + 2
+
+    return jpeg[:2] + bytes(padding) + jpeg[2:]
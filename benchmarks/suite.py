@@ -0,0 +1,409 @@
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.fake_reddit import FakeRedditServer
+from reddit_background_changer.background_changer import BackgroundChanger
+from reddit_background_changer.downloader import DownloadPipeline
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.rate_limiter import RateLimiter
+from reddit_background_changer.reddit_client import RedditClient
+from reddit_background_changer.rotation_scheduler import RotationScheduler
+from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import BlobStore, create_storage_setup
+from reddit_background_changer.subreddit_model import SubredditModel
+
+REPOSITORY_FOLDER = pathlib.Path(__file__).resolve().parent.parent
+
+
+class BenchmarkWindow:
+    """Stand-in for the main window that the subreddit model is created with."""
+    def __init__(self):
+        self.model = None
+
+
+def prepare_workspace():
+    """
+    Creates a temporary copy of the folder layout of the application and makes its package folder the working
+    directory, since the application uses paths relative to the working directory. The settings are pointed at the
+    headless wallpaper backend.
+
+    :return: The root folder of the workspace.
+    """
+    root = pathlib.Path(tempfile.mkdtemp(prefix="reddit_background_changer_benchmark_"))
+    (root / "package").mkdir()
+    shutil.copytree(str(REPOSITORY_FOLDER / "resources"), str(root / "resources"))
+
+    os.chdir(str(root / "package"))
+    create_storage_setup()
+
+    settings = Settings.shared()
+    settings.client_id = "benchmark"
+    settings.client_secret = "benchmark"
+    settings.user_agent = "reddit_background_changer benchmark"
+    settings.wallpaper_backend = "headless"
+    settings.save_settings()
+
+    return root
+
+
+def summarize(durations):
+    """Summarizes a list of durations in seconds as milliseconds."""
+    durations = sorted(durations)
+    return {"count": len(durations),
+            "mean_ms": statistics.mean(durations) * 1000,
+            "p50_ms": durations[len(durations) // 2] * 1000,
+            "p95_ms": durations[min(int(len(durations) * 0.95), len(durations) - 1)] * 1000,
+            "max_ms": durations[-1] * 1000}
+
+
+def fill_catalog(catalog, image_count, subreddit_count=50):
+    """Fills the catalog with entries for images that do not exist on disk, spread over the given subreddits."""
+    # Creating the rotation scheduler first so its tables exist and the old deck is cleared along with the images.
+    RotationScheduler(catalog)
+
+    with catalog.lock, catalog.connection:
+        catalog.connection.execute("DELETE FROM images")
+        catalog.connection.execute("DELETE FROM rotation_deck")
+        catalog.connection.executemany(
+            "INSERT INTO images (subreddit, fullname, path, width, height, size, downloaded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [("pool{}".format(index % subreddit_count), "t3_pool{}".format(index),
+              os.path.abspath("../data/images/pool{}_t3_pool{}.jpg".format(index % subreddit_count, index)),
+              2560, 1440, 500000, index) for index in range(image_count)])
+
+
+def benchmark_download_scaling(server, worker_counts, image_count):
+    """Measures the aggregate throughput of the download pipeline for different numbers of workers."""
+    results = []
+    save_folder = tempfile.mkdtemp(dir="../data")
+
+    for worker_count in worker_counts:
+        pipeline = DownloadPipeline(worker_count)
+        batch = pipeline.start_batch("scaling", image_count)
+
+        start_time = time.perf_counter()
+        for index in range(image_count):
+            pipeline.submit(batch, "{}/images/scaling/{}/2560x1440.jpg".format(server.url, index),
+                            os.path.join(save_folder, "{}.jpg".format(index)))
+        batch.wait()
+        duration = time.perf_counter() - start_time
+
+        results.append({"workers": worker_count,
+                        "images": batch.downloaded,
+                        "seconds": duration,
+                        "images_per_second": batch.downloaded / duration,
+                        "bytes_per_second": batch.bytes_downloaded / duration})
+
+    shutil.rmtree(save_folder)
+    return results
+
+
+def benchmark_subreddit_fetch(server, image_counts):
+    """Measures getting the images of a whole subreddit through PRAW and the fake reddit server."""
+    window = BenchmarkWindow()
+    model = SubredditModel(window)
+    window.model = model
+
+    results = []
+    for image_count in image_counts:
+        model.delete_images("wallpapers")
+        server.reset_counts()
+
+        start_time = time.perf_counter()
+        sync_result = model.image_getter.get_images(("wallpapers", "All time", image_count), "../data/images/")
+        duration = time.perf_counter() - start_time
+
+        results.append({"requested_images": image_count,
+                        "downloaded_images": sync_result["downloaded"] if sync_result else 0,
+                        "seconds": duration,
+                        "images_per_second": (sync_result["downloaded"] if sync_result else 0) / duration,
+                        "requests": dict(server.request_counts),
+                        "rate_limited_requests": server.rate_limited_requests,
+                        "rate_limiter": RateLimiter.shared().metrics(),
+                        "reddit_client": RedditClient.shared().metrics(),
+                        "listing_cache": model.image_getter.listing_cache.metrics()})
+
+        # Getting the images again with twice the number of images, which resumes the cached listing.
+        server.reset_counts()
+
+        start_time = time.perf_counter()
+        sync_result = model.image_getter.get_images(("wallpapers", "All time", image_count * 2), "../data/images/")
+        duration = time.perf_counter() - start_time
+
+        results.append({"requested_images": image_count * 2,
+                        "resync": True,
+                        "kept_images": sync_result["kept"] if sync_result else 0,
+                        "downloaded_images": sync_result["downloaded"] if sync_result else 0,
+                        "seconds": duration,
+                        "requests": dict(server.request_counts),
+                        "listing_cache": model.image_getter.listing_cache.metrics()})
+
+    model.delete_images("wallpapers")
+    return results
+
+
+def benchmark_change_background(pool_sizes, changes):
+    """
+    Measures the latency of change_background on the GUI thread for different pool sizes. The lookahead queue is
+    disabled so every change takes the next image from the rotation scheduler, which is the work that remains on the
+    GUI thread when the prefetch thread falls behind.
+    """
+    settings = Settings.shared()
+    settings.lookahead_size = 0
+
+    results = []
+    for pool_size in pool_sizes:
+        fill_catalog(ImageCatalog(), pool_size)
+
+        # The first change shuffles the whole deck, so it is measured separately.
+        background_changer = BackgroundChanger()
+        start_time = time.perf_counter()
+        background_changer.change_background()
+        shuffle_duration = time.perf_counter() - start_time
+
+        durations = []
+        for _ in range(changes):
+            start_time = time.perf_counter()
+            background_changer.change_background()
+            durations.append(time.perf_counter() - start_time)
+
+        background_changer.timer.stop()
+        result = {"pool_size": pool_size, "first_change_with_shuffle_ms": shuffle_duration * 1000}
+        result.update(summarize(durations))
+        result["backend_apply_mean_ms"] = statistics.mean(background_changer.backend.apply_latencies) * 1000
+        results.append(result)
+
+    settings.lookahead_size = 3
+    return results
+
+
+def benchmark_model_paint(subreddit_counts, passes):
+    """Measures the cost of SubredditModel.data for the display and decoration roles, i.e. painting the list."""
+    results = []
+    for subreddit_count in subreddit_counts:
+        catalog = ImageCatalog()
+        names = ["paint{}".format(index) for index in range(subreddit_count)]
+        for name in names:
+            icon_path = "../data/icons/{}.png".format(name)
+            shutil.copy("../resources/default_subreddit_icon.png", icon_path)
+            catalog.set_icon(name, icon_path)
+
+        window = BenchmarkWindow()
+        model = SubredditModel(window, [(name, "All time", 10) for name in names])
+        window.model = model
+
+        pass_durations = []
+        for _ in range(passes):
+            start_time = time.perf_counter()
+            for row in range(model.rowCount()):
+                index = model.index(row)
+                model.data(index, Qt.DisplayRole)
+                model.data(index, Qt.DecorationRole)
+            pass_durations.append(time.perf_counter() - start_time)
+
+        results.append({"subreddits": subreddit_count,
+                        "cold_pass_ms": pass_durations[0] * 1000,
+                        "warm_pass_mean_ms": statistics.mean(pass_durations[1:]) * 1000,
+                        "warm_row_mean_us": statistics.mean(pass_durations[1:]) / subreddit_count * 1000000})
+
+        for name in names:
+            model.delete_images(name)
+
+    return results
+
+
+def benchmark_delete_images(pool_sizes, images_per_subreddit, repetitions):
+    """Measures deleting the images of one subreddit from pools of different sizes."""
+    window = BenchmarkWindow()
+    model = SubredditModel(window)
+    window.model = model
+
+    results = []
+    for pool_size in pool_sizes:
+        fill_catalog(model.catalog, pool_size)
+
+        durations = []
+        for _ in range(repetitions):
+            for index in range(images_per_subreddit):
+                path = BlobStore.image_path("../data/images", "deleted_t3_deleted{}.jpg".format(index))
+                with open(path, "wb") as image_file:
+                    image_file.write(b"\xff\xd8\xff\xd9")
+                model.catalog.add_image("deleted", "t3_deleted{}".format(index), path, 2560, 1440, 4)
+
+            start_time = time.perf_counter()
+            model.delete_images("deleted")
+            durations.append(time.perf_counter() - start_time)
+
+        result = {"pool_size": pool_size, "images_deleted": images_per_subreddit}
+        result.update(summarize(durations))
+        results.append(result)
+
+    return results
+
+
+# Function that returns the peak resident memory of the measured process itself. The peak from getrusage() is inherited
+# across fork and exec on Linux, so the child would report the peak of the benchmark runner if it is larger. VmHWM in
+# /proc/self/status is reset on exec, so it is used where it exists.
+PEAK_MEMORY_FUNCTION = """
+import resource
+
+def peak_rss_kilobytes():
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+# Script that measures the time and peak resident memory of changing the background through the command line interface.
+CLI_STARTUP_SCRIPT = PEAK_MEMORY_FUNCTION + """
+import json, sys, time
+start_time = time.perf_counter()
+from reddit_background_changer.__main__ import run
+run(["change"])
+print(json.dumps({"seconds": time.perf_counter() - start_time,
+                  "max_rss_kilobytes": peak_rss_kilobytes(),
+                  "qt_widgets_imported": "PyQt5.QtWidgets" in sys.modules,
+                  "praw_imported": "praw" in sys.modules}))
+"""
+
+# Script that measures the time and peak resident memory of starting the user interface until the first events are
+# handled, either with the main window or only with the tray icon.
+GUI_STARTUP_SCRIPT = PEAK_MEMORY_FUNCTION + """
+import json, sys, time
+sys.argv = ["main.py"] + sys.argv[1:]
+from reddit_background_changer import main
+from PyQt5.QtWidgets import QApplication
+
+class MeasuredStartupProfile(main.StartupProfile):
+    def finish(self):
+        print(json.dumps({"seconds": time.perf_counter() - main.START_TIME,
+                          "max_rss_kilobytes": peak_rss_kilobytes(),
+                          "qt_widgets_imported": "PyQt5.QtWidgets" in sys.modules,
+                          "praw_imported": "praw" in sys.modules}))
+        QApplication.instance().exit()
+
+main.StartupProfile = MeasuredStartupProfile
+main.main()
+"""
+
+
+def benchmark_startup(repetitions):
+    """
+    Measures the startup time and peak resident memory of changing the background through the command line interface
+    compared to starting the user interface with the main window and only with the tray icon. Every measurement is a
+    new process, so the interpreter startup is included in the wall time.
+    """
+    # Using images that exist on disk since the prefetch thread of the user interface validates them.
+    catalog = ImageCatalog()
+    fill_catalog(catalog, 0)
+    image = QImage(64, 36, QImage.Format_RGB32)
+    image.fill(Qt.darkCyan)
+    for index in range(100):
+        path = BlobStore.image_path("../data/images", "startup_t3_startup{}.jpg".format(index))
+        image.save(path, "JPG")
+        catalog.add_image("startup", "t3_startup{}".format(index), path, 64, 36, os.path.getsize(path))
+
+    environment = dict(os.environ, PYTHONPATH=str(REPOSITORY_FOLDER))
+    results = []
+    for mode, arguments in (("cli_change", ["-c", CLI_STARTUP_SCRIPT]), ("gui", ["-c", GUI_STARTUP_SCRIPT]),
+                            ("gui_tray", ["-c", GUI_STARTUP_SCRIPT, "--tray"])):
+        measurements = []
+        for _ in range(repetitions):
+            start_time = time.perf_counter()
+            output = subprocess.run([sys.executable] + arguments, env=environment, check=True,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    universal_newlines=True).stdout
+            wall_time = time.perf_counter() - start_time
+
+            # The measurement is the last line since the background changer also prints the path of the background.
+            measurement = json.loads([line for line in output.splitlines() if line.startswith("{")][-1])
+            measurement["wall_seconds"] = wall_time
+            measurements.append(measurement)
+
+        results.append({"mode": mode,
+                        "wall_mean_ms": statistics.mean(m["wall_seconds"] for m in measurements) * 1000,
+                        "in_process_mean_ms": statistics.mean(m["seconds"] for m in measurements) * 1000,
+                        "max_rss_kilobytes": max(m["max_rss_kilobytes"] for m in measurements),
+                        "qt_widgets_imported": measurements[0]["qt_widgets_imported"],
+                        "praw_imported": measurements[0]["praw_imported"]})
+
+    return results
+
+
+def run_benchmarks(names=None, quick=False, latency=0.01):
+    """
+    Runs the benchmarks with the given names, or every benchmark if no names are given.
+
+    :param names: The names of the benchmarks that should be run.
+    :param quick: If true smaller sizes are used so the benchmarks finish in a few seconds.
+    :param latency: The latency in seconds of every request to the fake reddit server.
+    :return: A dictionary with the results that can be serialized as JSON.
+    """
+    application = QApplication.instance() or QApplication(sys.argv[:1])
+    workspace = prepare_workspace()
+
+    benchmarks = {
+        "download_scaling": lambda server: benchmark_download_scaling(
+            server, [1, 2, 4, 8], 16 if quick else 64),
+        "subreddit_fetch": lambda server: benchmark_subreddit_fetch(
+            server, [10] if quick else [25, 100]),
+        "change_background": lambda server: benchmark_change_background(
+            [1000] if quick else [1000, 10000, 100000], 50 if quick else 500),
+        "model_paint": lambda server: benchmark_model_paint(
+            [50] if quick else [100, 500], 5 if quick else 20),
+        "delete_images": lambda server: benchmark_delete_images(
+            [1000] if quick else [1000, 10000, 100000], 25 if quick else 100, 3 if quick else 10),
+        "startup": lambda server: benchmark_startup(2 if quick else 5),
+    }
+
+    results = {}
+    with FakeRedditServer(["wallpapers"], posts_per_subreddit=300, latency=latency,
+                          image_bytes=256 * 1024) as server:
+        server.write_praw_ini()
+
+        for name, benchmark in benchmarks.items():
+            if names and name not in names:
+                continue
+
+            start_time = time.perf_counter()
+            results[name] = {"results": benchmark(server), "seconds": time.perf_counter() - start_time}
+
+    # Handling the pending events, e.g. the deferred first background changes, before the workspace is removed.
+    application.processEvents()
+    shutil.rmtree(str(workspace), ignore_errors=True)
+
+    return {"schema": 1,
+            "timestamp": time.time(),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "server_latency_seconds": latency,
+            "benchmarks": results}
+
+
+def get_commit():
+    """Returns the git commit of the repository or None if it can not be found."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=str(REPOSITORY_FOLDER), check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
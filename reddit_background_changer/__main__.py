@@ -0,0 +1,166 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from reddit_background_changer.background_changer import BackgroundChanger
+from reddit_background_changer.job_manager import JobManager
+from reddit_background_changer.refresh_scheduler import RefreshScheduler
+from reddit_background_changer.storage import create_storage_setup, load_subreddits
+
+
+def sync(names=None, metrics_path=None):
+    """
+    Gets the images of the subreddits in the subreddit list, only downloading the images that are missing.
+
+    :param names: The names of the subreddits that should be synced or None to sync every subreddit in the list.
+    :param metrics_path: If given the stages of the sync are measured and the measurements are written to this file.
+    :return: The number of subreddits that could not be synced.
+    """
+    # Importing the image getter here since it imports PRAW, which is only needed when images are gotten.
+    from reddit_background_changer.image_getter import ImageGetter
+    from reddit_background_changer.reddit_client import RedditClient
+
+    image_getter = ImageGetter.shared()
+
+    if metrics_path is not None:
+        image_getter.instrumentation.set_enabled(True)
+
+    subreddit_configs = load_subreddits()
+    if names:
+        wanted_names = {name.lower() for name in names}
+        subreddit_configs = [config for config in subreddit_configs if config[0].lower() in wanted_names]
+
+    # Looking up whether the subreddits exist with a single request instead of one request per subreddit.
+    try:
+        RedditClient.shared().prefetch_subreddit_info([config[0] for config in subreddit_configs])
+    except Exception as e:
+        print("Sync: " + str(e))
+
+    failed = 0
+    for subreddit_config in subreddit_configs:
+        try:
+            if image_getter.get_images(tuple(subreddit_config), "../data/images/") is None:
+                failed += 1
+        except Exception as e:
+            print("Sync: " + str(e))
+            failed += 1
+
+    # Waiting for the subreddits that are refilled after images were evicted, which run as jobs of the job manager.
+    JobManager.shared().wait_until_idle()
+
+    print("Sync: the pool uses {pool_bytes} of {budget_bytes} bytes with {images} images, {evictions} images have been "
+          "evicted".format(**image_getter.pool_budget.metrics()))
+
+    if metrics_path is not None:
+        image_getter.instrumentation.export(metrics_path)
+
+    return failed
+
+
+def normalize():
+    """
+    Normalizes the images in the pool that have not been normalized, e.g. the images that were downloaded before the
+    images were normalized after downloading them.
+
+    :return: The number of images that could not be normalized.
+    """
+    # Importing the image getter here since it imports PRAW, which is only needed when images are gotten.
+    from reddit_background_changer.image_getter import ImageGetter
+
+    totals = ImageGetter.shared().normalize_pool()
+
+    print("Normalize: normalized {normalized} images in {seconds:.1f} seconds at {images_per_second:.1f} images/s, "
+          "re-encoded {reencoded} images and reclaimed {reclaimed_bytes} bytes. Removed {corrupt} corrupt images and "
+          "failed to normalize {failed} images".format(**totals))
+
+    return totals["failed"]
+
+
+def change():
+    """
+    Changes the desktop background once to the next image from the rotation scheduler.
+
+    :return: True if the background was changed, false otherwise.
+    """
+    background_changer = BackgroundChanger(start_timer=False, prefetch=False)
+    if background_changer.current_background:
+        print(background_changer.current_background)
+
+    return background_changer.current_background != ""
+
+
+def daemon():
+    """
+    Changes the desktop background according to the change frequency in the settings until the process is stopped. The
+    images of the subreddits are refreshed by the refresh scheduler if scheduled refreshes are enabled in the settings.
+    """
+    # Refreshing in separate daemon threads so changing the background is not delayed by getting images.
+    RefreshScheduler(load_subreddits).start()
+
+    background_changer = BackgroundChanger(start_timer=False)
+    while True:
+        time.sleep(background_changer.change_interval())
+
+        # Changing the background also loads the most recent settings, so a new change frequency is used next time.
+        background_changer.change_background()
+
+
+def run(arguments):
+    """
+    Runs the command line interface with the given arguments. The working directory must be the package folder since
+    the data and resources are found relative to it.
+
+    :param arguments: The command line arguments without the program name.
+    :return: The exit code of the command.
+    """
+    parser = argparse.ArgumentParser(prog="python -m reddit_background_changer",
+                                     description="Changes the desktop background without starting the user interface.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    sync_parser = subparsers.add_parser("sync", help="get the images of the subreddits in the subreddit list")
+    sync_parser.add_argument("names", nargs="*", help="only sync these subreddits")
+    sync_parser.add_argument("--metrics", metavar="PATH", help="measure the stages of the sync and write the "
+                                                              "measurements to the file, in the Prometheus text "
+                                                              "format if the file ends with .prom")
+
+    subparsers.add_parser("normalize", help="verify the images in the pool, fit them to the display and encode them "
+                                            "again with the normalize_quality setting")
+
+    subparsers.add_parser("change", help="change the desktop background once")
+
+    subparsers.add_parser("daemon", help="change the desktop background and refresh the images according to the "
+                                         "settings")
+
+    arguments = parser.parse_args(arguments)
+
+    # Setting up the folder structure and the image catalog before anything reads from them.
+    create_storage_setup()
+
+    if arguments.command == "sync":
+        return 1 if sync(arguments.names, arguments.metrics) else 0
+    elif arguments.command == "normalize":
+        return 1 if normalize() else 0
+    elif arguments.command == "change":
+        return 0 if change() else 1
+    else:
+        try:
+            daemon()
+        except KeyboardInterrupt:
+            return 0
+
+
+def main():
+    # Using the package folder as the working directory since the data and resources are found relative to it.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    sys.exit(run(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+    # Letting the worker processes of the image normalizer run their work when the application is frozen.
+    multiprocessing.freeze_support()
+
+    main()
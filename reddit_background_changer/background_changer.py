@@ -1,46 +1,212 @@
-import ctypes
 import os
-import random
+import pathlib
+import shutil
+import threading
+from collections import deque
 
 from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QImageReader
 
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.instrumentation import Instrumentation, timed
+from reddit_background_changer.rotation_scheduler import RotationScheduler
 from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import BlobStore
+from reddit_background_changer.wallpaper_backend import WallpaperBackend
+
+# The shortest number of minutes between two background changes, which is used if the settings file has a lower change
+# frequency, e.g. 0 after editing it by hand, so the background is not changed in a tight loop.
+MINIMUM_CHANGE_FREQUENCY = 1
 
 
 class BackgroundChanger:
-    def __init__(self):
-        # The filename of the image that is currently the desktop background.
+    """
+    Class for changing the desktop background to the next image from the rotation scheduler on a timer.
+
+    :param start_timer: If false no Qt timer is created, which is used when running without a Qt event loop, e.g. by the
+    command line interface which changes the background on its own schedule.
+    :param prefetch: If false no prefetch thread is started, which is used when the background is only changed once.
+    """
+    def __init__(self, start_timer=True, prefetch=True):
+        # The absolute path to the image that is currently the desktop background.
         self.current_background = ""
 
-        # The path to the folder that contains the images that can be picked as the desktop background.
-        self.image_folder = os.path.abspath("../data/images") + "/"
+        # The catalog of the images that can be picked as the desktop background.
+        self.catalog = ImageCatalog()
+
+        # The scheduler that decides the order in which the images are used as the background.
+        self.rotation_scheduler = RotationScheduler(self.catalog)
+
+        self.settings = Settings.shared()
 
-        self.settings = Settings()
+        # The timers and counters of the stages of changing the background.
+        self.instrumentation = Instrumentation.shared()
+
+        # The platform specific backend that applies the background and records how long it takes.
+        self.backend = WallpaperBackend.shared()
+
+        # The next backgrounds, which are decoded and validated ahead of time by the prefetch thread.
+        self.lookahead = deque()
+        self.lookahead_condition = threading.Condition()
+
+        # Starting the prefetch thread as a daemon thread so it does not keep the application alive when it is closed.
+        if prefetch:
+            self.prefetch_thread = threading.Thread(target=self.prefetch_loop, daemon=True)
+            self.prefetch_thread.start()
 
         # Setting up the timer that changes the background to a random picture according to the time interval.
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.change_background)
-        self.timer.start(self.settings.change_frequency * 60000)
+        self.timer = None
+        if start_timer:
+            self.timer = QTimer()
+            self.timer.timeout.connect(self.change_background)
+            self.timer.start(self.change_interval() * 1000)
+
+        # Changing the background immediately since the application is launched on computer startup. With a timer the
+        # change waits for the event loop to start so it does not delay showing the tray icon.
+        if start_timer:
+            QTimer.singleShot(0, self.change_background)
+        else:
+            self.change_background()
 
-        # Changing the background immediately since the application is launched on computer startup.
-        self.change_background()
+    def change_interval(self):
+        """Returns the number of seconds between two background changes according to the change frequency setting."""
+        return max(self.settings.change_frequency, MINIMUM_CHANGE_FREQUENCY) * 60
 
+    def update_frequency(self):
+        """Restarts the timer with the new change frequency if it was changed in the settings."""
+        if self.timer is not None and self.timer.interval() != self.change_interval() * 1000:
+            self.timer.start(self.change_interval() * 1000)
+
+    @timed("change_background")
     def change_background(self):
-        """Changes the background of the desktop to a random image from the self.image_dict folder."""
-        # Loading the most recent settings.
+        """
+        Changes the background of the desktop to the next image in the lookahead queue. If the prefetch thread has not
+        validated any images yet then the next image from the rotation scheduler is used instead.
+        """
+        # Loading the most recent settings, which only reads the settings file if it has changed.
         self.settings.load_settings()
 
         # Wrapping in a try-except to handle invalid/broken images and the case where there are no images in the folder.
         try:
-            # Choosing a random image from the folder containing all possible backgrounds.
-            background_name = random.choice(os.listdir(self.image_folder))
+            with self.instrumentation.timer("change_background.next"):
+                background_path = self.next_background()
+            if background_path is None:
+                raise LookupError("there are no images in the image catalog")
 
             # Setting the new desktop background image to the chosen image.
-            ctypes.windll.user32.SystemParametersInfoW(20, 0, self.image_folder + background_name, 0)
+            with self.instrumentation.timer("change_background.apply"):
+                self.backend.apply(background_path)
+
+            self.current_background = background_path
 
-            self.current_background = background_name
+            # Recording that the image was shown, which the eviction policy of the pool budget is based on.
+            self.catalog.record_shown(background_path)
 
             # Restarting the timer.
-            self.timer.start(self.settings.change_frequency * 60000)
+            if self.timer is not None:
+                self.timer.start(self.change_interval() * 1000)
         except Exception as e:
             print("Background changer: " + str(e))
+            self.instrumentation.count("change_background.errors")
+
+    def next_background(self):
+        """
+        Takes the next background from the lookahead queue and wakes up the prefetch thread so it can validate a new
+        background. Backgrounds that were removed from the pool after they were validated are skipped.
+
+        :return: The path to the next background or None if there are no images in the image catalog.
+        """
+        with self.lookahead_condition:
+            while self.lookahead:
+                background_path = self.lookahead.popleft()
+                self.lookahead_condition.notify()
+
+                if self.catalog.contains_path(background_path):
+                    return background_path
+
+        # Falling back to the next image from the rotation scheduler without validating it if the lookahead queue is
+        # empty.
+        return self.rotation_scheduler.pop()
+
+    def prefetch_loop(self):
+        """
+        Continuously fills the lookahead queue with the next images from the rotation scheduler that have been fully
+        decoded and validated. Images that can not be decoded are moved to the quarantine folder and removed from the
+        catalog.
+        """
+        while True:
+            # Waiting until there is room in the lookahead queue.
+            with self.lookahead_condition:
+                while len(self.lookahead) >= self.settings.lookahead_size:
+                    self.lookahead_condition.wait()
+
+            background_path = self.rotation_scheduler.pop()
+
+            # Waiting for images to be added if the catalog is empty.
+            if background_path is None:
+                with self.lookahead_condition:
+                    self.lookahead_condition.wait(timeout=60)
+                continue
+
+            with self.instrumentation.timer("change_background.validate"):
+                valid = self.validate_image(background_path)
+
+            if valid:
+                with self.lookahead_condition:
+                    self.lookahead.append(background_path)
+            else:
+                self.quarantine_image(background_path)
+                self.instrumentation.count("change_background.quarantined")
+
+    @staticmethod
+    def validate_image(path):
+        """
+        Checks that the image at the given path can be fully decoded. JPEG images are also checked for the end of image
+        marker since truncated JPEG images can often still be decoded.
+
+        :param path: The path to the image that should be validated.
+        :return: True if the image is valid, false otherwise.
+        """
+        if QImageReader(path).read().isNull():
+            return False
+
+        try:
+            with open(path, "rb") as image_file:
+                data = image_file.read()
+        except OSError:
+            return False
+
+        # The end of image marker must come after the last start of scan marker, since the scan is what gets cut off.
+        # Searching from there instead of only looking at the last bytes allows padding or metadata after the marker.
+        if data.startswith(b"\xff\xd8"):
+            start_of_scan = data.rfind(b"\xff\xda")
+            return start_of_scan >= 0 and b"\xff\xd9" in data[start_of_scan:]
+
+        return True
+
+    def quarantine_image(self, path, quarantine_folder="../data/quarantine"):
+        """
+        Copies the broken image at the given path to the quarantine folder and removes it from the pool. The images
+        that link to the same blob have the same broken content, so they are removed from the pool as well, and the
+        blob is deleted once no image links to it.
+        """
+        print("Background changer: quarantining broken image " + path)
+
+        try:
+            pathlib.Path(quarantine_folder).mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, os.path.join(quarantine_folder, os.path.basename(path)))
+        except OSError as e:
+            print("Background changer: " + str(e))
+
+        image = self.catalog.get_image(path)
+        digest = image["digest"] if image is not None else None
+
+        paths = [os.path.abspath(path)]
+        if digest is not None:
+            paths += [other["path"] for other in self.catalog.images_with_digest(digest) if other["path"] not in paths]
+
+        self.catalog.remove_images(paths)
+        for image_path in paths:
+            BlobStore.shared().remove(image_path, digest)
+            HashIndex.shared().remove(image_path)
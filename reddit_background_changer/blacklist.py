@@ -0,0 +1,111 @@
+import os
+import threading
+
+from reddit_background_changer.image_catalog import parse_image_filename
+from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import write_file_atomically
+
+
+class Blacklist:
+    """
+    Class for the blacklist of submissions whose images should never be used as a desktop background. The blacklist
+    is kept in a set of submission fullnames so checking a submission is a constant time lookup.
+
+    The blacklist is persisted in its own append-only file with one fullname per line, which means that blacklisting
+    an image only appends a single line instead of rewriting the whole file. Lines that are no longer needed are
+    removed by compacting the file.
+    """
+    # The instance that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, path="../data/blacklist.txt"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.fullnames = set()
+
+        # The number of lines in the file, which can be larger than the number of fullnames before compaction.
+        self.line_count = 0
+
+        self.load()
+
+        # Compacting the file when more than half of its lines are duplicates.
+        if self.line_count > 2 * len(self.fullnames):
+            self.compact()
+
+    @classmethod
+    def shared(cls):
+        """
+        Returns the blacklist that is shared by the whole application, creating it the first time. When the blacklist
+        is created the old blacklist in the settings file is migrated into it.
+        """
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+                cls.shared_instance.migrate(Settings.shared())
+
+            return cls.shared_instance
+
+    def __contains__(self, fullname):
+        return fullname in self.fullnames
+
+    def __len__(self):
+        return len(self.fullnames)
+
+    def load(self):
+        """Loading the fullnames from the blacklist file if it exists."""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r") as blacklist_file:
+            for line in blacklist_file:
+                self.line_count += 1
+
+                fullname = line.strip()
+                if fullname:
+                    self.fullnames.add(fullname)
+
+    def add(self, fullname):
+        """Adds the submission with the given fullname to the blacklist."""
+        self.add_many([fullname])
+
+    def add_many(self, fullnames):
+        """
+        Adds the submissions with the given fullnames to the blacklist. All fullnames are appended to the file in a
+        single write.
+
+        :param fullnames: The fullnames of the submissions, e.g. "t3_abc123".
+        """
+        with self.lock:
+            new_fullnames = [fullname for fullname in dict.fromkeys(fullnames) if fullname not in self.fullnames]
+            if not new_fullnames:
+                return
+
+            with open(self.path, "a") as blacklist_file:
+                blacklist_file.write("".join(fullname + "\n" for fullname in new_fullnames))
+
+            self.fullnames.update(new_fullnames)
+            self.line_count += len(new_fullnames)
+
+    def compact(self):
+        """Rewrites the blacklist file so it contains every fullname exactly once."""
+        with self.lock:
+            write_file_atomically(self.path, "".join(fullname + "\n" for fullname in sorted(self.fullnames)).encode())
+            self.line_count = len(self.fullnames)
+
+    def migrate(self, settings):
+        """
+        Moves the blacklist from the settings file into the blacklist file. The old blacklist contains the filenames
+        of the images, so the submission fullname is parsed from each filename.
+
+        :param settings: The settings that might contain the old blacklist.
+        """
+        if not settings.blacklist:
+            return
+
+        fullnames = [parse_image_filename(filename)[1] for filename in settings.blacklist]
+        self.add_many([fullname for fullname in fullnames if fullname is not None])
+
+        settings.blacklist = []
+        settings.save_settings()
@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage
+
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import BlobStore
+
+
+def difference_hash(image):
+    """
+    Computes the 64 bit difference hash (dHash) of the given image. The image is reduced to 9x8 grayscale pixels and
+    each bit of the hash tells whether a pixel is brighter than its left neighbour. Near identical images, including
+    the same image in a different resolution, have hashes that only differ in a few bits.
+
+    :param image: The image as a QImage.
+    :return: The hash as an integer.
+    """
+    if image.isNull():
+        raise ValueError("the image could not be decoded")
+
+    # Scaling before converting since the smooth scaling converts the image to a 32 bit format.
+    small_image = image.scaled(9, 8, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    small_image = small_image.convertToFormat(QImage.Format_Grayscale8)
+
+    # The rows of the image are padded so we read the full rows and cut away the padding.
+    pixels = np.frombuffer(small_image.constBits().asstring(small_image.sizeInBytes()), dtype=np.uint8)
+    pixels = pixels.reshape(8, small_image.bytesPerLine())[:, :9].astype(np.int16)
+
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int(np.packbits(bits.flatten()).view(">u8")[0])
+
+
+def hash_image_data(data):
+    """Computes the difference hash of an encoded image, e.g. a downloaded thumbnail."""
+    return difference_hash(QImage.fromData(data))
+
+
+def hash_image_file(path):
+    """Computes the difference hash of the image file at the given path."""
+    return difference_hash(QImage(path))
+
+
+class HashIndex:
+    """
+    Class for the index of the perceptual hashes of the images in the background image pool. The hashes are kept in
+    a NumPy array so a new hash is compared against every hash in the pool in a single vectorized pass.
+
+    The index of the pool is shared by the whole application through HashIndex.shared(), so every part of the
+    application that removes images from the pool also removes their hashes.
+    """
+    # The index of the pool that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, capacity=1024):
+        self.lock = threading.Lock()
+
+        self.hashes = np.zeros(capacity, dtype=np.uint64)
+        self.paths = []
+
+        # Mapping from the path of an image to the position of its hash in the array.
+        self.positions = {}
+
+    @classmethod
+    def shared(cls):
+        """Returns the index of the pool that is shared by the whole application, building it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls.from_catalog(ImageCatalog())
+
+            return cls.shared_instance
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, image_hash, path):
+        """Adds the hash of the image with the given path to the index."""
+        with self.lock:
+            if path in self.positions:
+                self.hashes[self.positions[path]] = image_hash
+                return
+
+            # Doubling the size of the array when it is full so adding is amortized constant time.
+            if len(self.paths) == len(self.hashes):
+                self.hashes = np.concatenate([self.hashes, np.zeros(len(self.hashes), dtype=np.uint64)])
+
+            self.positions[path] = len(self.paths)
+            self.hashes[len(self.paths)] = image_hash
+            self.paths.append(path)
+
+    def remove(self, path):
+        """Removes the hash of the image with the given path by moving the last hash into its position."""
+        with self.lock:
+            position = self.positions.pop(path, None)
+            if position is None:
+                return
+
+            last_path = self.paths.pop()
+            if last_path != path:
+                self.hashes[position] = self.hashes[len(self.paths)]
+                self.paths[position] = last_path
+                self.positions[last_path] = position
+
+    def find_near_duplicate(self, image_hash, max_distance):
+        """
+        Finds an image in the index whose hash is within the given Hamming distance of the given hash.
+
+        :param image_hash: The hash that we wish to find a near duplicate of.
+        :param max_distance: The largest number of differing bits for two images to be considered duplicates.
+        :return: The path to the closest near duplicate or None if there is no near duplicate.
+        """
+        with self.lock:
+            if not self.paths:
+                return None
+
+            differences = np.bitwise_xor(self.hashes[:len(self.paths)], np.uint64(image_hash))
+            distances = np.unpackbits(differences.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+            closest = int(np.argmin(distances))
+            return self.paths[closest] if distances[closest] <= max_distance else None
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Creates an index containing every hash that is saved in the given catalog."""
+        index = cls()
+        for path, image_hash in catalog.perceptual_hashes():
+            index.add(image_hash, path)
+
+        return index
+
+
+def deduplicate_pool(catalog, max_distance):
+    """
+    Deletes the near duplicates from the existing background image pool. Images without a saved hash are hashed
+    first, then the images are gone through in the order they were downloaded and every image that is a near duplicate
+    of an earlier image is deleted.
+
+    :param catalog: The catalog of the background image pool.
+    :param max_distance: The largest number of differing bits for two images to be considered duplicates.
+    :return: A tuple with the number of deleted images and the number of reclaimed bytes.
+    """
+    index = HashIndex()
+    deleted_images = 0
+    reclaimed_bytes = 0
+
+    for image in catalog.images_by_download_time():
+        image_hash = image["phash"]
+        if image_hash is None:
+            try:
+                image_hash = hash_image_file(image["path"])
+                catalog.set_perceptual_hash(image["path"], image_hash)
+            except ValueError as e:
+                print("Deduplication: " + image["path"] + " " + str(e))
+                continue
+
+        if index.find_near_duplicate(image_hash, max_distance) is None:
+            index.add(image_hash, image["path"])
+            continue
+
+        BlobStore.shared().remove(image["path"], image["digest"])
+        catalog.remove_image(image["path"])
+
+        deleted_images += 1
+        reclaimed_bytes += image["size"] or 0
+
+    return deleted_images, reclaimed_bytes
+
+
+if __name__ == '__main__':
+    # Running the module directly removes the near duplicates from the existing background image pool.
+    print("Deduplication: deleted {} images and reclaimed {} bytes".format(
+        *deduplicate_pool(ImageCatalog(), Settings.shared().dedup_distance)))
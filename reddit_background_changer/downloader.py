@@ -0,0 +1,229 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from reddit_background_changer.instrumentation import Instrumentation
+
+
+class DownloadBatch:
+    """
+    Class that keeps track of the downloads that belong to a single subreddit. The batch is used by the producer to
+    know how many of the submitted downloads succeeded and to wait until every submitted download is finished.
+    """
+    def __init__(self, name, total, progress_callback=None):
+        self.name = name
+        self.total = total
+        self.progress_callback = progress_callback
+
+        self.submitted = 0
+        self.downloaded = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+
+        # The downloads of a cancelled batch that have not started yet are skipped.
+        self.cancelled = False
+
+        # Condition used to wake up the producer when a download in the batch is finished.
+        self.condition = threading.Condition()
+
+    def pending(self):
+        """Returns the number of submitted downloads that are not finished yet."""
+        return self.submitted - self.downloaded - self.failed
+
+    def add_submitted(self):
+        """Registers that one more download was submitted to the pipeline."""
+        with self.condition:
+            self.submitted += 1
+
+    def add_result(self, success, size):
+        """
+        Registers the result of a single download and reports the progress of the batch.
+
+        :param success: True if the download succeeded, false otherwise.
+        :param size: The number of bytes that were written to disk.
+        """
+        with self.condition:
+            if success:
+                self.downloaded += 1
+                self.bytes_downloaded += size
+            else:
+                self.failed += 1
+
+            downloaded = self.downloaded
+            self.condition.notify_all()
+
+        if self.progress_callback is not None:
+            self.progress_callback(self.name, downloaded, self.total)
+
+    def cancel(self):
+        """Cancels the downloads of the batch that have not started yet, which are then registered as failed."""
+        self.cancelled = True
+
+    def wait(self):
+        """Blocks until every download that was submitted to the batch is finished."""
+        with self.condition:
+            while self.pending() > 0:
+                self.condition.wait()
+
+
+class DownloadPipeline:
+    """
+    Class for downloading images with a pool of worker threads. The workers take downloads from a bounded queue that is
+    filled by the listing producer, which means that the producer is slowed down when the workers can not keep up.
+
+    All workers share a single keep-alive HTTP session so connections to the reddit media servers are reused between
+    downloads instead of creating a new connection for each file. Each file is written to a temporary file that is only
+    moved into place once it is complete, either into the given blob store or directly to the requested path.
+    """
+    def __init__(self, worker_count=4, queue_size=None, chunk_size=64 * 1024, timeout=30, blob_store=None):
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.blob_store = blob_store
+        self.instrumentation = Instrumentation.shared()
+
+        # Setting up the shared session with a connection pool that is large enough for every worker.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=worker_count, pool_maxsize=worker_count)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.queue = queue.Queue(maxsize=queue_size or worker_count * 2)
+
+        # Starting the workers as daemon threads so they do not keep the application alive when it is closed.
+        self.workers = []
+        for _ in range(worker_count):
+            worker = threading.Thread(target=self.download_loop, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    @staticmethod
+    def start_batch(name, total, progress_callback=None):
+        """
+        Creates a new batch that downloads can be submitted to.
+
+        :param name: The name of the subreddit the batch belongs to.
+        :param total: The number of images that we wish to download in the batch.
+        :param progress_callback: Function called with (name, downloaded, total) each time a download is finished.
+        :return: The new batch.
+        """
+        return DownloadBatch(name, total, progress_callback)
+
+    def submit(self, batch, url, path, on_success=None):
+        """
+        Adds a download to the queue. Blocks if the queue is full until a worker is ready to take the download.
+
+        :param batch: The batch that the download belongs to.
+        :param url: The url of the file that should be downloaded.
+        :param path: The path that the file should be saved to, or None to download the file into memory.
+        :param on_success: Function called with the number of downloaded bytes and the SHA-256 digest of the file when
+        the download succeeded, or with the content of the file if it was downloaded into memory.
+        """
+        batch.add_submitted()
+        self.queue.put((batch, url, path, on_success))
+
+    def fetch_many(self, urls):
+        """
+        Downloads the small files at the given urls into memory with the workers of the pipeline, e.g. the thumbnails
+        of the next submissions, so the files are downloaded concurrently instead of one at a time by the caller.
+
+        :param urls: The urls of the files that should be downloaded.
+        :return: A list with the content of each file as bytes, where the files that failed to download are None.
+        """
+        contents = [None] * len(urls)
+        batch = self.start_batch("fetch", len(urls))
+
+        for position, url in enumerate(urls):
+            self.submit(batch, url, None, partial(contents.__setitem__, position))
+        batch.wait()
+
+        return contents
+
+    def fetch(self, url):
+        """
+        Downloads the small file at the given url into memory using the shared session, e.g. a thumbnail.
+
+        :param url: The url of the file that should be downloaded.
+        :return: The content of the file as bytes.
+        """
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def download_loop(self):
+        """Continuously takes downloads from the queue and registers the result in the corresponding batch."""
+        while True:
+            batch, url, path, on_success = self.queue.get()
+
+            # Skipping the download if its batch was cancelled while it was waiting in the queue.
+            if batch.cancelled:
+                batch.add_result(False, 0)
+                self.queue.task_done()
+                continue
+
+            try:
+                if path is None:
+                    with self.instrumentation.timer("get_images.fetch"):
+                        content = self.fetch(url)
+                    size, result = len(content), (content,)
+                else:
+                    with self.instrumentation.timer("get_images.download"):
+                        size, digest = self.download(url, path)
+                    result = (size, digest)
+
+                if on_success is not None:
+                    on_success(*result)
+                batch.add_result(True, size)
+            except Exception as e:
+                print("Image downloader: " + str(e))
+                if path is None:
+                    self.instrumentation.count("get_images.failed_fetches")
+                else:
+                    self.instrumentation.count("get_images.failed_downloads")
+                batch.add_result(False, 0)
+            finally:
+                self.queue.task_done()
+
+    def download(self, url, path):
+        """
+        Downloads the file at the given url and streams it to a temporary file in chunks. Once the download is complete
+        the temporary file is added to the blob store, or moved to the path if the pipeline has no blob store. If the
+        download fails then the temporary file is removed again, so no partially written file is left at the path.
+
+        :param url: The url of the file that should be downloaded.
+        :param path: The path that the file should be saved to.
+        :return: A tuple with the number of bytes that were written to disk and the SHA-256 digest of the file.
+        """
+        if self.blob_store is not None:
+            file_descriptor, temporary_path = self.blob_store.temporary_file()
+        else:
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                                               suffix=".tmp")
+
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+
+                    for chunk in response.iter_content(self.chunk_size):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+            if self.blob_store is not None:
+                self.blob_store.add(temporary_path, digest.hexdigest(), path)
+            else:
+                os.replace(temporary_path, path)
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        return size, digest.hexdigest()
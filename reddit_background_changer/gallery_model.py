@@ -0,0 +1,154 @@
+from collections import OrderedDict
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+
+class GalleryModel(QtCore.QAbstractListModel):
+    """
+    Class for the list model of the images in the background image pool that is shown in the gallery. The images are
+    read from the image catalog a page at a time through canFetchMore() and fetchMore(), so the gallery opens right
+    away no matter how many images are in the pool, and the next page is only read when the view is scrolled to the end.
+
+    The thumbnails are only requested when the view asks for the decoration of a row, i.e. when the row is visible, and
+    are loaded by the worker threads of the thumbnail cache. The loaded thumbnails are kept as pixmaps in a bounded
+    least recently used cache.
+
+    :param catalog: The image catalog that the images are read from.
+    :param thumbnail_cache: The thumbnail cache that loads the thumbnails.
+    :param page_size: The number of images that are read from the catalog at a time.
+    :param pixmap_capacity: The largest number of thumbnails that are kept as pixmaps.
+    """
+    # Emitted from the worker threads of the thumbnail cache with (path, thumbnail), which delivers the thumbnail to
+    # the GUI thread since pixmaps can only be created there.
+    thumbnailLoaded = pyqtSignal(str, QImage)
+
+    def __init__(self, catalog, thumbnail_cache, page_size=200, pixmap_capacity=512, *args, **kwargs):
+        super(GalleryModel, self).__init__(*args, **kwargs)
+        self.catalog = catalog
+        self.thumbnail_cache = thumbnail_cache
+        self.page_size = page_size
+        self.pixmap_capacity = pixmap_capacity
+
+        # The catalog entries of the images that have been read so far, ordered by id.
+        self.images = []
+
+        # Mapping from the path of each image to its row, so a loaded thumbnail can be shown in its row.
+        self.rows = {}
+
+        # Whether every page of the catalog has been read.
+        self.exhausted = False
+
+        # Mapping from the path of each image to its scaled pixmap, ordered from least to most recently used.
+        self.pixmaps = OrderedDict()
+
+        # The paths of the images whose thumbnails have been requested but not loaded yet.
+        self.requested = set()
+
+        self.thumbnailLoaded.connect(self.show_thumbnail)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """Returns the number of images that have been read from the catalog so far."""
+        return 0 if parent.isValid() else len(self.images)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        """Returns true if there may be more images in the catalog than have been read so far."""
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        """Reads the next page of images from the catalog and inserts them at the end of the model."""
+        if parent.isValid():
+            return
+
+        after_id = self.images[-1]["id"] if self.images else 0
+        page = self.catalog.image_page(after_id, self.page_size)
+
+        if len(page) < self.page_size:
+            self.exhausted = True
+
+        if not page:
+            return
+
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.images), len(self.images) + len(page) - 1)
+        for image in page:
+            self.rows[image["path"]] = len(self.images)
+            self.images.append(image)
+        self.endInsertRows()
+
+    def data(self, QModelIndex, role=None):
+        """
+        Returns the data stored under the given role for the image referred to by the index.
+
+        :param QModelIndex: The specific index of the model that we wish to extract data for.
+        :param role: The specific data that we wish to extract.
+        :return: The subreddit of the image for DisplayRole, a description of the image for ToolTipRole and the
+        thumbnail for DecorationRole, which is None until the thumbnail has been loaded.
+        """
+        image = self.images[QModelIndex.row()]
+
+        if role == Qt.DisplayRole:
+            return "/r/" + image["subreddit"]
+
+        if role == Qt.ToolTipRole:
+            return "/r/{} {}\n{}x{}, {} KB".format(image["subreddit"], image["fullname"], image["width"],
+                                                  image["height"], (image["size"] or 0) // 1024)
+
+        if role == Qt.DecorationRole:
+            path = image["path"]
+
+            pixmap = self.pixmaps.get(path)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(path)
+                return pixmap
+
+            # Requesting the thumbnail of the visible row, which is shown once it is loaded by a worker.
+            if path not in self.requested:
+                self.requested.add(path)
+                self.thumbnail_cache.request(path, self.thumbnailLoaded.emit)
+
+    def show_thumbnail(self, path, thumbnail):
+        """Caches a loaded thumbnail as a pixmap and shows it in the row of its image if the row still exists."""
+        self.requested.discard(path)
+
+        # A thumbnail that was dropped by the thumbnail cache is requested again if its row is painted again.
+        if thumbnail.isNull():
+            return
+
+        self.pixmaps[path] = QPixmap.fromImage(thumbnail)
+
+        # Evicting the least recently used thumbnails when the cache is full.
+        while len(self.pixmaps) > self.pixmap_capacity:
+            self.pixmaps.popitem(last=False)
+
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def remove_rows(self, rows):
+        """
+        Removes the images in the given rows from the model, removing each run of consecutive rows at once.
+
+        :param rows: The rows of the images that should be removed.
+        :return: The catalog entries of the removed images.
+        """
+        removed_images = []
+
+        # Removing from the end so the rows that have not been removed yet keep their position.
+        rows = sorted(set(rows), reverse=True)
+        while rows:
+            last = first = rows.pop(0)
+            while rows and rows[0] == first - 1:
+                first = rows.pop(0)
+
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            removed_images += self.images[first:last + 1]
+            del self.images[first:last + 1]
+            self.endRemoveRows()
+
+        for image in removed_images:
+            self.pixmaps.pop(image["path"], None)
+
+        self.rows = {image["path"]: row for row, image in enumerate(self.images)}
+        return removed_images
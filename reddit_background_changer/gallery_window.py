@@ -0,0 +1,81 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QSize
+
+from reddit_background_changer.gallery_model import GalleryModel
+from reddit_background_changer.job_manager import USER_PRIORITY
+from reddit_background_changer.thumbnail_cache import ThumbnailCache
+
+
+class GalleryWindow(QtWidgets.QWidget):
+    """
+    Class for the window that shows the images in the background image pool as a grid of thumbnails. Several images
+    can be selected and blacklisted or deleted at once, which removes them from the gallery right away while the files
+    are removed by a job of the job manager.
+
+    :param image_getter: The shared image getter that the images are removed through.
+    :param job_manager: The shared job manager that removes the images.
+    """
+    def __init__(self, image_getter, job_manager, *args, **kwargs):
+        super(GalleryWindow, self).__init__(*args, **kwargs)
+        self.setWindowTitle("Gallery")
+        self.resize(900, 600)
+
+        self.image_getter = image_getter
+        self.job_manager = job_manager
+
+        self.thumbnail_cache = ThumbnailCache()
+        self.model = GalleryModel(image_getter.catalog, self.thumbnail_cache, parent=self)
+
+        # Showing the thumbnails in a grid. Every item has the same size, so the view does not have to ask the model
+        # for the size of each row, and only the visible rows are painted.
+        thumbnail_size = self.thumbnail_cache.thumbnail_size
+        self.imageView = QtWidgets.QListView()
+        self.imageView.setViewMode(QtWidgets.QListView.IconMode)
+        self.imageView.setResizeMode(QtWidgets.QListView.Adjust)
+        self.imageView.setMovement(QtWidgets.QListView.Static)
+        self.imageView.setUniformItemSizes(True)
+        self.imageView.setIconSize(QSize(thumbnail_size, thumbnail_size))
+        self.imageView.setGridSize(QSize(thumbnail_size + 20, thumbnail_size + 40))
+        self.imageView.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.imageView.setModel(self.model)
+
+        self.blacklistButton = QtWidgets.QPushButton("Blacklist")
+        self.blacklistButton.setToolTip("Remove the selected images and never download them again")
+        self.blacklistButton.clicked.connect(lambda: self.remove_selected(blacklist=True))
+
+        self.deleteButton = QtWidgets.QPushButton("Delete")
+        self.deleteButton.setToolTip("Remove the selected images, which can be downloaded again by a refresh")
+        self.deleteButton.clicked.connect(lambda: self.remove_selected(blacklist=False))
+
+        button_layout = QtWidgets.QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(self.blacklistButton)
+        button_layout.addWidget(self.deleteButton)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.imageView)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def remove_selected(self, blacklist):
+        """
+        Removes the selected images from the gallery and submits a job that removes them from the pool. The job removes
+        every selected image from the catalog in one transaction and blacklists them in one write.
+
+        :param blacklist: If true the submissions of the images are blacklisted so they are never downloaded again.
+        """
+        rows = [index.row() for index in self.imageView.selectionModel().selectedIndexes()]
+        if not rows:
+            return
+
+        paths = tuple(image["path"] for image in self.model.remove_rows(rows))
+        self.job_manager.submit("gallery", self.remove_images, paths, blacklist, priority=USER_PRIORITY)
+
+    def remove_images(self, paths, blacklist):
+        """Removes the thumbnails and then the images with the given paths, which is run by the job manager."""
+        # Removing the thumbnails first since they are found through the identity of the image files.
+        for path in paths:
+            self.thumbnail_cache.remove(path)
+
+        removed = self.image_getter.remove_images(paths, blacklist)
+        print("Gallery: {} {} images".format("blacklisted" if blacklist else "deleted", removed))
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+
+
+class IconCache:
+    """
+    Class for caching the subreddit icons that are shown in the list of subreddits. The index from subreddit name to
+    icon file is built from the image catalog the first time an icon is painted and the decoded icons are kept as
+    pre-scaled pixmaps in a bounded least recently used cache, which means that painting a row does not touch the disk
+    once the icon has been loaded.
+    """
+    def __init__(self, catalog, icon_size=25, capacity=256):
+        self.icon_size = icon_size
+        self.capacity = capacity
+
+        # The icons are invalidated from the worker threads getting images while the GUI thread paints them.
+        self.lock = threading.Lock()
+
+        self.catalog = catalog
+
+        # Mapping from the lowercase subreddit name to the path of its icon, built when the first icon is painted so
+        # nothing is loaded until the list of subreddits is visible.
+        self.index = None
+
+        # Mapping from the lowercase subreddit name to the scaled pixmap, ordered from least to most recently used.
+        self.pixmaps = OrderedDict()
+
+        # Mapping from the lowercase subreddit name to the number of times its icon has been invalidated, so an icon
+        # that was loaded from the old file while the icon was changed is not stored in the cache.
+        self.generations = {}
+
+    def icon(self, subreddit_name):
+        """
+        Returns the scaled icon of the given subreddit. Must be called from the GUI thread since it creates pixmaps.
+
+        :param subreddit_name: The name of the subreddit that we want the icon of.
+        :return: The scaled icon as a QPixmap or None if the subreddit has no icon yet.
+        """
+        key = subreddit_name.lower()
+
+        with self.lock:
+            pixmap = self.pixmaps.get(key)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(key)
+                return pixmap
+
+            if self.index is None:
+                self.index = {subreddit.lower(): path for subreddit, path in self.catalog.icons()}
+
+            path = self.index.get(key)
+            generation = self.generations.get(key, 0)
+
+        if path is None:
+            return None
+
+        pixmap = QPixmap(path).scaled(self.icon_size, self.icon_size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+        with self.lock:
+            # Returning the icon without storing it if the icon was changed or deleted while it was loaded.
+            if self.generations.get(key, 0) != generation:
+                return pixmap
+
+            self.pixmaps[key] = pixmap
+
+            # Evicting the least recently used icons when the cache is full.
+            while len(self.pixmaps) > self.capacity:
+                self.pixmaps.popitem(last=False)
+
+        return pixmap
+
+    def invalidate(self, subreddit_name, path=None):
+        """
+        Removes the cached icon of the given subreddit so it is loaded again the next time it is painted.
+
+        :param subreddit_name: The name of the subreddit whose icon was changed or deleted.
+        :param path: The path to the new icon or None if the icon was deleted.
+        """
+        key = subreddit_name.lower()
+
+        with self.lock:
+            self.pixmaps.pop(key, None)
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+            # The index is built from the catalog with the new icon if it has not been built yet.
+            if self.index is None:
+                return
+
+            if path is None:
+                self.index.pop(key, None)
+            else:
+                self.index[key] = path
@@ -0,0 +1,512 @@
+import os
+import random
+import sqlite3
+import struct
+import threading
+import time
+
+# The number of random ids that are tried when picking a random image before skipping a random number of rows instead.
+RANDOM_ID_ATTEMPTS = 8
+
+
+class ImageCatalog:
+    """
+    Class for the persistent catalog of the images in the background image pool and the subreddit icons. The catalog
+    is stored in a SQLite database so every lookup, like picking a random image or finding the images of a subreddit,
+    goes through an index instead of scanning the image folder.
+
+    Each image is saved with the subreddit it came from, the fullname of the submission, the path to the file, the
+    dimensions of the image, its size in bytes and the time it was downloaded.
+    """
+    def __init__(self, database_path="../data/catalog.db"):
+        # The connection is shared between the GUI thread and the worker threads, so access is guarded by a lock.
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+        with self.lock, self.connection:
+            # Write-ahead logging lets the background changer read while a worker is adding images.
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS images (
+                    id INTEGER PRIMARY KEY,
+                    subreddit TEXT NOT NULL COLLATE NOCASE,
+                    fullname TEXT NOT NULL,
+                    path TEXT NOT NULL UNIQUE,
+                    width INTEGER,
+                    height INTEGER,
+                    size INTEGER,
+                    downloaded_at REAL,
+                    phash INTEGER,
+                    digest TEXT,
+                    last_shown REAL,
+                    times_shown INTEGER NOT NULL DEFAULT 0,
+                    normalized INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS images_subreddit_fullname ON images (subreddit, fullname);
+                CREATE INDEX IF NOT EXISTS images_fullname ON images (fullname);
+
+                CREATE TABLE IF NOT EXISTS icons (
+                    subreddit TEXT PRIMARY KEY COLLATE NOCASE,
+                    path TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS refreshes (
+                    id INTEGER PRIMARY KEY,
+                    subreddit TEXT NOT NULL COLLATE NOCASE,
+                    refreshed_at REAL NOT NULL,
+                    images_downloaded INTEGER NOT NULL,
+                    bytes_downloaded INTEGER NOT NULL,
+                    estimated_source_bytes INTEGER NOT NULL,
+                    disk_bytes INTEGER NOT NULL
+                );
+            """)
+
+            # Adding the perceptual hash column to catalogs that were created before it existed.
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(images)")]
+            if "phash" not in columns:
+                self.connection.execute("ALTER TABLE images ADD COLUMN phash INTEGER")
+
+            # Adding the content digest column to catalogs that were created before the images were stored as blobs.
+            if "digest" not in columns:
+                self.connection.execute("ALTER TABLE images ADD COLUMN digest TEXT")
+
+            # Adding the usage columns to catalogs that were created before the pool had a byte budget.
+            if "last_shown" not in columns:
+                self.connection.execute("ALTER TABLE images ADD COLUMN last_shown REAL")
+                self.connection.execute("ALTER TABLE images ADD COLUMN times_shown INTEGER NOT NULL DEFAULT 0")
+
+            # Adding the normalization flag to catalogs that were created before the images were normalized.
+            if "normalized" not in columns:
+                self.connection.execute("ALTER TABLE images ADD COLUMN normalized INTEGER NOT NULL DEFAULT 0")
+
+    def add_image(self, subreddit, fullname, path, width=None, height=None, size=None, downloaded_at=None,
+                  phash=None, digest=None):
+        """
+        Adds an image to the catalog. If the image is already in the catalog then the existing entry is replaced.
+
+        :param subreddit: The name of the subreddit the image came from.
+        :param fullname: The fullname of the submission the image came from, e.g. "t3_abc123".
+        :param path: The path to the image file.
+        :param width: The width of the image in pixels.
+        :param height: The height of the image in pixels.
+        :param size: The size of the image file in bytes.
+        :param downloaded_at: The unix time the image was downloaded, defaults to now.
+        :param phash: The 64 bit perceptual hash of the image.
+        :param digest: The SHA-256 digest of the blob that the image file links to.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO images (subreddit, fullname, path, width, height, size, downloaded_at, phash, "
+                "digest) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (subreddit, fullname, os.path.abspath(path), width, height, size, downloaded_at or time.time(),
+                 to_signed_hash(phash), digest))
+
+    def remove_image(self, path):
+        """Removes the image with the given path from the catalog."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM images WHERE path = ?", (os.path.abspath(path),))
+
+    def remove_subreddit(self, subreddit):
+        """
+        Removes every image from the given subreddit from the catalog.
+
+        :param subreddit: The name of the subreddit, matched case-insensitively.
+        :return: A list of (path, digest) tuples for the removed images.
+        """
+        with self.lock, self.connection:
+            images = [(row["path"], row["digest"]) for row in
+                      self.connection.execute("SELECT path, digest FROM images WHERE subreddit = ?", (subreddit,))]
+            self.connection.execute("DELETE FROM images WHERE subreddit = ?", (subreddit,))
+
+        return images
+
+    def remove_images(self, paths):
+        """
+        Removes the images with the given paths from the catalog in a single transaction.
+
+        :param paths: The paths to the image files.
+        :return: The catalog entries of the removed images.
+        """
+        paths = [os.path.abspath(path) for path in paths]
+
+        with self.lock, self.connection:
+            images = []
+            # Looking up the images in chunks since SQLite limits the number of parameters of a statement.
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                images += self.connection.execute("SELECT * FROM images WHERE path IN ({})".format(
+                    ", ".join("?" * len(chunk))), chunk).fetchall()
+
+            self.connection.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in paths])
+
+        return images
+
+    def image_page(self, after_id=0, limit=200):
+        """
+        Returns a page of the catalog entries ordered by id, which only requires a range lookup in the primary key no
+        matter how far into the catalog the page is.
+
+        :param after_id: The id of the last image of the previous page, or 0 for the first page.
+        :param limit: The largest number of images in the page.
+        :return: The catalog entries of the images in the page.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT * FROM images WHERE id > ? ORDER BY id LIMIT ?",
+                                           (after_id, limit)).fetchall()
+
+    def unnormalized_images(self, after_id=0, limit=200):
+        """
+        Returns a page of the catalog entries of the images that have not been normalized, ordered by id.
+
+        :param after_id: The id of the last image of the previous page, or 0 for the first page.
+        :param limit: The largest number of images in the page.
+        :return: The catalog entries of the images in the page.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT * FROM images WHERE id > ? AND normalized = 0 ORDER BY id LIMIT ?",
+                                           (after_id, limit)).fetchall()
+
+    def set_normalized(self, updates):
+        """
+        Marks images as normalized and saves their new dimensions, size and digest in a single transaction.
+
+        :param updates: A list of (path, width, height, size, digest) tuples.
+        """
+        updates = [(width, height, size, digest, os.path.abspath(path))
+                   for path, width, height, size, digest in updates]
+
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE images SET width = ?, height = ?, size = ?, digest = ?, normalized = 1 "
+                                        "WHERE path = ?", updates)
+
+    def move_images(self, moves):
+        """
+        Changes the paths of images whose files were moved, e.g. when the image pool is migrated to the blob storage.
+        The rotation deck refers to the images by path, so it is updated as well.
+
+        :param moves: A list of (old path, new path, digest) tuples.
+        """
+        moves = [(os.path.abspath(new_path), digest, os.path.abspath(old_path)) for old_path, new_path, digest in moves]
+
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE images SET path = ?, digest = ? WHERE path = ?", moves)
+
+            if self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'rotation_deck'").fetchone():
+                self.connection.executemany("UPDATE rotation_deck SET path = ? WHERE path = ?",
+                                            [(new_path, old_path) for new_path, _, old_path in moves])
+
+    def images_for_subreddit(self, subreddit):
+        """Returns the catalog entries of every image from the given subreddit."""
+        with self.lock:
+            return self.connection.execute("SELECT * FROM images WHERE subreddit = ?", (subreddit,)).fetchall()
+
+    def contains(self, subreddit, fullname):
+        """Returns true if the image from the given submission in the given subreddit is in the catalog."""
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM images WHERE subreddit = ? AND fullname = ?",
+                                           (subreddit, fullname)).fetchone() is not None
+
+    def contains_path(self, path):
+        """Returns true if the image with the given path is in the catalog."""
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM images WHERE path = ?",
+                                           (os.path.abspath(path),)).fetchone() is not None
+
+    def get_image(self, path):
+        """Returns the catalog entry of the image with the given path or None if it is not in the catalog."""
+        with self.lock:
+            return self.connection.execute("SELECT * FROM images WHERE path = ?",
+                                           (os.path.abspath(path),)).fetchone()
+
+    def images_with_digest(self, digest):
+        """Returns the catalog entries of the images that link to the blob with the given digest."""
+        with self.lock:
+            return [dict(row) for row in self.connection.execute("SELECT * FROM images WHERE digest = ?", (digest,))]
+
+    def random_image(self):
+        """
+        Picks a random image from the catalog, where every image is equally likely. We pick a random id between the
+        smallest and largest id and use the image with exactly that id, which only requires a lookup in the primary key.
+        Picking the first image after the id would favor the images after gaps left by removed images, so an id that
+        misses is picked again, and if the ids are too sparse we skip a random number of rows instead.
+
+        :return: The path to the random image or None if the catalog is empty.
+        """
+        with self.lock:
+            smallest_id, largest_id = self.connection.execute("SELECT min(id), max(id) FROM images").fetchone()
+            if smallest_id is None:
+                return None
+
+            for _ in range(RANDOM_ID_ATTEMPTS):
+                row = self.connection.execute("SELECT path FROM images WHERE id = ?",
+                                              (random.randint(smallest_id, largest_id),)).fetchone()
+                if row is not None:
+                    return row["path"]
+
+            row = self.connection.execute("SELECT path FROM images ORDER BY id LIMIT 1 OFFSET ?",
+                                          (random.randrange(self.image_count()),)).fetchone()
+            return row["path"]
+
+    def image_count(self):
+        """Returns the number of images in the catalog."""
+        with self.lock:
+            return self.connection.execute("SELECT count(*) FROM images").fetchone()[0]
+
+    def set_perceptual_hash(self, path, phash):
+        """Saves the 64 bit perceptual hash of the image with the given path."""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE images SET phash = ? WHERE path = ?",
+                                    (to_signed_hash(phash), os.path.abspath(path)))
+
+    def perceptual_hashes(self):
+        """Returns a list of (path, perceptual hash) tuples for every image that has a perceptual hash."""
+        with self.lock:
+            return [(row["path"], from_signed_hash(row["phash"]))
+                    for row in self.connection.execute("SELECT path, phash FROM images WHERE phash IS NOT NULL")]
+
+    def images_by_download_time(self):
+        """Returns the catalog entries of every image as dictionaries, ordered from oldest to newest download."""
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM images ORDER BY downloaded_at").fetchall()
+
+        images = [dict(row) for row in rows]
+        for image in images:
+            image["phash"] = from_signed_hash(image["phash"])
+
+        return images
+
+    def record_shown(self, path):
+        """Records that the image with the given path was shown as the desktop background."""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE images SET last_shown = ?, times_shown = times_shown + 1 WHERE path = ?",
+                                    (time.time(), os.path.abspath(path)))
+
+    def pool_size(self):
+        """
+        Returns the number of bytes that the images in the pool use on disk. Images that share a blob are only counted
+        once.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT coalesce(sum(size), 0) FROM (SELECT max(size) AS size FROM images "
+                "GROUP BY coalesce(digest, path))").fetchone()[0]
+
+    def image_counts(self):
+        """Returns a dictionary from the lowercase name of each subreddit to the number of its images in the pool."""
+        with self.lock:
+            return {subreddit.lower(): count for subreddit, count in self.connection.execute(
+                "SELECT subreddit, count(*) FROM images GROUP BY subreddit")}
+
+    def eviction_candidates(self, policy, downloaded_before):
+        """
+        Returns the images in the order they should be evicted from the pool according to the given policy.
+
+        :param policy: "last_shown" to evict the least recently shown images first, where images that have never been
+        shown count from their download, "times_shown" to evict the images that were shown the fewest times first or
+        "oldest" to evict the oldest downloads first.
+        :param downloaded_before: Only images downloaded before this unix time are returned, which protects the images
+        that were just downloaded.
+        :return: The catalog entries of the candidates.
+        """
+        order = {"last_shown": "coalesce(last_shown, downloaded_at)",
+                 "times_shown": "times_shown, downloaded_at",
+                 "oldest": "downloaded_at"}[policy]
+
+        with self.lock:
+            return self.connection.execute("SELECT * FROM images WHERE downloaded_at < ? ORDER BY " + order,
+                                           (downloaded_before,)).fetchall()
+
+    def subreddit_size(self, subreddit):
+        """Returns the total size in bytes of the images from the given subreddit."""
+        with self.lock:
+            return self.connection.execute("SELECT coalesce(sum(size), 0) FROM images WHERE subreddit = ?",
+                                           (subreddit,)).fetchone()[0]
+
+    def last_refresh_times(self):
+        """Returns a dictionary from the lowercase name of each refreshed subreddit to the time of its last refresh."""
+        with self.lock:
+            return {subreddit.lower(): refreshed_at for subreddit, refreshed_at in self.connection.execute(
+                "SELECT subreddit, max(refreshed_at) FROM refreshes GROUP BY subreddit")}
+
+    def record_refresh(self, subreddit, images_downloaded, bytes_downloaded, estimated_source_bytes):
+        """
+        Records how much was downloaded when the images of a subreddit were refreshed, together with the disk use of
+        the subreddit after the refresh.
+
+        :param subreddit: The name of the subreddit that was refreshed.
+        :param images_downloaded: The number of images that were downloaded.
+        :param bytes_downloaded: The number of bytes that were downloaded.
+        :param estimated_source_bytes: The estimated number of bytes if the original images had been downloaded.
+        """
+        with self.lock, self.connection:
+            disk_bytes = self.connection.execute("SELECT coalesce(sum(size), 0) FROM images WHERE subreddit = ?",
+                                                 (subreddit,)).fetchone()[0]
+            self.connection.execute(
+                "INSERT INTO refreshes (subreddit, refreshed_at, images_downloaded, bytes_downloaded, "
+                "estimated_source_bytes, disk_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                (subreddit, time.time(), images_downloaded, bytes_downloaded, estimated_source_bytes, disk_bytes))
+
+    def set_icon(self, subreddit, path):
+        """Saves the path to the icon of the given subreddit."""
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO icons (subreddit, path) VALUES (?, ?)",
+                                    (subreddit, os.path.abspath(path)))
+
+    def icon_path(self, subreddit):
+        """Returns the path to the icon of the given subreddit or None if the subreddit has no icon."""
+        with self.lock:
+            row = self.connection.execute("SELECT path FROM icons WHERE subreddit = ?", (subreddit,)).fetchone()
+            return row["path"] if row else None
+
+    def icons(self):
+        """Returns a list of (subreddit, path) tuples for every icon in the catalog."""
+        with self.lock:
+            return [(row["subreddit"], row["path"]) for row in self.connection.execute("SELECT * FROM icons")]
+
+    def remove_icon(self, subreddit):
+        """
+        Removes the icon of the given subreddit from the catalog.
+
+        :return: The path to the removed icon or None if the subreddit had no icon.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT path FROM icons WHERE subreddit = ?", (subreddit,)).fetchone()
+            path = row["path"] if row else None
+            self.connection.execute("DELETE FROM icons WHERE subreddit = ?", (subreddit,))
+
+        return path
+
+    def rebuild(self, image_folder="../data/images", icon_folder="../data/icons"):
+        """
+        Repairs the catalog if it has drifted from the files on disk. Entries whose file no longer exists are removed
+        and files that are not in the catalog are added.
+
+        :param image_folder: The folder containing the background image pool.
+        :param icon_folder: The folder containing the subreddit icons.
+        :return: A tuple with the number of added and removed entries.
+        """
+        added = 0
+        removed = 0
+
+        with self.lock, self.connection:
+            known_paths = set()
+            for row in self.connection.execute("SELECT path FROM images").fetchall():
+                if os.path.isfile(row["path"]):
+                    known_paths.add(row["path"])
+                else:
+                    self.connection.execute("DELETE FROM images WHERE path = ?", (row["path"],))
+                    removed += 1
+
+            for entry in image_files(image_folder):
+                path = os.path.abspath(entry.path)
+                if path in known_paths:
+                    continue
+
+                subreddit, fullname = parse_image_filename(entry.name)
+                if subreddit is None:
+                    continue
+
+                width, height = read_image_size(path)
+                stat = entry.stat()
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO images (subreddit, fullname, path, width, height, size, downloaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (subreddit, fullname, path, width, height, stat.st_size, stat.st_mtime))
+                added += 1
+
+            # The icons are few so they are simply rebuilt from scratch.
+            self.connection.execute("DELETE FROM icons")
+            for entry in os.scandir(icon_folder):
+                if entry.is_file():
+                    self.connection.execute("INSERT OR REPLACE INTO icons (subreddit, path) VALUES (?, ?)",
+                                            (os.path.splitext(entry.name)[0], os.path.abspath(entry.path)))
+
+        return added, removed
+
+
+def to_signed_hash(phash):
+    """Converts an unsigned 64 bit hash to the signed 64 bit integer that SQLite can store."""
+    if phash is None:
+        return None
+    return phash - (1 << 64) if phash >= (1 << 63) else phash
+
+
+def from_signed_hash(phash):
+    """Converts a signed 64 bit integer stored by SQLite back to the unsigned 64 bit hash."""
+    if phash is None:
+        return None
+    return phash + (1 << 64) if phash < 0 else phash
+
+
+def image_files(image_folder):
+    """
+    Generates the image files in the background image pool, both in the shard folders and directly in the folder from
+    before the images were stored as blobs.
+
+    :param image_folder: The folder containing the background image pool.
+    :return: A generator of the os.DirEntry of each image file.
+    """
+    for entry in os.scandir(image_folder):
+        if entry.is_file():
+            yield entry
+        elif entry.is_dir():
+            yield from (shard_entry for shard_entry in os.scandir(entry.path) if shard_entry.is_file())
+
+
+def parse_image_filename(filename):
+    """
+    Parses a filename with the format "subreddit_fullname.jpg" into the subreddit name and the submission fullname.
+    Both subreddit names and fullnames can contain underscores, so the filename is split at the last submission
+    fullname prefix instead of at a fixed position.
+
+    :param filename: The filename that should be parsed.
+    :return: A tuple with the subreddit name and the fullname, or (None, None) if the filename can not be parsed.
+    """
+    stem = os.path.splitext(filename)[0]
+    subreddit, separator, submission_id = stem.rpartition("_t3_")
+
+    if not separator or not subreddit or not submission_id:
+        return None, None
+
+    return subreddit, "t3_" + submission_id
+
+
+def read_image_size(path):
+    """
+    Reads the dimensions of a JPEG or PNG image from its header without decoding the image.
+
+    :param path: The path to the image.
+    :return: A tuple with the width and height of the image, or (None, None) if the size could not be read.
+    """
+    try:
+        with open(path, "rb") as image_file:
+            header = image_file.read(24)
+
+            # PNG images have the dimensions at a fixed position in the IHDR chunk.
+            if header.startswith(b"\x89PNG\r\n\x1a\n"):
+                return struct.unpack(">II", header[16:24])
+
+            # JPEG images have the dimensions in the start of frame segment, so we skip segments until we find it.
+            if header.startswith(b"\xff\xd8"):
+                image_file.seek(2)
+                while True:
+                    marker = image_file.read(2)
+                    if len(marker) < 2 or marker[0] != 0xFF:
+                        break
+
+                    length = struct.unpack(">H", image_file.read(2))[0]
+                    if marker[1] in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                        height, width = struct.unpack(">xHH", image_file.read(5))
+                        return width, height
+
+                    image_file.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        pass
+
+    return None, None
+
+
+if __name__ == '__main__':
+    # Running the module directly rebuilds the catalog from the files on disk.
+    print("Catalog rebuilt: {} added, {} removed".format(*ImageCatalog().rebuild()))
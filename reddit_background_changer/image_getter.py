@@ -0,0 +1,716 @@
+import html
+import os
+import threading
+import time
+from functools import partial
+
+from reddit_background_changer.blacklist import Blacklist
+from reddit_background_changer.deduplication import HashIndex, hash_image_data
+from reddit_background_changer.downloader import DownloadPipeline
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.image_normalizer import ImageNormalizer
+from reddit_background_changer.instrumentation import Instrumentation, timed
+from reddit_background_changer.job_manager import JobManager, REFRESH_PRIORITY
+from reddit_background_changer.listing_cache import ListingCache
+from reddit_background_changer.pool_budget import PoolBudget
+from reddit_background_changer.preview_variants import select_preview_variant
+from reddit_background_changer.reddit_client import RedditClient
+from reddit_background_changer.rotation_scheduler import RotationScheduler
+from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import BlobStore, load_subreddits, write_file_atomically
+from reddit_background_changer.viability_filter import ViabilityFilter
+from reddit_background_changer.wallpaper_backend import WallpaperBackend
+
+
+class ImageGetter:
+    """
+    Class for getting the images of subreddits from reddit and keeping the image pool in sync with the subreddit
+    configurations. A single instance is shared by the subreddit model in the main window, the refresh scheduler and
+    the command line interface through ImageGetter.shared(), which is why it does not depend on any Qt widgets.
+    """
+    # The image getter that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self):
+        # Setting up the settings containing the secret information for the reddit instance.
+        self.settings = Settings.shared()
+
+        # The blacklist of submissions whose images should never be downloaded.
+        self.blacklist = Blacklist.shared()
+
+        # The timers and counters of the stages of getting and deleting images.
+        self.instrumentation = Instrumentation.shared()
+
+        # The platform specific backend that is used to get the size of the monitor.
+        self.backend = WallpaperBackend.shared()
+
+        # The catalog that keeps track of the downloaded images and icons.
+        self.catalog = ImageCatalog()
+
+        # The rotation scheduler that new images are added to so they are shown without reshuffling the deck.
+        self.rotation_scheduler = RotationScheduler(self.catalog)
+
+        # The store that the images are saved in by their content, so images are written atomically and shared.
+        self.blob_store = BlobStore.shared()
+
+        # The byte budget of the pool, which evicts images when the pool grows too large.
+        self.pool_budget = PoolBudget(self.catalog, self.blob_store)
+
+        # Setting up the pipeline that downloads the images. The pipeline is shared by every worker getting images.
+        self.download_pipeline = DownloadPipeline(self.settings.download_workers, blob_store=self.blob_store)
+        self.instrumentation.set_gauge("downloader.queued_downloads", self.download_pipeline.queue.qsize)
+
+        # The worker processes that verify the downloaded images, fit them to the display and encode them again.
+        self.image_normalizer = ImageNormalizer(self.catalog, self.blob_store)
+
+        # The perceptual hashes of the images in the pool, used to skip near duplicates before they are downloaded.
+        self.hash_index = HashIndex.shared()
+
+        # The cached listings of the subreddits, so getting the images again does not walk the listing from the top.
+        self.listing_cache = ListingCache(self.catalog)
+
+        # Guards the state of a refresh, which is updated from the download workers.
+        self.statistics_lock = threading.Lock()
+
+        # Function that returns the current subreddit configurations, which are refilled after images are evicted. The
+        # subreddit list file is the list when there is no main window, see set_subreddit_source().
+        self.get_subreddits = load_subreddits
+
+        # Functions that are called with (name, icon_path) each time the icon of a subreddit is saved or deleted.
+        self.icon_listeners = []
+
+        # Mapping from the lowercase subreddit name to the url of the icon that was saved, so unchanged icons are not
+        # downloaded again.
+        self.icon_urls = {}
+
+    @classmethod
+    def shared(cls):
+        """Returns the image getter that is shared by the whole application, creating it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+
+            return cls.shared_instance
+
+    def set_subreddit_source(self, get_subreddits):
+        """
+        Sets the function that returns the current subreddit configurations, e.g. the list model of the main window,
+        which can be ahead of the subreddit list file since the file is saved shortly after the last change.
+
+        :param get_subreddits: Function that returns the current list of subreddit configurations.
+        """
+        self.get_subreddits = get_subreddits
+
+    def subscribe(self, listener):
+        """
+        Subscribes the given function to changes of the subreddit icons. Note that the function is called from the
+        thread that got the images.
+
+        :param listener: Function called with (name, icon_path) when the icon of a subreddit is saved or deleted, where
+        icon_path is None if the icon was deleted.
+        """
+        self.icon_listeners.append(listener)
+
+    @timed("get_images")
+    def get_images(self, subreddit_config, save_path, progress_callback=None, enforce_budget=True, cancel_event=None):
+        """
+        Uses PRAW to get the images from reddit that are described by the specific subreddit configuration. Once gotten
+        the function saves them to the specified folder.
+
+        The listing is walked in this thread while the viable images are handed to the download pipeline, which means
+        that the images are downloaded concurrently while we look for the next viable submission. Images from the
+        subreddit that are already on disk are kept if they are still among the requested images and deleted if not,
+        so only the missing images are downloaded. The listing itself is read from the listing cache, so getting the
+        images again only fetches the pages of the listing that are not cached.
+
+        :param save_path: The path to the folder in which we save the images.
+        :param subreddit_config: The subreddit configuration that describes the subreddit we should search, the time
+        limit the search should be within and the amount of images we should find.
+        :param progress_callback: Function called with (name, done, total) each time an image is downloaded.
+        :param enforce_budget: If true the pool is evicted down to the byte budget after the images are downloaded and
+        the subreddits are refilled with the freed space.
+        :param cancel_event: Event that is set to stop getting the images, e.g. since the subreddit was deleted. The
+        images that were already downloaded are kept, but the images on disk are not synced with the configuration.
+        :return: A dictionary describing how many images were kept, downloaded, deleted and evicted, how many requests
+        and bytes were saved by keeping images and whether getting the images was cancelled, or None if the subreddit
+        does not exist.
+        """
+        # Loading the most recent settings, which only reads the settings file if it has changed.
+        self.settings.load_settings()
+
+        # Pulling the information from the configuration to increase readability.
+        name, time_limit, number_of_images = subreddit_config
+
+        # Using the shared reddit instance, which is only created again if the credentials have changed.
+        reddit_client = RedditClient.shared()
+
+        # Stopping further execution of the method if the subreddit does not exist. Whether the subreddit exists is
+        # cached together with its icon, so this usually does not make a request.
+        with self.instrumentation.timer("get_images.subreddit_info"):
+            subreddit_info = reddit_client.subreddit_info(name)
+        if subreddit_info is None:
+            print("Subreddit does not exist: /r/" + name)
+            return None
+
+        # Converting the time limit into the corresponding time filter that can be used in top().
+        time_limit = self.convert_time_limit(time_limit)
+
+        # The time the refresh started, so the images downloaded by the refresh are not evicted again right away.
+        start_time = time.time()
+
+        # The state of the refresh that is shared by its stages and updated by the download workers.
+        refresh = self.start_refresh(name, number_of_images, save_path, progress_callback)
+
+        # Walking the listing in this thread while the viable images are downloaded concurrently by the pipeline.
+        cancelled = self.walk_listing(refresh, reddit_client.reddit(), subreddit_info["display_name"], time_limit,
+                                      cancel_event)
+        self.finish_downloads(refresh, cancelled)
+
+        # Normalizing the downloaded images before the pool budget is enforced, since normalizing shrinks the pool.
+        # Images that can not be decoded are removed from the pool so they are never shown.
+        normalize_report = self.normalize_images(refresh["paths"])
+
+        # Deleting the images that are no longer among the requested images, e.g. since the number of images was
+        # lowered or the time limit was changed. If cancelled, the rest of the listing was not walked, so the images
+        # that were not found yet may still be among the requested images.
+        deleted = 0
+        if not cancelled:
+            deleted = self.remove_images([image["path"] for image in refresh["existing_images"].values()])
+
+        # Recording how much was downloaded so the savings from the preview variants are visible.
+        self.catalog.record_refresh(name, refresh["batch"].downloaded, refresh["batch"].bytes_downloaded,
+                                    refresh["estimated_source_bytes"])
+
+        # Adding the subreddit icon to the icon folder.
+        if not cancelled:
+            self.get_icon(subreddit_info, "../data/icons/")
+
+        # Keeping the pool within the byte budget, which can evict images from every subreddit.
+        evicted_images = []
+        if enforce_budget and not cancelled:
+            evicted_images = self.enforce_budget(save_path, start_time)
+
+        return self.report_refresh(refresh, normalize_report, deleted, evicted_images, cancelled)
+
+    def report_refresh(self, refresh, normalize_report, deleted, evicted_images, cancelled):
+        """
+        Describes what a refresh did, adds it to the counters of the instrumentation and prints it.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param normalize_report: The report of normalize_images() for the downloaded images.
+        :param deleted: The number of images that were deleted since they are no longer among the requested images.
+        :param evicted_images: The catalog entries of the images that were evicted to keep the pool within the budget.
+        :param cancelled: Whether getting the images was cancelled.
+        :return: The result of get_images().
+        """
+        # Note that the counts include other subreddits that were refreshed at the same time by other workers.
+        listing_metrics = self.listing_cache.metrics()
+        kept_images = refresh["kept_images"]
+        batch = refresh["batch"]
+
+        sync_result = {"name": refresh["name"],
+                       "kept": len(kept_images),
+                       "downloaded": batch.downloaded,
+                       "deleted": deleted,
+                       "evicted": len(evicted_images),
+                       "skipped_duplicates": refresh["skipped_duplicates"],
+                       "saved_requests": len(kept_images),
+                       "saved_bytes": sum(image["size"] or 0 for image in kept_images),
+                       "downloaded_bytes": batch.bytes_downloaded,
+                       "estimated_source_bytes": refresh["estimated_source_bytes"],
+                       "cached_pages": listing_metrics["page_hits"] - refresh["listing_metrics"]["page_hits"],
+                       "fetched_pages": listing_metrics["page_misses"] - refresh["listing_metrics"]["page_misses"],
+                       "cached_hashes": listing_metrics["hash_hits"] - refresh["listing_metrics"]["hash_hits"],
+                       "checked_submissions": refresh["viability_filter"].checked,
+                       "rejections": refresh["viability_filter"].rejections,
+                       "normalized": normalize_report["normalized"],
+                       "corrupt": len(normalize_report["corrupt"]),
+                       "reclaimed_bytes": normalize_report["reclaimed_bytes"],
+                       "cancelled": cancelled}
+
+        self.count_sync_result(sync_result)
+
+        if cancelled:
+            print("Image getter: cancelled getting the images of /r/" + refresh["name"])
+
+        print("Image getter: /r/{name} kept {kept}, downloaded {downloaded}, deleted {deleted}, evicted {evicted} and "
+              "skipped {skipped_duplicates} duplicate images, saving {saved_requests} requests and {saved_bytes} "
+              "bytes. Downloaded {downloaded_bytes} bytes instead of an estimated {estimated_source_bytes} bytes for "
+              "the original images. Used {cached_pages} cached and {fetched_pages} fetched listing pages and "
+              "{cached_hashes} cached thumbnail hashes. Checked {checked_submissions} submissions and rejected "
+              "{rejected}. Normalized {normalized} images at {images_per_second:.1f} images/s, reclaiming "
+              "{reclaimed_bytes} bytes, and removed {corrupt} corrupt images".format(
+                  rejected=", ".join("{} as {}".format(count, reason) for reason, count in
+                                     sync_result["rejections"].items()),
+                  images_per_second=normalize_report["images_per_second"], **sync_result))
+
+        return sync_result
+
+    def count_sync_result(self, sync_result):
+        """Adds the images, submissions and rejections of a refresh to the counters of the instrumentation."""
+        if not self.instrumentation.enabled:
+            return
+
+        for key in ("kept", "downloaded", "deleted", "evicted", "skipped_duplicates", "downloaded_bytes",
+                    "checked_submissions", "corrupt", "cancelled"):
+            self.instrumentation.count("get_images." + key, int(sync_result[key]))
+
+        for reason, count in sync_result["rejections"].items():
+            self.instrumentation.count("get_images.rejected." + reason, count)
+
+    def sync_images(self, old_subreddit_config, new_subreddit_config, save_path, progress_callback=None):
+        """
+        Changes the images on disk from the old subreddit configuration to the new subreddit configuration. If the
+        subreddit is the same then the images that are wanted by both configurations are kept and only the missing
+        images are downloaded, otherwise the images from the old subreddit are deleted.
+
+        :param old_subreddit_config: The subreddit configuration that the images on disk were gotten with.
+        :param new_subreddit_config: The subreddit configuration that the images should be changed to.
+        :param save_path: The path to the folder in which we save the images.
+        :param progress_callback: Function called with (name, done, total) each time an image is downloaded.
+        :return: The result of get_images() for the new subreddit configuration.
+        """
+        if old_subreddit_config[0].lower() != new_subreddit_config[0].lower():
+            self.delete_images(old_subreddit_config[0])
+
+        return self.get_images(new_subreddit_config, save_path, progress_callback)
+
+    @timed("get_images.enforce_budget")
+    def enforce_budget(self, save_path, downloaded_before):
+        """
+        Evicts images until the pool is within the byte budget and refills the subreddits that have fewer images than
+        configured with new images, as far as the freed space allows. The refills are submitted as refresh jobs of the
+        shared job manager with the key of their subreddit, so a refill never runs at the same time as another job for
+        the same subreddit and is cancelled if the subreddit is deleted. The refills do not enforce the budget again,
+        so a refresh never causes a chain of refreshes.
+
+        :param save_path: The path to the folder in which we save the images.
+        :param downloaded_before: Only images downloaded before this unix time are evicted.
+        :return: The catalog entries of the evicted images.
+        """
+        evicted_images = self.pool_budget.enforce(downloaded_before)
+        if not evicted_images:
+            return []
+
+        for image in evicted_images:
+            self.hash_index.remove(image["path"])
+
+        # Passing no progress callback and False for enforce_budget, since the job manager only passes keywords.
+        job_manager = JobManager.shared()
+        for subreddit_config in self.pool_budget.refill_configs(self.get_subreddits()):
+            job_manager.submit(subreddit_config[0].lower(), self.get_images, tuple(subreddit_config), save_path, None,
+                               False, priority=REFRESH_PRIORITY, cancellable=True)
+
+        return evicted_images
+
+    @staticmethod
+    def next_candidates(entries, count, evicted_fullnames):
+        """
+        Takes the next viable submissions from a listing, skipping the submissions that were evicted from the pool.
+
+        :param entries: The generator of listing entries from ListingCache.entries().
+        :param count: The largest number of submissions that are taken.
+        :param evicted_fullnames: The fullnames of the submissions that should not be downloaded again.
+        :return: A list with the entries of up to count submissions, which is empty at the end of the listing.
+        """
+        candidates = []
+        for entry in entries:
+            if entry["viable"] and entry["fullname"] not in evicted_fullnames:
+                candidates.append(entry)
+                if len(candidates) == count:
+                    break
+
+        return candidates
+
+    @timed("get_images.thumbnail_hash")
+    def hash_thumbnails(self, subreddit_name, time_filter, entries):
+        """
+        Sets the perceptual hash of the thumbnail of each given listing entry. The hashes that are not cached with the
+        listing are computed from the smallest thumbnails, which are downloaded together by the download pipeline, and
+        are then cached so each thumbnail is only downloaded once.
+
+        :param subreddit_name: The name of the subreddit that the listing is from.
+        :param time_filter: The time filter of the listing.
+        :param entries: The entries of the submissions in the listing cache, whose "phash" is set if it can be hashed.
+        """
+        if self.settings.dedup_distance < 0:
+            return
+
+        uncached_entries = []
+        for entry in entries:
+            self.listing_cache.record_hash_lookup(entry["phash"] is not None)
+            if entry["phash"] is None and entry["preview"].get("resolutions"):
+                uncached_entries.append(entry)
+
+        thumbnail_urls = [html.unescape(min(entry["preview"]["resolutions"],
+                                            key=lambda variant: variant["width"] * variant["height"])["url"])
+                          for entry in uncached_entries]
+
+        for entry, thumbnail in zip(uncached_entries, self.download_pipeline.fetch_many(thumbnail_urls)):
+            if thumbnail is None:
+                continue
+
+            try:
+                entry["phash"] = hash_image_data(thumbnail)
+            except ValueError as e:
+                print("Image getter: " + str(e))
+                continue
+
+            self.listing_cache.set_hash(subreddit_name, time_filter, entry["position"], entry["phash"])
+
+    def skip_duplicate(self, refresh, image_hash, path):
+        """
+        Checks whether an image is a near duplicate of an image in the pool or of an image submitted by the refresh. If
+        it is not then its hash is added to the hashes of the refresh, so duplicates within the listing are skipped as
+        well. The hash is only added to the shared index once the download succeeds, so a failed or cancelled download
+        does not leave a hash behind that would make its own submission a duplicate next time.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param image_hash: The perceptual hash of the thumbnail of the image.
+        :param path: The path that the image would be saved to.
+        :return: True if the image should be skipped.
+        """
+        distance = self.settings.dedup_distance
+        if self.hash_index.find_near_duplicate(image_hash, distance) is not None or \
+                refresh["batch_hashes"].find_near_duplicate(image_hash, distance) is not None:
+            refresh["skipped_duplicates"] += 1
+            return True
+
+        refresh["batch_hashes"].add(image_hash, os.path.abspath(path))
+        return False
+
+    def start_refresh(self, name, number_of_images, save_path, progress_callback):
+        """
+        Starts getting the images of a subreddit by starting the batch of downloads that the images are handed to.
+
+        :param name: The name of the subreddit.
+        :param number_of_images: The number of images that the subreddit should have.
+        :param save_path: The path to the folder in which we save the images.
+        :param progress_callback: Function called with (name, done, total) each time an image is downloaded, or None.
+        :return: A dictionary with the state of the refresh that is shared by its stages: the name of the subreddit, the
+        save path, the images from the subreddit that are already on disk keyed by the fullname of their submission,
+        the kept images, the hashes of the submitted images and the number of skipped duplicates, the filter that
+        checks the viability of each page of the listing, the listing cache metrics before the refresh, the batch of
+        downloads, the paths of the downloaded images, which are normalized once every download is finished, and the
+        estimated number of bytes the downloaded images would have had if the originals were downloaded.
+        """
+        refresh = {"name": name, "save_path": save_path, "kept_images": [], "paths": [], "estimated_source_bytes": 0,
+                   "existing_images": {image["fullname"]: image for image in self.catalog.images_for_subreddit(name)},
+                   "batch_hashes": HashIndex(), "skipped_duplicates": 0,
+                   "viability_filter": ViabilityFilter.from_settings(self.settings, self.backend, self.blacklist),
+                   "listing_metrics": self.listing_cache.metrics()}
+
+        # Reporting the kept images as done so the progress reaches the requested amount of images.
+        if progress_callback is not None:
+            progress_callback = partial(self.report_progress, progress_callback, refresh["kept_images"])
+
+        refresh["batch"] = self.download_pipeline.start_batch(name, number_of_images, progress_callback)
+        return refresh
+
+    def walk_listing(self, refresh, reddit, display_name, time_filter, cancel_event):
+        """
+        Walks the cached listing of a subreddit and hands the viable submissions to the other stages of the refresh
+        until the subreddit has the requested number of images, the listing ends or getting the images is cancelled.
+        Failed downloads free up their spot again, so the listing is walked further to replace them.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param reddit: The reddit instance that the pages of the listing that are not cached are fetched with.
+        :param display_name: The display name of the subreddit.
+        :param time_filter: The time filter of the listing.
+        :param cancel_event: Event that is set to stop getting the images, or None.
+        :return: True if getting the images was cancelled.
+        """
+        # The submissions that were evicted to keep the pool within the budget, which should not be downloaded again.
+        evicted_fullnames = self.pool_budget.evicted_fullnames(refresh["name"])
+
+        batch = refresh["batch"]
+        entries = self.listing_cache.entries(reddit, display_name, time_filter, refresh["viability_filter"])
+        try:
+            while True:
+                # Ensuring that we only retrieve the requested amount of images.
+                missing_images = batch.total - (len(refresh["kept_images"]) + batch.submitted - batch.failed)
+                if missing_images <= 0:
+                    return False
+
+                # Taking the next submissions that could fill the missing spots and hashing their thumbnails together,
+                # so the thumbnails that are not cached are downloaded concurrently by the download pipeline.
+                candidates = self.next_candidates(entries, missing_images, evicted_fullnames)
+                if not candidates:
+                    return False
+
+                new_entries = [entry for entry in candidates if entry["fullname"] not in refresh["existing_images"]]
+                self.hash_thumbnails(display_name, time_filter, new_entries)
+
+                for entry in candidates:
+                    # Stopping at the next submission if the job getting the images was cancelled.
+                    if cancel_event is not None and cancel_event.is_set():
+                        return True
+
+                    self.submit_candidate(refresh, entry)
+        finally:
+            # Closing the listing so a page that was being fetched when we stopped is not walked any further.
+            entries.close()
+
+    def submit_candidate(self, refresh, entry):
+        """
+        Keeps the image of a viable submission if it is already on disk and otherwise downloads it, unless it is a near
+        duplicate of an image in the pool. Rare problematic submissions are ignored.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param entry: The listing entry of the submission.
+        """
+        try:
+            if self.keep_existing_image(refresh, entry):
+                return
+
+            path = self.blob_store.image_path(refresh["save_path"], refresh["name"] + "_" + entry["fullname"] + ".jpg")
+
+            # Skipping the image if its thumbnail is a near duplicate of an image that is already in the pool.
+            image_hash = entry["phash"] if self.settings.dedup_distance >= 0 else None
+            if image_hash is not None and self.skip_duplicate(refresh, image_hash, path):
+                return
+
+            self.submit_download(refresh, entry, path, image_hash)
+        except Exception as e:
+            print("Image getter: " + str(e))
+            self.instrumentation.count("get_images.errors")
+
+    @staticmethod
+    def keep_existing_image(refresh, entry):
+        """
+        Keeps the image of a submission instead of downloading it again if it is already on disk. The images on disk
+        that are not kept by the end of the refresh are no longer among the requested images.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param entry: The listing entry of the submission.
+        :return: True if the image was kept.
+        """
+        image = refresh["existing_images"].pop(entry["fullname"], None)
+        if image is not None:
+            refresh["kept_images"].append(image)
+
+        return image is not None
+
+    def submit_download(self, refresh, entry, path, image_hash):
+        """
+        Hands the smallest sufficient variant of an image to the download pipeline, which saves it to the blob store
+        using its unique name. The image is added to the catalog once it has been saved.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param entry: The listing entry of the submission.
+        :param path: The path that the image is saved to.
+        :param image_hash: The perceptual hash of the thumbnail of the image, or None if it is not known.
+        """
+        variant = self.select_variant(entry["preview"])
+        self.download_pipeline.submit(refresh["batch"], variant["url"], path,
+                                      partial(self.add_downloaded_image, refresh, entry, path, variant, image_hash))
+
+    def select_variant(self, preview_image):
+        """
+        Selects the smallest variant of a preview image that covers the primary monitor, following the "preview_policy"
+        setting.
+
+        :param preview_image: The image from the preview of a submission.
+        :return: A dictionary with the url, width and height of the selected variant.
+        """
+        monitor_width, monitor_height = self.get_monitor_size()
+        return select_preview_variant(preview_image, monitor_width, monitor_height, self.settings.preview_policy)
+
+    def finish_downloads(self, refresh, cancelled):
+        """
+        Waits for the remaining downloads of a refresh, so the caller is not told that we are done before the images are
+        saved. If getting the images was cancelled then the downloads that have not started yet are skipped.
+
+        :param refresh: The state of the refresh from start_refresh().
+        :param cancelled: Whether getting the images was cancelled.
+        """
+        if cancelled:
+            refresh["batch"].cancel()
+
+        with self.instrumentation.timer("get_images.wait_for_downloads"):
+            refresh["batch"].wait()
+
+    def add_downloaded_image(self, refresh, entry, path, variant, image_hash, size, digest):
+        """
+        Adds a downloaded image to the catalog and its perceptual hash to the hash index, and adds its estimated
+        original size to the refresh. The original size is estimated from the number of pixels in the original image
+        compared to the downloaded variant.
+        """
+        self.catalog.add_image(refresh["name"], entry["fullname"], path, variant["width"], variant["height"], size,
+                               phash=image_hash, digest=digest)
+        self.rotation_scheduler.add(path, refresh["name"])
+
+        if image_hash is not None:
+            self.hash_index.add(image_hash, os.path.abspath(path))
+
+        source = entry["preview"]["source"]
+        with self.statistics_lock:
+            refresh["paths"].append(path)
+            refresh["estimated_source_bytes"] += int(size * (source["width"] * source["height"]) /
+                                                     (variant["width"] * variant["height"]))
+
+    def normalize_images(self, paths):
+        """
+        Normalizes the given images, fitting them to the displays that are used to check the viability of submissions
+        and encoding them with the quality from the "normalize_quality" setting. The images that can not be decoded are
+        removed from the pool by the normalizer.
+
+        :param paths: The paths to the image files.
+        :return: The report of ImageNormalizer.normalize(), where nothing is normalized if the quality is 0.
+        """
+        if self.settings.normalize_quality <= 0:
+            paths = []
+
+        viability_filter = ViabilityFilter.from_settings(self.settings, self.backend, ())
+        targets = [(int(width), int(height)) for width, height in viability_filter.targets]
+
+        report = self.image_normalizer.normalize(paths, targets, self.settings.aspect_tolerance,
+                                                 min(self.settings.normalize_quality, 100))
+        if report["corrupt"]:
+            print("Image getter: removed {} images that could not be decoded".format(len(report["corrupt"])))
+
+        return report
+
+    def normalize_pool(self, page_size=256):
+        """
+        Normalizes the images in the pool that have not been normalized, e.g. the images that were downloaded before
+        the images were normalized. The catalog is read a page at a time so the pool can be of any size.
+
+        :param page_size: The number of images that are normalized at a time.
+        :return: A dictionary with the totals of the reports of normalize_images() and the overall images per second.
+        """
+        self.settings.load_settings()
+
+        totals = {"normalized": 0, "reencoded": 0, "failed": 0, "corrupt": 0, "reclaimed_bytes": 0, "seconds": 0.0,
+                  "images_per_second": 0.0}
+        if self.settings.normalize_quality <= 0:
+            print("Image getter: normalizing is disabled by the normalize_quality setting")
+            return totals
+
+        after_id = 0
+
+        while True:
+            page = self.catalog.unnormalized_images(after_id, page_size)
+            if not page:
+                break
+
+            # Continuing after the page even if some images failed, so they are not tried again and again.
+            after_id = page[-1]["id"]
+
+            report = self.normalize_images([image["path"] for image in page])
+            report["corrupt"] = len(report["corrupt"])
+            for key in totals:
+                totals[key] += report[key]
+
+            print("Image getter: normalized {} of {} images at {:.1f} images/s".format(
+                report["normalized"], len(page), report["images_per_second"]))
+
+        totals["images_per_second"] = totals["normalized"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+        return totals
+
+    @staticmethod
+    def report_progress(progress_callback, kept_images, name, downloaded, total):
+        """Reports the progress of a batch with the kept images counted as done."""
+        progress_callback(name, len(kept_images) + downloaded, total)
+
+    def get_monitor_size(self):
+        """Returns the width and height of the primary monitor in pixels, which is cached by the backend."""
+        return self.backend.display_geometry()[0]
+
+    @timed("delete_images")
+    def delete_images(self, subreddit_name):
+        """
+        Deletes all images from the background image pool that are from the given subreddit. Also deletes the
+        subreddits icon from the icon folder. The files are found through the catalog so no folder is scanned.
+
+        :param subreddit_name: The subreddit specifying what images and which icon that should be deleted.
+        """
+        # Deleting the images from the background image pool.
+        with self.instrumentation.timer("delete_images.files"):
+            for path, digest in self.catalog.remove_subreddit(subreddit_name):
+                self.blob_store.remove(path, digest)
+                self.hash_index.remove(path)
+
+        # Forgetting the cached listings and evictions so a subreddit that is added again starts from a fresh listing.
+        self.listing_cache.remove(subreddit_name)
+        self.pool_budget.forget(subreddit_name)
+
+        # Deleting the icon from the icon folder.
+        with self.instrumentation.timer("delete_images.icon"):
+            self.icon_urls.pop(subreddit_name.lower(), None)
+            icon_path = self.catalog.remove_icon(subreddit_name)
+            if icon_path is not None and os.path.exists(icon_path):
+                os.remove(icon_path)
+
+        for listener in self.icon_listeners:
+            listener(subreddit_name, None)
+
+    def remove_images(self, paths, blacklist=False):
+        """
+        Removes the given images from the background image pool, e.g. the images selected in the gallery. The images
+        are removed from the catalog in a single transaction and blacklisted in a single write, no matter how many
+        images are removed.
+
+        :param paths: The paths to the image files.
+        :param blacklist: If true the submissions of the images are blacklisted so they are never downloaded again.
+        :return: The number of removed images.
+        """
+        images = self.catalog.remove_images(paths)
+
+        if blacklist:
+            self.blacklist.add_many([image["fullname"] for image in images])
+
+        for image in images:
+            self.blob_store.remove(image["path"], image["digest"])
+            self.hash_index.remove(image["path"])
+
+        return len(images)
+
+    @staticmethod
+    def convert_time_limit(time_limit):
+        """
+        Converts the time limit from the combobox into the corresponding internal value that can be used in PRAW.
+
+        :param time_limit: The time limit that we wish to convert.
+        :return: The value that corresponds to the time_limit argument.
+        """
+        return {
+            "Now": "hour",
+            "Today": "day",
+            "This week": "week",
+            "This month": "month",
+            "This year": "year",
+            "All time": "all"
+        }[time_limit]
+
+    @timed("get_images.icon")
+    def get_icon(self, subreddit_info, save_path):
+        """
+        Saves the icon of the given subreddit to the folder specified by the save path argument.
+        :param subreddit_info: The cached information about the subreddit that we wish to find the icon of.
+        :param save_path: The folder we should save the icon to.
+        """
+        display_name = subreddit_info["display_name"]
+        icon_path = save_path + display_name + ".png"
+
+        # Skipping the icon if it has not changed since it was saved.
+        if self.icon_urls.get(display_name.lower()) == subreddit_info["icon_img"] and os.path.exists(icon_path):
+            return
+
+        # If the subreddit has an icon.
+        if subreddit_info["icon_img"] != "":
+            icon_data = self.download_pipeline.fetch(subreddit_info["icon_img"])
+        # If not we just save the subreddit icon as the default icon.
+        else:
+            with open("../resources/default_subreddit_icon.png", "rb") as icon_file:
+                icon_data = icon_file.read()
+
+        # Save the icon to the icons folder through a temporary file, so a half written icon is never shown.
+        write_file_atomically(icon_path, icon_data)
+
+        self.catalog.set_icon(display_name, icon_path)
+        self.icon_urls[display_name.lower()] = subreddit_info["icon_img"]
+
+        for listener in self.icon_listeners:
+            listener(display_name, icon_path)
@@ -0,0 +1,299 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from PyQt5.QtGui import QImageReader
+
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.instrumentation import Instrumentation
+
+# The file extensions of the images that are normalized, since the normalized image is always encoded as a JPEG.
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+
+def fit_target(width, height, targets, aspect_tolerance):
+    """
+    Finds the display that an image should be fitted to, using the same rule as the viability filter: the image must be
+    at least as large as the display and its aspect ratio must be within the aspect tolerance of the display.
+
+    :param width: The width of the image in pixels.
+    :param height: The height of the image in pixels.
+    :param targets: The (width, height) of each target display.
+    :param aspect_tolerance: The largest difference between the aspect ratio of an image and a display.
+    :return: The (width, height) of the largest display that the image is viable for, or None if there is none.
+    """
+    viable_targets = [(target_width, target_height) for target_width, target_height in targets
+                      if width >= target_width and height >= target_height and
+                      abs(width / height - target_width / target_height) <= aspect_tolerance]
+
+    return max(viable_targets, key=lambda target: target[0] * target[1], default=None)
+
+
+def normalize_file(path, temporary_folder, targets, aspect_tolerance, quality):
+    """
+    Decodes an image to verify it, crops and scales it to the display it is viable for and encodes it as a JPEG with
+    the given quality. The normalized image is written to a temporary file, so the image file itself is only replaced
+    by the caller. This is run in the worker processes of the image normalizer, so it only uses its arguments.
+
+    Images that are not viable for any display are only scaled down until they cover the largest display. The image is
+    kept as it is if its size does not change and the encoded image is not smaller than the file. Images that are not
+    JPEG files, e.g. PNG images, are only verified and kept as they are, since their file must not contain a JPEG.
+
+    :param path: The path to the image file.
+    :param temporary_folder: The folder that the normalized image is written to.
+    :param targets: The (width, height) of each target display.
+    :param aspect_tolerance: The largest difference between the aspect ratio of an image and a display.
+    :param quality: The JPEG quality from 1 to 100.
+    :return: A dictionary with the path, whether the image is corrupt and, if the image was normalized, the path of the
+    temporary file, which is None if the image was kept, the SHA-256 digest, the dimensions and the size in bytes.
+    """
+    original_size = os.path.getsize(path)
+
+    # Applying the orientation from the EXIF data, which is not kept when the image is encoded again.
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    image_format = bytes(reader.format()).lower()
+    image = reader.read()
+    if image.isNull():
+        return {"path": path, "corrupt": True}
+
+    width, height = image.width(), image.height()
+    if image_format != b"jpeg" or not path.lower().endswith(JPEG_EXTENSIONS):
+        return {"path": path, "corrupt": False, "width": width, "height": height, "temporary_path": None,
+                "digest": None, "size": original_size}
+
+    target = fit_target(width, height, targets, aspect_tolerance)
+
+    if target is not None:
+        # Cropping the center of the image to the aspect ratio of the display, then scaling it to the display.
+        target_width, target_height = target
+        crop_width = min(width, round(height * target_width / target_height))
+        crop_height = min(height, round(width * target_height / target_width))
+        image = image.copy((width - crop_width) // 2, (height - crop_height) // 2, crop_width, crop_height)
+
+        if (crop_width, crop_height) != target:
+            image = image.scaled(target_width, target_height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    else:
+        # Scaling the image down until it just covers the largest display, without changing its aspect ratio.
+        target_width, target_height = max(targets, key=lambda target: target[0] * target[1])
+        if width > target_width and height > target_height:
+            image = image.scaled(target_width, target_height, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "JPG", quality)
+    buffer.close()
+    data = bytes(data)
+
+    result = {"path": path, "corrupt": False, "width": image.width(), "height": image.height()}
+
+    if (image.width(), image.height()) == (width, height) and len(data) >= original_size:
+        result.update(temporary_path=None, digest=None, size=original_size)
+        return result
+
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=temporary_folder, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(data)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+    result.update(temporary_path=temporary_path, digest=hashlib.sha256(data).hexdigest(), size=len(data))
+    return result
+
+
+class ImageNormalizer:
+    """
+    Class for normalizing the downloaded images, i.e. verifying that they can be decoded, fitting them to the display
+    and encoding them again at a configurable quality. Decoding and encoding are CPU bound, so the images are handled
+    by a pool of worker processes instead of threads, which lets several images be normalized at the same time.
+
+    The normalized image is added to the blob store, which links the image file to the new blob atomically, and the old
+    blob is deleted if no other image links to it. The catalog is updated with the new dimensions, size and digest.
+    Images that can not be decoded are removed from the pool right away, so they are never shown.
+
+    :param catalog: The image catalog whose entries are updated.
+    :param blob_store: The blob store that the normalized images are added to.
+    :param worker_count: The number of worker processes, which defaults to the number of processors.
+    """
+    # Every image normalizer, so their worker processes can be stopped when the application quits.
+    normalizers = weakref.WeakSet()
+
+    def __init__(self, catalog, blob_store, worker_count=None):
+        self.catalog = catalog
+        self.blob_store = blob_store
+        self.worker_count = worker_count or os.cpu_count() or 1
+
+        self.instrumentation = Instrumentation.shared()
+
+        # The worker processes are started the first time images are normalized, since starting them takes a while.
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+        # The submitted images that have not been normalized yet, which are cancelled when the normalizer is shut down.
+        self.futures = set()
+        self.closed = False
+
+        ImageNormalizer.normalizers.add(self)
+
+    def process_pool(self):
+        """
+        Returns the pool of worker processes, starting it the first time.
+
+        :raises RuntimeError: If the normalizer has been shut down.
+        """
+        with self.executor_lock:
+            if self.closed:
+                raise RuntimeError("the image normalizer has been shut down")
+
+            if self.executor is None:
+                # Spawning the workers instead of forking, since forking a process with running threads is not safe.
+                self.executor = ProcessPoolExecutor(self.worker_count, multiprocessing.get_context("spawn"))
+
+            return self.executor
+
+    def discard_process_pool(self):
+        """Discards the pool of worker processes after a worker died, so a new pool is started the next time."""
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def shutdown(self):
+        """
+        Cancels the images that are waiting for a worker and stops the worker processes, waiting for the images that
+        are being normalized. Images can not be normalized after the normalizer has been shut down.
+        """
+        with self.executor_lock:
+            self.closed = True
+            executor = self.executor
+            self.executor = None
+
+            for future in self.futures:
+                future.cancel()
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @classmethod
+    def shutdown_all(cls):
+        """Shuts down every image normalizer, e.g. when the application quits so no worker process is left behind."""
+        for normalizer in list(cls.normalizers):
+            normalizer.shutdown()
+
+    def normalize(self, paths, targets, aspect_tolerance, quality):
+        """
+        Normalizes the images with the given paths in the worker processes and replaces the image files with the
+        normalized images.
+
+        :param paths: The paths to the image files.
+        :param targets: The (width, height) of each target display.
+        :param aspect_tolerance: The largest difference between the aspect ratio of an image and a display.
+        :param quality: The JPEG quality from 1 to 100.
+        :return: A dictionary with the number of normalized, re-encoded and failed images, the paths of the corrupt
+        images, which were removed from the pool, the number of bytes that were reclaimed, the duration in seconds and
+        the number of images normalized per second.
+        """
+        start_time = time.perf_counter()
+        report = {"normalized": 0, "reencoded": 0, "failed": 0, "corrupt": [], "reclaimed_bytes": 0}
+
+        if paths:
+            with self.instrumentation.timer("normalize"):
+                updates = []
+                futures = []
+                try:
+                    pool = self.process_pool()
+                    for path in paths:
+                        future = pool.submit(normalize_file, path, self.blob_store.temporary_folder, targets,
+                                             aspect_tolerance, quality)
+                        futures.append(future)
+                        with self.executor_lock:
+                            self.futures.add(future)
+                except (BrokenProcessPool, RuntimeError) as e:
+                    # Not submitting the remaining images if a worker died or the normalizer was shut down.
+                    print("Image normalizer: " + str(e))
+                    if isinstance(e, BrokenProcessPool):
+                        self.discard_process_pool()
+                    report["failed"] += len(paths) - len(futures)
+
+                for future in futures:
+                    try:
+                        self.apply_result(future.result(), report, updates)
+                    except CancelledError:
+                        # The image was cancelled since the normalizer was shut down, so it is normalized next time.
+                        report["failed"] += 1
+                    except BrokenProcessPool as e:
+                        print("Image normalizer: " + str(e))
+                        self.discard_process_pool()
+                        report["failed"] += 1
+                    except Exception as e:
+                        print("Image normalizer: " + str(e))
+                        report["failed"] += 1
+
+                with self.executor_lock:
+                    self.futures.difference_update(futures)
+
+                self.catalog.set_normalized(updates)
+                self.remove_corrupt_images(report["corrupt"])
+
+        report["seconds"] = time.perf_counter() - start_time
+        report["images_per_second"] = report["normalized"] / report["seconds"] if report["seconds"] > 0 else 0.0
+
+        self.instrumentation.count("normalize.images", report["normalized"])
+        self.instrumentation.count("normalize.reencoded", report["reencoded"])
+        self.instrumentation.count("normalize.corrupt", len(report["corrupt"]))
+        self.instrumentation.count("normalize.reclaimed_bytes", report["reclaimed_bytes"])
+
+        return report
+
+    def apply_result(self, result, report, updates):
+        """
+        Replaces an image file with its normalized image and adds the catalog update of the image to the updates.
+
+        :param result: The result of normalize_file().
+        :param report: The report of the normalization, which is updated.
+        :param updates: The list of (path, width, height, size, digest) tuples for ImageCatalog.set_normalized().
+        """
+        if result["corrupt"]:
+            report["corrupt"].append(result["path"])
+            return
+
+        image = self.catalog.get_image(result["path"])
+
+        # Discarding the normalized image if the image was removed while it was normalized.
+        if image is None:
+            if result["temporary_path"] is not None:
+                os.remove(result["temporary_path"])
+            return
+
+        digest = image["digest"]
+        if result["temporary_path"] is not None:
+            self.blob_store.add(result["temporary_path"], result["digest"], result["path"])
+            if digest is not None and digest != result["digest"]:
+                self.blob_store.release(digest)
+
+            digest = result["digest"]
+            report["reencoded"] += 1
+            report["reclaimed_bytes"] += (image["size"] or result["size"]) - result["size"]
+
+        updates.append((result["path"], result["width"], result["height"], result["size"], digest))
+        report["normalized"] += 1
+
+    def remove_corrupt_images(self, paths):
+        """
+        Removes the images that could not be decoded from the catalog, the blob store and the hash index of the pool.
+
+        :param paths: The paths to the image files.
+        """
+        for image in self.catalog.remove_images(paths):
+            self.blob_store.remove(image["path"], image["digest"])
+            HashIndex.shared().remove(image["path"])
@@ -0,0 +1,216 @@
+import functools
+import json
+import re
+import threading
+import time
+
+from reddit_background_changer.settings import Settings
+
+
+class NullTimer:
+    """Timer that does nothing, which is returned while instrumentation is disabled so timing a stage is almost free."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """Context manager that records how long its block took under the given name when the block is left."""
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start_time = 0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        self.instrumentation.record_time(self.name, time.perf_counter() - self.start_time)
+        return False
+
+
+class Instrumentation:
+    """
+    Class for the named timers, counters and gauges that measure the stages of the hot paths of the application, e.g.
+    fetching listing pages, downloading images and changing the background. Timers record the number of calls and the
+    total and largest duration of a stage, counters count events and gauges are functions that are read when the
+    measurements are exported.
+
+    Instrumentation is enabled with the "instrumentation" setting. While it is disabled, timer() returns a timer that
+    does nothing and count() returns right away, so the instrumented code only pays for a single attribute check.
+
+    The measurements can be exported as JSON or in the Prometheus text format.
+    """
+    # The instrumentation that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+
+        # Mapping from the name of each timer to [count, total seconds, max seconds].
+        self.timers = {}
+        # Mapping from the name of each counter to its value.
+        self.counters = {}
+        # Mapping from the name of each gauge to the function that returns its value.
+        self.gauges = {}
+
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """Returns the instrumentation that is shared by the whole application, enabling it from the settings."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                settings = Settings.shared()
+                cls.shared_instance = cls(settings.instrumentation)
+
+                # Following the setting so instrumentation can be turned on and off while the application runs.
+                settings.subscribe(lambda changed_settings: cls.shared_instance.set_enabled(
+                    changed_settings.instrumentation))
+
+            return cls.shared_instance
+
+    def set_enabled(self, enabled):
+        """Enables or disables the instrumentation. The measurements so far are kept."""
+        self.enabled = enabled
+
+    def timer(self, name):
+        """
+        Returns a context manager that times its block under the given name, e.g.
+        "with instrumentation.timer("get_images.listing"):".
+
+        :param name: The name of the timer, where dots separate the parts of the name.
+        :return: The timer, or a timer that does nothing if instrumentation is disabled.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+
+        return Timer(self, name)
+
+    def record_time(self, name, seconds):
+        """Records a duration of the given timer, which can also be used for durations measured elsewhere."""
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def count(self, name, amount=1):
+        """Adds the given amount to the counter with the given name if instrumentation is enabled."""
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, function):
+        """
+        Registers a gauge, whose value is only read when the measurements are exported so it never slows down the
+        application.
+
+        :param name: The name of the gauge.
+        :param function: Function that returns the current value of the gauge.
+        """
+        with self.lock:
+            self.gauges[name] = function
+
+    def reset(self):
+        """Forgets the measurements of the timers and counters."""
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """
+        Returns the current measurements.
+
+        :return: A dictionary with the "timers", as dictionaries with the count and the total, mean and max
+        milliseconds, the "counters" and the "gauges".
+        """
+        with self.lock:
+            timers = {name: {"count": count,
+                             "total_ms": total * 1000,
+                             "mean_ms": total * 1000 / count,
+                             "max_ms": maximum * 1000}
+                      for name, (count, total, maximum) in sorted(self.timers.items())}
+            counters = dict(sorted(self.counters.items()))
+            gauges = dict(sorted(self.gauges.items()))
+
+        # Reading the gauges without the lock since they can take locks of their own.
+        gauge_values = {}
+        for name, function in gauges.items():
+            try:
+                gauge_values[name] = function()
+            except Exception as e:
+                print("Instrumentation: " + name + " " + str(e))
+
+        return {"enabled": self.enabled, "timers": timers, "counters": counters, "gauges": gauge_values}
+
+    def to_json(self):
+        """Returns the current measurements as JSON."""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns the current measurements in the Prometheus text format. Timers are exported as summaries without
+        quantiles, counters as counters and gauges as gauges, all prefixed with "reddit_background_changer_".
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, timer in snapshot["timers"].items():
+            metric = prometheus_name(name) + "_seconds"
+            lines.append("# TYPE {} summary".format(metric))
+            lines.append("{}_count {}".format(metric, timer["count"]))
+            lines.append("{}_sum {}".format(metric, timer["total_ms"] / 1000))
+
+        for name, value in snapshot["counters"].items():
+            metric = prometheus_name(name) + "_total"
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, value))
+
+        for name, value in snapshot["gauges"].items():
+            metric = prometheus_name(name)
+            lines.append("# TYPE {} gauge".format(metric))
+            lines.append("{} {}".format(metric, value))
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        Writes the current measurements to the given file, in the Prometheus text format if the file ends with ".prom"
+        and as JSON otherwise.
+        """
+        with open(path, "w") as export_file:
+            export_file.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+def prometheus_name(name):
+    """Converts the name of a measurement, e.g. "get_images.listing", to a valid Prometheus metric name."""
+    return "reddit_background_changer_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def timed(name):
+    """
+    Decorator that times every call of the decorated function with the shared instrumentation under the given name.
+    The setting is checked on each call, so the decorated function only pays for the check while it is disabled.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Instrumentation.shared().timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,338 @@
+import heapq
+import itertools
+import threading
+
+from reddit_background_changer.instrumentation import Instrumentation
+from reddit_background_changer.settings import Settings
+
+# The priorities of the jobs, where jobs with a lower priority are started first. Work that the user is waiting for is
+# started before the scheduled refreshes that are waiting.
+USER_PRIORITY = 0
+REFRESH_PRIORITY = 1
+
+
+class Job:
+    """
+    Class for a single job of the job manager, e.g. getting the images of a subreddit. Jobs are cancelled cooperatively
+    by setting the cancel event, which the function of the job checks while it works if it was submitted as cancellable.
+
+    :param key: The key of the job, e.g. the lowercase name of the subreddit. Jobs with the same key run one at a time.
+    :param function: The function that does the work of the job.
+    :param args: The arguments that the function is called with.
+    :param priority: The priority of the job, USER_PRIORITY or REFRESH_PRIORITY.
+    """
+    def __init__(self, key, function, args, priority):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.priority = priority
+
+        # The keyword arguments that the function is called with, e.g. the progress callback.
+        self.kwargs = {}
+
+        # Functions that are called with the job when it is finished, also if it was cancelled or failed.
+        self.done_callbacks = []
+
+        # The job is "pending" until a worker starts it, "running" while it works and then "done", "failed" or
+        # "cancelled".
+        self.state = "pending"
+        self.cancel_event = threading.Event()
+
+        self.result = None
+        self.error = None
+
+    def cancel(self):
+        """Asks the job to stop. A pending job is never started and a running job stops at its next check."""
+        self.cancel_event.set()
+
+    def cancelled(self):
+        """Returns true if the job has been asked to stop."""
+        return self.cancel_event.is_set()
+
+    def is_duplicate(self, function, args):
+        """Returns true if the job does the same work as a job with the given function and arguments would."""
+        return self.function == function and self.args == args
+
+
+class JobManager:
+    """
+    Class for running the work of the application on a small pool of worker threads, e.g. getting and deleting the
+    images of subreddits for the main window and for the refresh scheduler. Replaces handing each piece of work to its
+    own worker, which could neither be cancelled nor tell that the same subreddit was already being fetched.
+
+    Jobs are started in the order of their priority and then in the order they were submitted. Jobs with the same key
+    run one at a time in the order they were submitted, so e.g. deleting a subreddit never runs at the same time as
+    getting its images. A job that does the same work as a job that is pending or running is coalesced with it instead
+    of doing the work twice, and a job can supersede the jobs with the same key, which cancels them.
+
+    The callbacks of a job are called from the worker thread, so the main window passes the emit functions of Qt signals
+    that are delivered to the main thread.
+
+    :param worker_count: The number of jobs that can run at the same time.
+    """
+    # The job manager that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, worker_count=2):
+        # The heap of (priority, sequence, job) entries of the pending jobs. A job whose priority is raised gets a new
+        # entry, and the entries that no longer match their job are skipped.
+        self.queue = []
+        self.sequence = itertools.count()
+
+        # Mapping from the key of each job to its pending and running jobs in the order they were submitted.
+        self.jobs = {}
+
+        # Mapping from the key of each running job to the job.
+        self.running = {}
+
+        self.condition = threading.Condition()
+
+        self.cancelled_jobs = 0
+        self.coalesced_jobs = 0
+
+        instrumentation = Instrumentation.shared()
+        instrumentation.set_gauge("jobs.queued", lambda: self.metrics()["queued"])
+        instrumentation.set_gauge("jobs.running", lambda: self.metrics()["running"])
+
+        # Starting the workers as daemon threads so they do not keep the application alive when it is closed.
+        self.workers = []
+        for _ in range(max(worker_count, 1)):
+            worker = threading.Thread(target=self.work_loop, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    @classmethod
+    def shared(cls):
+        """Returns the job manager that is shared by the whole application, creating it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls(Settings.shared().refresh_workers)
+
+            return cls.shared_instance
+
+    def submit(self, key, function, *args, priority=USER_PRIORITY, supersede=False, cancellable=False,
+               progress_callback=None, done_callback=None):
+        """
+        Submits a job, or coalesces it with a pending or running job with the same key that does the same work.
+
+        :param key: The key of the job, e.g. the lowercase name of the subreddit.
+        :param function: The function that does the work of the job.
+        :param args: The arguments that the function is called with.
+        :param priority: The priority of the job. A coalesced pending job gets the highest priority of the two.
+        :param supersede: If true the other pending and running jobs with the same key are cancelled, e.g. since the
+        subreddit is deleted or its configuration was changed.
+        :param cancellable: If true the function is called with the cancel event of the job as "cancel_event".
+        :param progress_callback: If given the function is called with it as "progress_callback".
+        :param done_callback: Function that is called with the job when it is finished.
+        :return: The job, which is the existing job if the job was coalesced.
+        """
+        return self.submit_many([(key, function, args)], priority=priority, supersede=supersede,
+                                cancellable=cancellable, progress_callback=progress_callback,
+                                done_callback=done_callback)[0]
+
+    def submit_many(self, jobs, priority=USER_PRIORITY, supersede=False, cancellable=False, progress_callback=None,
+                    done_callback=None):
+        """
+        Submits a batch of jobs with the same options at once, e.g. the fetches of the subreddits that were imported.
+        The queue is only locked once and the workers are woken up once for the whole batch. See submit().
+
+        :param jobs: The jobs as a list of (key, function, args) tuples.
+        :return: The jobs in the same order, where coalesced jobs are the existing jobs.
+        """
+        submitted_jobs = []
+
+        # The pending jobs that are cancelled by superseding them, whose done callbacks are called after the lock.
+        cancelled_jobs = []
+
+        with self.condition:
+            for key, function, args in jobs:
+                job = self.find_duplicate(key, function, args, priority, progress_callback, done_callback)
+                if job is None:
+                    if supersede:
+                        cancelled_jobs += [job for job in list(self.jobs.get(key, [])) if self.cancel_job(job)]
+
+                    job = Job(key, function, args, priority)
+                    if cancellable:
+                        job.kwargs["cancel_event"] = job.cancel_event
+                    if progress_callback is not None:
+                        job.kwargs["progress_callback"] = progress_callback
+                    if done_callback is not None:
+                        job.done_callbacks.append(done_callback)
+
+                    self.jobs.setdefault(key, []).append(job)
+                    heapq.heappush(self.queue, (priority, next(self.sequence), job))
+
+                submitted_jobs.append(job)
+
+            self.condition.notify_all()
+
+        for cancelled_job in cancelled_jobs:
+            self.call_done_callbacks(cancelled_job)
+
+        return submitted_jobs
+
+    def find_duplicate(self, key, function, args, priority, progress_callback, done_callback):
+        """
+        Finds a pending or running job with the given key that does the same work and coalesces the new job with it.
+        Requires the condition.
+
+        :return: The existing job or None if there is no job that does the same work.
+        """
+        for job in self.jobs.get(key, []):
+            if job.is_duplicate(function, args) and not job.cancelled():
+                self.coalesced_jobs += 1
+                if done_callback is not None:
+                    job.done_callbacks.append(done_callback)
+
+                # Starting the pending job sooner if work that the user is waiting for is coalesced with it.
+                if job.state == "pending" and priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(self.queue, (priority, next(self.sequence), job))
+                if progress_callback is not None and "progress_callback" not in job.kwargs:
+                    job.kwargs["progress_callback"] = progress_callback
+
+                return job
+
+        return None
+
+    def cancel(self, key):
+        """
+        Cancels the pending and running jobs with the given key without waiting for them to stop.
+
+        :return: The number of cancelled jobs, i.e. the pending jobs that were removed and the running jobs that were
+        asked to stop. Jobs that were already cancelled are not counted.
+        """
+        # The pending jobs that were removed, whose done callbacks are called after the lock, and the number of running
+        # jobs that were asked to stop.
+        cancelled_jobs = []
+        stopping_jobs = 0
+
+        with self.condition:
+            for job in list(self.jobs.get(key, [])):
+                if job.cancelled():
+                    continue
+
+                if self.cancel_job(job):
+                    cancelled_jobs.append(job)
+                else:
+                    stopping_jobs += 1
+
+        for job in cancelled_jobs:
+            self.call_done_callbacks(job)
+
+        return len(cancelled_jobs) + stopping_jobs
+
+    def cancel_job(self, job):
+        """
+        Cancels the given job, removing it from its key right away if it is pending. Requires the condition.
+
+        :return: True if the job was pending, in which case it is finished and its done callbacks should be called.
+        """
+        if job.cancelled():
+            return False
+
+        job.cancel()
+        self.cancelled_jobs += 1
+
+        if job.state != "pending":
+            return False
+
+        job.state = "cancelled"
+        self.remove_job(job)
+        return True
+
+    def remove_job(self, job):
+        """Removes a finished or cancelled job from its key. Requires the condition."""
+        key_jobs = self.jobs.get(job.key, [])
+        if job in key_jobs:
+            key_jobs.remove(job)
+        if not key_jobs:
+            self.jobs.pop(job.key, None)
+
+        # Waking up the workers since the next job with the same key can be started now.
+        self.condition.notify_all()
+
+    def next_job(self):
+        """
+        Waits for the pending job with the highest priority whose key has no running job and marks it as running.
+        Jobs with the same key are started in the order they were submitted.
+        """
+        with self.condition:
+            while True:
+                skipped = []
+                job = None
+
+                while self.queue:
+                    entry = heapq.heappop(self.queue)
+                    candidate = entry[2]
+
+                    # Skipping the entries of jobs that were cancelled, started or given a higher priority.
+                    if candidate.state != "pending" or entry[0] != candidate.priority:
+                        continue
+
+                    # Waiting for the earlier jobs with the same key, which are also the running job of the key.
+                    if self.jobs[candidate.key][0] is not candidate:
+                        skipped.append(entry)
+                        continue
+
+                    job = candidate
+                    break
+
+                for entry in skipped:
+                    heapq.heappush(self.queue, entry)
+
+                if job is not None:
+                    job.state = "running"
+                    self.running[job.key] = job
+                    return job
+
+                self.condition.wait()
+
+    def work_loop(self):
+        """Continuously runs the next job and records its result."""
+        while True:
+            job = self.next_job()
+
+            try:
+                job.result = job.function(*job.args, **job.kwargs)
+                state = "cancelled" if job.cancelled() else "done"
+            except Exception as e:
+                print("Job manager: " + job.key + " " + str(e))
+                job.error = e
+                state = "failed"
+
+            with self.condition:
+                job.state = state
+                self.running.pop(job.key, None)
+                self.remove_job(job)
+
+            self.call_done_callbacks(job)
+
+    @staticmethod
+    def call_done_callbacks(job):
+        """Calls the done callbacks of a finished job."""
+        for done_callback in job.done_callbacks:
+            try:
+                done_callback(job)
+            except Exception as e:
+                print("Job manager: " + str(e))
+
+    def wait_until_idle(self):
+        """Waits until every pending and running job is finished, e.g. before the command line interface exits."""
+        with self.condition:
+            while self.jobs:
+                self.condition.wait()
+
+    def has_job(self, key):
+        """Returns true if there is a pending or running job with the given key."""
+        with self.condition:
+            return key in self.jobs
+
+    def metrics(self):
+        """Returns the number of queued and running jobs and the number of cancelled and coalesced jobs."""
+        with self.condition:
+            return {"queued": sum(len(key_jobs) for key_jobs in self.jobs.values()) - len(self.running),
+                    "running": len(self.running),
+                    "cancelled": self.cancelled_jobs,
+                    "coalesced": self.coalesced_jobs}
@@ -0,0 +1,293 @@
+import json
+import threading
+import time
+
+from reddit_background_changer.image_catalog import from_signed_hash, to_signed_hash
+from reddit_background_changer.instrumentation import Instrumentation
+from reddit_background_changer.viability_filter import VIABLE
+
+# The number of seconds that a cached listing is used for, per time filter. Listings over short time filters change
+# quickly, and every listing expires well before the refresh scheduler refreshes the subreddit again.
+LISTING_TTLS = {
+    "hour": 15 * 60,
+    "day": 2 * 3600,
+    "week": 8 * 3600,
+    "month": 24 * 3600,
+    "year": 48 * 3600,
+    "all": 96 * 3600
+}
+
+# The number of submissions in a page and the maximum number of submissions that reddit returns for a listing.
+PAGE_SIZE = 100
+MAX_LISTING_SIZE = 1000
+
+
+class ListingCache:
+    """
+    Class for caching the top listings of subreddits, keyed by subreddit and time filter. Each page of a listing is
+    stored together with the "after" cursor of the next page, and each submission is stored with the size of its image,
+    the result of the size checks of the viability filter and the perceptual hash of its thumbnail once it is known.
+    Getting the images again, e.g. after the number of images was increased, then walks the cached pages and continues
+    from the cursor of the last cached page instead of walking the listing from the top.
+
+    The listings are stored in the image catalog so they persist between runs, and expire according to their time
+    filter. The size checks depend on the thresholds of the viability filter, so a page is checked again if the
+    thresholds changed. The blacklist is checked every time the page is walked since it changes more often.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.instrumentation = Instrumentation.shared()
+
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS listing_pages (
+                    subreddit TEXT NOT NULL COLLATE NOCASE,
+                    time_filter TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    next_after TEXT,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (subreddit, time_filter, page)
+                );
+
+                CREATE TABLE IF NOT EXISTS listing_entries (
+                    subreddit TEXT NOT NULL COLLATE NOCASE,
+                    time_filter TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    fullname TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    preview TEXT,
+                    viable INTEGER NOT NULL,
+                    geometry TEXT NOT NULL,
+                    phash INTEGER,
+                    media INTEGER NOT NULL DEFAULT 0,
+                    video INTEGER NOT NULL DEFAULT 0,
+                    rejection INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (subreddit, time_filter, position)
+                );
+            """)
+
+            # Adding the columns of the viability filter to caches that were created before they existed. The cached
+            # listings do not have the flags, so they are dropped and fetched again.
+            columns = [row["name"] for row in self.catalog.connection.execute("PRAGMA table_info(listing_entries)")]
+            if "rejection" not in columns:
+                self.catalog.connection.execute("DELETE FROM listing_pages")
+                self.catalog.connection.execute("DELETE FROM listing_entries")
+                for column in ("media", "video", "rejection"):
+                    self.catalog.connection.execute(
+                        "ALTER TABLE listing_entries ADD COLUMN " + column + " INTEGER NOT NULL DEFAULT 0")
+
+        # The number of pages that were served from the cache and fetched from reddit, and the number of thumbnail
+        # hashes that were found in the cache and computed.
+        self.page_hits = 0
+        self.page_misses = 0
+        self.hash_hits = 0
+        self.hash_misses = 0
+        self.metrics_lock = threading.Lock()
+
+    def entries(self, reddit, subreddit, time_filter, viability_filter):
+        """
+        Generates the submissions in the top listing of the given subreddit, from the cache where possible. Pages that
+        are not cached are fetched when they are reached, so stopping early does not fetch the rest of the listing. Each
+        page is checked by the viability filter as a whole before its submissions are generated.
+
+        :param reddit: The praw reddit instance used to fetch the pages that are not cached.
+        :param subreddit: The name of the subreddit.
+        :param time_filter: The time filter of the listing, e.g. "week".
+        :param viability_filter: The ViabilityFilter that checks the submissions and counts the rejections.
+        :return: A generator of dictionaries with the "fullname", "width", "height", "preview", "viable" and "phash" of
+        each submission, where the preview is None if the submission is not an image hosted on reddit.
+        """
+        self.expire(subreddit, time_filter)
+        signature = viability_filter.signature()
+
+        after = None
+        for page in range(MAX_LISTING_SIZE // PAGE_SIZE):
+            cached_page = self.get_page(subreddit, time_filter, page)
+
+            with self.metrics_lock:
+                if cached_page is None:
+                    self.page_misses += 1
+                else:
+                    self.page_hits += 1
+
+            if cached_page is None:
+                cached_page = self.fetch_page(reddit, subreddit, time_filter, page, after)
+
+            after, entries = cached_page
+
+            # Checking the sizes of the whole page again if it was checked with other thresholds.
+            if any(entry["geometry"] != signature for entry in entries):
+                codes = viability_filter.check_sizes([entry["width"] or 0 for entry in entries],
+                                                     [entry["height"] or 0 for entry in entries],
+                                                     [entry["media"] for entry in entries],
+                                                     [entry["video"] for entry in entries])
+                for entry, code in zip(entries, codes):
+                    entry["rejection"] = int(code)
+                    entry["geometry"] = signature
+
+                self.update_rejections(subreddit, time_filter, entries)
+
+            codes = viability_filter.check_blacklist([entry["fullname"] for entry in entries],
+                                                     [entry["rejection"] for entry in entries])
+            for entry, code in zip(entries, codes):
+                entry["viable"] = code == VIABLE
+
+                yield entry
+
+            # Stopping at the end of the listing.
+            if after is None:
+                return
+
+    def get_page(self, subreddit, time_filter, page):
+        """
+        Returns the cached page of the given listing.
+
+        :return: A tuple with the cursor of the next page and the entries of the page, or None if it is not cached.
+        """
+        with self.catalog.lock:
+            page_row = self.catalog.connection.execute(
+                "SELECT next_after FROM listing_pages WHERE subreddit = ? AND time_filter = ? AND page = ?",
+                (subreddit, time_filter, page)).fetchone()
+
+            if page_row is None:
+                return None
+
+            rows = self.catalog.connection.execute(
+                "SELECT position, fullname, width, height, preview, media, video, rejection, geometry, phash "
+                "FROM listing_entries "
+                "WHERE subreddit = ? AND time_filter = ? AND position >= ? AND position < ? ORDER BY position",
+                (subreddit, time_filter, page * PAGE_SIZE, (page + 1) * PAGE_SIZE)).fetchall()
+
+        return page_row["next_after"], [{"position": row["position"],
+                                         "fullname": row["fullname"],
+                                         "width": row["width"],
+                                         "height": row["height"],
+                                         "preview": json.loads(row["preview"]) if row["preview"] else None,
+                                         "media": bool(row["media"]),
+                                         "video": bool(row["video"]),
+                                         "rejection": row["rejection"],
+                                         "geometry": row["geometry"],
+                                         "phash": from_signed_hash(row["phash"])} for row in rows]
+
+    def fetch_page(self, reddit, subreddit, time_filter, page, after):
+        """
+        Fetches a page of the given listing from reddit and caches it. The submissions of the page have not been checked
+        by the viability filter yet, which is done by entries() for the whole page.
+
+        :return: A tuple with the cursor of the next page and the entries of the page.
+        """
+        parameters = {"t": time_filter, "limit": PAGE_SIZE}
+        if after is not None:
+            parameters["after"] = after
+
+        with self.instrumentation.timer("get_images.listing_page"):
+            listing = reddit.get("r/" + subreddit + "/top", params=parameters)
+
+        entries = []
+        for submission in listing:
+            preview_image = submission_preview(submission)
+
+            entries.append({"position": page * PAGE_SIZE + len(entries),
+                            "fullname": submission.name,
+                            "width": preview_image["source"]["width"] if preview_image else None,
+                            "height": preview_image["source"]["height"] if preview_image else None,
+                            "preview": preview_image,
+                            "media": bool(getattr(submission, "is_reddit_media_domain", False)),
+                            "video": getattr(submission, "is_video", False) is not False,
+                            "rejection": VIABLE,
+                            "geometry": "",
+                            "phash": None})
+
+        # The listing ends if reddit does not return a cursor or the page is not full.
+        next_after = listing.after if len(entries) == PAGE_SIZE else None
+
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.execute(
+                "INSERT OR REPLACE INTO listing_pages (subreddit, time_filter, page, next_after, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)", (subreddit, time_filter, page, next_after, time.time()))
+            self.catalog.connection.executemany(
+                "INSERT OR REPLACE INTO listing_entries (subreddit, time_filter, position, fullname, width, height, "
+                "preview, media, video, rejection, viable, geometry, phash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, '', NULL)",
+                [(subreddit, time_filter, entry["position"], entry["fullname"], entry["width"], entry["height"],
+                  json.dumps(entry["preview"]) if entry["preview"] else None, entry["media"], entry["video"])
+                 for entry in entries])
+
+        return next_after, entries
+
+    def update_rejections(self, subreddit, time_filter, entries):
+        """Stores the results of the size checks of the given entries, which were checked with new thresholds."""
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.executemany(
+                "UPDATE listing_entries SET rejection = ?, viable = ?, geometry = ? "
+                "WHERE subreddit = ? AND time_filter = ? AND position = ?",
+                [(entry["rejection"], entry["rejection"] == VIABLE, entry["geometry"], subreddit, time_filter,
+                  entry["position"]) for entry in entries])
+
+    def set_hash(self, subreddit, time_filter, position, phash):
+        """Caches the perceptual hash of the thumbnail of a submission."""
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.execute(
+                "UPDATE listing_entries SET phash = ? WHERE subreddit = ? AND time_filter = ? AND position = ?",
+                (to_signed_hash(phash), subreddit, time_filter, position))
+
+    def record_hash_lookup(self, hit):
+        """Records whether the thumbnail hash of a submission was found in the cache."""
+        with self.metrics_lock:
+            if hit:
+                self.hash_hits += 1
+            else:
+                self.hash_misses += 1
+
+    def expire(self, subreddit, time_filter):
+        """Removes the given listing if its first page is older than the time to live of its time filter."""
+        with self.catalog.lock:
+            fetched_at = self.catalog.connection.execute(
+                "SELECT fetched_at FROM listing_pages WHERE subreddit = ? AND time_filter = ? AND page = 0",
+                (subreddit, time_filter)).fetchone()
+
+        if fetched_at is not None and fetched_at[0] + LISTING_TTLS.get(time_filter, 3600) < time.time():
+            self.remove(subreddit, time_filter)
+
+    def remove(self, subreddit, time_filter=None):
+        """Removes the cached listings of the given subreddit, either for a single time filter or for all of them."""
+        condition = "subreddit = ?" + (" AND time_filter = ?" if time_filter is not None else "")
+        parameters = (subreddit,) + ((time_filter,) if time_filter is not None else ())
+
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.execute("DELETE FROM listing_pages WHERE " + condition, parameters)
+            self.catalog.connection.execute("DELETE FROM listing_entries WHERE " + condition, parameters)
+
+    def metrics(self):
+        """
+        Returns the number of hits and misses and the hit rates of the cached pages and thumbnail hashes.
+
+        :return: A dictionary with the metrics, where the hit rates are None if nothing has been looked up.
+        """
+        with self.metrics_lock:
+            page_lookups = self.page_hits + self.page_misses
+            hash_lookups = self.hash_hits + self.hash_misses
+
+            return {"page_hits": self.page_hits,
+                    "page_misses": self.page_misses,
+                    "page_hit_rate": self.page_hits / page_lookups if page_lookups else None,
+                    "hash_hits": self.hash_hits,
+                    "hash_misses": self.hash_misses,
+                    "hash_hit_rate": self.hash_hits / hash_lookups if hash_lookups else None}
+
+
+def submission_preview(submission):
+    """
+    Returns the preview image of the given submission if it is an image hosted on the reddit media domain.
+
+    :param submission: The reddit submission.
+    :return: The preview image, i.e. submission.preview["images"][0], or None if the submission is not an image.
+    """
+    try:
+        if submission.is_reddit_media_domain and submission.is_video is False:
+            return submission.preview["images"][0]
+    except (AttributeError, KeyError, IndexError):
+        pass
+
+    return None
@@ -1,33 +1,77 @@
+import multiprocessing
 import sys
+import time
 
-from PyQt5 import QtWidgets, QtGui
-from PyQt5.QtWinExtras import QtWin
+# Recording the start time before the Qt modules are imported so the startup profile includes importing them.
+START_TIME = time.perf_counter()
 
-from reddit_background_changer.background_changer import BackgroundChanger
-from reddit_background_changer.main_window import MainWindow
-from reddit_background_changer.system_tray import SystemTray
+from PyQt5 import QtWidgets, QtGui  # noqa: E402
+from PyQt5.QtCore import QTimer  # noqa: E402
+
+from reddit_background_changer.background_changer import BackgroundChanger  # noqa: E402
+from reddit_background_changer.image_normalizer import ImageNormalizer  # noqa: E402
+from reddit_background_changer.refresh_scheduler import RefreshScheduler  # noqa: E402
+from reddit_background_changer.settings import Settings  # noqa: E402
+from reddit_background_changer.settings_watcher import SettingsWatcher  # noqa: E402
+from reddit_background_changer.startup_profile import StartupProfile  # noqa: E402
+from reddit_background_changer.storage import create_storage_setup, load_subreddits  # noqa: E402
+from reddit_background_changer.system_tray import SystemTray  # noqa: E402
 
 
 def main():
+    # Recording how long it takes until the tray icon is shown.
+    startup_profile = StartupProfile(START_TIME)
+    startup_profile.mark("imports")
+
     app = QtWidgets.QApplication(sys.argv)
     app.setWindowIcon(QtGui.QIcon('../resources/reddit_icon.ico'))
 
-    # Changing the app id so our custom window icon is shown on the toolbar.
-    QtWin.setCurrentProcessExplicitAppUserModelID('reddit_background_changer.v1.0')
+    # Changing the app id so our custom window icon is shown on the toolbar. This is only needed on Windows.
+    if sys.platform == "win32":
+        from PyQt5.QtWinExtras import QtWin
+        QtWin.setCurrentProcessExplicitAppUserModelID('reddit_background_changer.v1.0')
 
     # Ensuring that we do not stop the application when the main window is closed.
     app.setQuitOnLastWindowClosed(False)
 
+    # Stopping the worker processes that normalize the downloaded images when the application quits.
+    app.aboutToQuit.connect(ImageNormalizer.shutdown_all)
+    startup_profile.mark("application")
+
+    # Setting up the folder structure and the image catalog before anything reads from them.
+    create_storage_setup()
+    startup_profile.mark("storage")
+
     # Setting up the background changer that will be used in the main window and the system tray.
     # We use the absolute path since it is required when changing the background on windows.
     background_changer = BackgroundChanger()
+    startup_profile.mark("background changer")
+
+    # Restarting the background changer timer whenever the change frequency is changed in the shared settings.
+    settings_watcher = SettingsWatcher(Settings.shared())
+    settings_watcher.changed.connect(background_changer.update_frequency)
 
-    main_window = MainWindow(background_changer)
-    system_tray = SystemTray(background_changer, main_window, app)
+    system_tray = SystemTray(background_changer, app)
+    startup_profile.mark("tray")
+
+    # Periodically refreshing the images of every subreddit in the subreddit list so the pool does not go stale.
+    refresh_scheduler = RefreshScheduler(load_subreddits).start()
+
+    # Only starting in the tray when started with --tray, e.g. on login, in which case the main window is created the
+    # first time it is opened.
+    if "--tray" not in sys.argv:
+        system_tray.show_main_window()
+        startup_profile.mark("main window")
+
+    # Reporting the startup profile once the event loop has handled the first events, i.e. once the tray icon is shown.
+    QTimer.singleShot(0, startup_profile.finish)
 
-    main_window.show()
     sys.exit(app.exec_())
 
 
 if __name__ == '__main__':
+    # Letting the worker processes of the image normalizer run their work instead of the application when the
+    # application is frozen by PyInstaller, since they are started with the executable.
+    multiprocessing.freeze_support()
+
     main()
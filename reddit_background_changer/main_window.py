@@ -1,13 +1,16 @@
-import json
-import os
-import pathlib
-
-from PyQt5 import QtWidgets, uic
-from PyQt5.QtCore import QThreadPool
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt, QTimer
 
+from reddit_background_changer.gallery_window import GalleryWindow
+from reddit_background_changer.job_manager import JobManager, USER_PRIORITY
+from reddit_background_changer.performance_panel import PerformancePanel
 from reddit_background_changer.settings_dialog import SettingsDialog
+from reddit_background_changer.reddit_client import RedditClient
+from reddit_background_changer.storage import load_subreddits, save_subreddits
+from reddit_background_changer.subreddit_import import parse_subreddit_list
+from reddit_background_changer.ui_loader import load_ui
 from reddit_background_changer.subreddit_model import SubredditModel
-from reddit_background_changer.worker import Worker
+from reddit_background_changer.worker import WorkerSignals
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -17,35 +20,91 @@ class MainWindow(QtWidgets.QMainWindow):
     def __init__(self, background_changer, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
 
-        # Load the UI Page
-        uic.loadUi("../resources/mainwindow.ui", self)
-
-        self.create_storage_setup()
+        # Load the UI Page from the precompiled ui module.
+        load_ui("../resources/mainwindow.ui", self)
 
         # Setting up the internal model that handles the list of subreddits.
         self.model = SubredditModel(self)
         self.load_subreddits()
         self.subredditView.setModel(self.model)
 
+        # Refilling the subreddits in the list model after images are evicted, since the subreddit list file is only
+        # saved shortly after the last change, e.g. a subreddit that was just deleted would otherwise be refilled.
+        self.model.image_getter.set_subreddit_source(lambda: [tuple(config) for config in self.model.subreddits])
+
         # Connecting buttons to the corresponding functionality.
         self.addButton.clicked.connect(self.add)
         self.updateButton.clicked.connect(self.update_subreddit)
         self.deleteButton.clicked.connect(self.delete)
 
-        # Used to restart the timer if the change frequency was changed in the settings.
         self.background_changer = background_changer
 
-        self.settings_dialog = SettingsDialog(background_changer)
-        self.settingsButton.clicked.connect(self.settings_dialog.show)
+        # The settings dialog is created the first time it is opened since most sessions never open it.
+        self.settings_dialog = None
+        self.settingsButton.clicked.connect(self.show_settings_dialog)
 
         # Updating the shown subreddit settings in the UI when a subreddit from the listView is selected.
         self.subredditView.selectionModel().selectionChanged.connect(self.update_settings)
 
-        # Setting up the thread pool that will handle the threads that are created when getting images.
-        self.threadpool = QThreadPool()
-
-        # Number that keeps track of how many workers that are currently getting images from reddit.
-        self.getting_images = 0
+        # The shared job manager that gets and deletes the images in its worker threads, which is also used by the
+        # refresh scheduler so a subreddit is never fetched twice at the same time.
+        self.job_manager = JobManager.shared()
+
+        # The jobs report their progress and results through signals since the GUI can only be updated from the main
+        # thread.
+        self.job_signals = WorkerSignals()
+        self.job_signals.progress.connect(self.show_progress)
+        self.job_signals.result.connect(self.show_sync_result)
+
+        # The import job parses the imported list and looks up the subreddits, which can make requests to reddit.
+        self.import_signals = WorkerSignals()
+        self.import_signals.result.connect(self.import_finished)
+
+        # Saving the subreddit list shortly after the last change instead of after every change, so e.g. importing or
+        # deleting several subreddits in a row writes the file once. The pending save is written when the app quits.
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(500)
+        self.save_timer.timeout.connect(self.write_subreddits)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.flush_subreddits)
+
+        # The performance panel is docked at the bottom of the window and hidden until it is opened from the status bar.
+        self.performance_panel = PerformancePanel(self)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.performance_panel)
+        self.performance_panel.hide()
+
+        performance_button = QtWidgets.QPushButton("Performance")
+        performance_button.setFlat(True)
+        performance_button.clicked.connect(self.performance_panel.toggleViewAction().trigger)
+        self.statusBar().addPermanentWidget(performance_button)
+
+        # The gallery is created the first time it is opened, so the thumbnail workers are only started when needed.
+        self.gallery_window = None
+
+        gallery_button = QtWidgets.QPushButton("Gallery")
+        gallery_button.setFlat(True)
+        gallery_button.clicked.connect(self.show_gallery_window)
+        self.statusBar().addPermanentWidget(gallery_button)
+
+        import_button = QtWidgets.QPushButton("Import")
+        import_button.setFlat(True)
+        import_button.clicked.connect(self.import_subreddits)
+        self.statusBar().addPermanentWidget(import_button)
+
+    def show_settings_dialog(self):
+        """Shows the settings dialog, creating it the first time it is opened."""
+        if self.settings_dialog is None:
+            self.settings_dialog = SettingsDialog()
+
+        self.settings_dialog.show()
+
+    def show_gallery_window(self):
+        """Shows the gallery of the images in the pool, creating it the first time it is opened."""
+        if self.gallery_window is None:
+            self.gallery_window = GalleryWindow(self.model.image_getter, self.job_manager)
+
+        self.gallery_window.show()
+        self.gallery_window.raise_()
 
     def add(self):
         """
@@ -60,9 +119,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # If there is something to add.
         if name != "" and number_of_images != 0:
-            # Updating the model and emitting that the layout has been changed.
-            self.model.subreddits.append((name, time_limit, number_of_images))
-            self.model.layoutChanged.emit()
+            # Inserting the row into the model, which does nothing if the subreddit is already in the list.
+            if not self.model.add_subreddits([(name, time_limit, number_of_images)]):
+                self.statusBar().showMessage("/r/{} is already in the list".format(name), 5000)
+                return
 
             # Clearing the configuration settings
             self.subredditEdit.clear()
@@ -70,9 +130,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.numberSpinBox.setValue(0)
 
             # Adding the images and icon corresponding to the new subreddit to the image folder.
-            # This is done in a new thread to ensure that the GUI is responsive even when getting images.
-            worker = Worker(self.model.get_images, (name, time_limit, number_of_images), "../data/images/")
-            self.threadpool.start(worker)
+            # This is done in a job to ensure that the GUI is responsive even when getting images.
+            self.start_image_job((name, time_limit, number_of_images))
 
             self.save_subreddits()
 
@@ -92,8 +151,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # If something is selected.
         if index:
-            # Deleting the images and icon corresponding to the deleted subreddit from the image and icon folders.
-            self.model.delete_images(self.model.subreddits[index.row()][0])
+            old_config = tuple(self.model.subreddits[index.row()])
 
             # Getting the new configuration settings.
             new_name = self.subredditEdit.text()
@@ -101,13 +159,15 @@ class MainWindow(QtWidgets.QMainWindow):
             new_number_of_images = self.numberSpinBox.value()
 
             # Updating the currently selected subreddit and emits the change.
-            self.model.subreddits[index.row()] = (new_name, new_time_limit, new_number_of_images)
-            self.model.dataChanged.emit(index, index)
+            self.model.set_subreddit(index.row(), (new_name, new_time_limit, new_number_of_images))
 
-            # Adding the images and icon corresponding to the new subreddit to the image folder.
-            # This is done in a new thread to ensure that the GUI is responsive even when getting images.
-            worker = Worker(self.model.get_images, (new_name, new_time_limit, new_number_of_images), "../data/images/")
-            self.threadpool.start(worker)
+            # Deleting the images of the old subreddit if the subreddit was changed, cancelling its current fetch.
+            if old_config[0].lower() != new_name.lower():
+                self.start_delete_job(old_config[0])
+
+            # Changing the images on disk to the new configuration, only downloading the images that are missing. A
+            # fetch with the old configuration is cancelled since its images would be synced again right away.
+            self.start_image_job((new_name, new_time_limit, new_number_of_images), supersede=True)
 
             self.save_subreddits()
 
@@ -126,15 +186,120 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # If something is selected.
         if index:
-            # Deleting the images and icon corresponding to the deleted subreddit from the image and icon folders.
-            self.model.delete_images(self.model.subreddits[index.row()][0])
+            name = self.model.subreddits[index.row()][0]
 
-            # Deleting the subreddit from the internal list model and emitting the layout change.
-            del self.model.subreddits[index.row()]
-            self.model.layoutChanged.emit()
+            # Deleting the subreddit from the internal list model, which only removes its row from the view.
+            self.model.remove_subreddit(index.row())
 
             self.save_subreddits()
 
+            # Deleting the images and icon corresponding to the deleted subreddit from the image and icon folders. The
+            # current fetch of the subreddit is cancelled and the images are deleted once it has stopped.
+            self.start_delete_job(name)
+
+    def start_image_job(self, subreddit_config, supersede=False):
+        """
+        Submits a job that gets the images described by the given subreddit configuration. The progress and result of
+        the job is shown in the status bar. The job is coalesced with a job that is already getting the same images,
+        e.g. if the update button is clicked twice or a scheduled refresh of the subreddit is running.
+
+        :param subreddit_config: The subreddit configuration that describes the images.
+        :param supersede: If true the other jobs of the subreddit are cancelled, e.g. since its configuration changed.
+        """
+        self.start_image_jobs([subreddit_config], supersede)
+
+    def start_image_jobs(self, subreddit_configs, supersede=False):
+        """
+        Submits the jobs that get the images of the given subreddit configurations as a single batch, e.g. for the
+        subreddits that were imported. See start_image_job().
+        """
+        self.job_manager.submit_many([(config[0].lower(), self.model.image_getter.get_images,
+                                       (tuple(config), "../data/images/")) for config in subreddit_configs],
+                                     priority=USER_PRIORITY, supersede=supersede, cancellable=True,
+                                     progress_callback=self.job_signals.progress.emit,
+                                     done_callback=self.job_signals.result.emit)
+
+    def start_delete_job(self, name):
+        """Submits a job that deletes the images and icon of the given subreddit, cancelling its other jobs."""
+        self.job_manager.submit(name.lower(), self.model.delete_images, name, priority=USER_PRIORITY, supersede=True)
+
+    def show_progress(self, name, downloaded, total):
+        """Shows the download progress of a single subreddit in the status bar."""
+        self.statusBar().showMessage("/r/{}: {} of {} images ready".format(name, downloaded, total), 5000)
+
+    def show_sync_result(self, job):
+        """
+        Shows how much was saved by keeping the images that were already on disk in the status bar, or why getting the
+        images failed. The subreddit is removed from the internal model if it does not exist.
+        """
+        subreddit_config = job.args[0]
+        sync_result = job.result
+
+        if job.state == "cancelled":
+            self.statusBar().showMessage("/r/{}: cancelled getting images".format(subreddit_config[0]), 5000)
+        elif job.state == "failed":
+            self.statusBar().showMessage("/r/{}: failed getting images: {}".format(subreddit_config[0], job.error),
+                                         10000)
+        elif sync_result is not None:
+            self.statusBar().showMessage("/r/{name}: kept {kept} images, saving {saved_requests} requests and "
+                                         "{saved_bytes} bytes".format(**sync_result), 10000)
+        elif job.state == "done":
+            # Removing the subreddit since it does not exist.
+            if self.model.remove_config(subreddit_config):
+                self.save_subreddits()
+
+    def import_subreddits(self):
+        """
+        Asks for a list of subreddits to import, which can be names, a JSON list or a multireddit. The imported
+        subreddits use the time limit and number of images that are currently chosen. The list is parsed and the
+        subreddits are looked up by a job, since a multireddit and the lookup make requests to reddit.
+        """
+        text, accepted = QtWidgets.QInputDialog.getMultiLineText(
+            self, "Import subreddits", "Subreddit names, a JSON list of subreddits or a multireddit URL:")
+        if not accepted or not text.strip():
+            return
+
+        # Using 10 images for each subreddit if no number of images is chosen.
+        time_limit = self.timeComboBox.currentText()
+        number_of_images = self.numberSpinBox.value() or 10
+
+        self.job_manager.submit("import", self.parse_import, text, time_limit, number_of_images,
+                                priority=USER_PRIORITY, done_callback=self.import_signals.result.emit)
+        self.statusBar().showMessage("Importing subreddits...", 5000)
+
+    @staticmethod
+    def parse_import(text, time_limit, number_of_images):
+        """
+        Parses the imported list of subreddits and looks up whether they exist, using a single request for up to 100
+        subreddits. This is run by the job manager.
+
+        :return: A tuple with the configurations of the subreddits that exist and the number of skipped entries.
+        """
+        reddit_client = RedditClient.shared()
+        subreddit_configs, invalid_entries = parse_subreddit_list(text, time_limit, number_of_images,
+                                                                  reddit_client.reddit)
+
+        reddit_client.prefetch_subreddit_info([config[0] for config in subreddit_configs])
+        existing_configs = [config for config in subreddit_configs if reddit_client.subreddit_info(config[0])]
+
+        return existing_configs, len(invalid_entries) + len(subreddit_configs) - len(existing_configs)
+
+    def import_finished(self, job):
+        """Adds the imported subreddits to the model in one insertion and gets their images in one batch of jobs."""
+        if job.result is None:
+            self.statusBar().showMessage("Could not import the subreddits: " + str(job.error), 10000)
+            return
+
+        subreddit_configs, skipped = job.result
+        new_configs = self.model.add_subreddits(subreddit_configs)
+
+        if new_configs:
+            self.save_subreddits()
+            self.start_image_jobs(new_configs)
+
+        self.statusBar().showMessage("Imported {} subreddits, skipped {} that were invalid or do not exist".format(
+            len(new_configs), skipped), 10000)
+
     def update_settings(self):
         """
         Updates the currently shown configuration settings when a new item is selected in the subredditView.
@@ -155,28 +320,24 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def load_subreddits(self):
         """Simple function that loads the data from the persistent json file into the internal list model."""
-        with open("../data/subreddits.json", "r") as subreddit_file:
-            data = json.load(subreddit_file)
-            self.model.subreddits = data
+        self.model.subreddits = load_subreddits()
 
     def save_subreddits(self):
         """
-        Simple function that saves the current internal list model into the persistent json file. If the json file
-        does not exist then the file is created first.
+        Saves the current internal list model into the persistent json file once no other change has been made for
+        the interval of the save timer, so a burst of changes is written once.
         """
-        with open("../data/subreddits.json", "w") as subreddit_file:
-            json.dump(self.model.subreddits, subreddit_file)
+        self.save_timer.start()
 
-    @staticmethod
-    def create_storage_setup():
-        """
-        Sets up the initial folder structure if it does not already exist. This includes creating a "data" folder
-        that contains the two sub-folders "icons"  and "images". The "data" folder will also contain the "subreddits"
-        json file which keeps track of the currently chosen added subreddits.
-        """
-        pathlib.Path("../data/icons").mkdir(parents=True, exist_ok=True)
-        pathlib.Path("../data/images").mkdir(parents=True, exist_ok=True)
+    def write_subreddits(self):
+        """Writes the current internal list model to the persistent json file, replacing the file atomically."""
+        try:
+            save_subreddits(self.model.subreddits)
+        except Exception as e:
+            print("Main window: " + str(e))
 
-        if "subreddits.json" not in os.listdir("../data"):
-            with open("../data/subreddits.json", "w+") as subreddit_file:
-                json.dump([], subreddit_file)
+    def flush_subreddits(self):
+        """Writes the subreddit list right away if a save is pending, e.g. when the application quits."""
+        if self.save_timer.isActive():
+            self.save_timer.stop()
+            self.write_subreddits()
@@ -0,0 +1,111 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt, QTimer
+
+from reddit_background_changer.instrumentation import Instrumentation
+from reddit_background_changer.settings import Settings
+
+
+class PerformancePanel(QtWidgets.QDockWidget):
+    """
+    Class for the dock widget that shows the timers, counters and gauges of the instrumentation while the application
+    runs. The measurements are refreshed every second while the panel is visible, and can be exported as JSON or in
+    the Prometheus text format to the data folder.
+    """
+    # The number of milliseconds between each refresh of the shown measurements.
+    refresh_interval = 1000
+
+    def __init__(self, *args, **kwargs):
+        super(PerformancePanel, self).__init__("Performance", *args, **kwargs)
+
+        self.instrumentation = Instrumentation.shared()
+        self.settings = Settings.shared()
+
+        # Turning the instrumentation on and off through the setting, so the choice is kept between runs.
+        self.enabledCheckBox = QtWidgets.QCheckBox("Measure performance")
+        self.enabledCheckBox.setChecked(self.instrumentation.enabled)
+        self.enabledCheckBox.toggled.connect(self.set_enabled)
+
+        self.resetButton = QtWidgets.QPushButton("Reset")
+        self.resetButton.clicked.connect(self.reset)
+        self.exportJsonButton = QtWidgets.QPushButton("Export JSON")
+        self.exportJsonButton.clicked.connect(lambda: self.export("../data/metrics.json"))
+        self.exportPrometheusButton = QtWidgets.QPushButton("Export Prometheus")
+        self.exportPrometheusButton.clicked.connect(lambda: self.export("../data/metrics.prom"))
+
+        # The table with a row for each timer, counter and gauge.
+        self.metricsTable = QtWidgets.QTableWidget(0, 4)
+        self.metricsTable.setHorizontalHeaderLabels(["Name", "Count / value", "Mean ms", "Max ms"])
+        self.metricsTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.metricsTable.verticalHeader().setVisible(False)
+        self.metricsTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+
+        button_layout = QtWidgets.QHBoxLayout()
+        button_layout.addWidget(self.enabledCheckBox)
+        button_layout.addStretch()
+        button_layout.addWidget(self.resetButton)
+        button_layout.addWidget(self.exportJsonButton)
+        button_layout.addWidget(self.exportPrometheusButton)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(button_layout)
+        layout.addWidget(self.metricsTable)
+
+        contents = QtWidgets.QWidget()
+        contents.setLayout(layout)
+        self.setWidget(contents)
+
+        # Only refreshing while the panel is visible, so a hidden panel costs nothing.
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.update_timer)
+
+    def update_timer(self, visible):
+        """Starts refreshing the measurements when the panel is shown and stops when it is hidden."""
+        if visible:
+            self.refresh()
+            self.timer.start(self.refresh_interval)
+        else:
+            self.timer.stop()
+
+    def set_enabled(self, enabled):
+        """Enables or disables the instrumentation and saves the choice in the settings."""
+        self.settings.instrumentation = enabled
+
+        # Saving notifies the subscribers of the settings, which enables or disables the shared instrumentation.
+        self.settings.save_settings()
+
+    def reset(self):
+        """Forgets the measurements so far."""
+        self.instrumentation.reset()
+        self.refresh()
+
+    def refresh(self):
+        """Shows the current measurements in the table."""
+        # Following changes of the setting that were made outside the panel, e.g. in the settings file.
+        if self.enabledCheckBox.isChecked() != self.instrumentation.enabled:
+            self.enabledCheckBox.blockSignals(True)
+            self.enabledCheckBox.setChecked(self.instrumentation.enabled)
+            self.enabledCheckBox.blockSignals(False)
+
+        snapshot = self.instrumentation.snapshot()
+
+        rows = [(name, timer["count"], "{:.2f}".format(timer["mean_ms"]), "{:.2f}".format(timer["max_ms"]))
+                for name, timer in snapshot["timers"].items()]
+        rows += [(name, value, "", "") for name, value in snapshot["counters"].items()]
+        rows += [(name, value, "", "") for name, value in snapshot["gauges"].items()]
+
+        self.metricsTable.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(str(value))
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.metricsTable.setItem(row, column, item)
+
+    def export(self, path):
+        """Exports the current measurements to the given file and shows where they were written."""
+        try:
+            self.instrumentation.export(path)
+            self.parent().statusBar().showMessage("Exported the performance measurements to " + path, 5000)
+        except Exception as e:
+            print("Performance panel: " + str(e))
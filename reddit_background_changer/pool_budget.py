@@ -0,0 +1,172 @@
+import threading
+import time
+
+from reddit_background_changer.settings import Settings
+
+# The pool is evicted down to this fraction of the budget, so the next refresh does not have to evict again right away.
+LOW_WATERMARK = 0.9
+
+# The eviction policies that can be set with the "eviction_policy" setting.
+EVICTION_POLICIES = ("last_shown", "times_shown", "oldest")
+
+# The number of seconds that an evicted submission is not downloaded again, after which the eviction is forgotten.
+EVICTION_LIFETIME = 7 * 24 * 3600
+
+
+class PoolBudget:
+    """
+    Class for keeping the background image pool within the byte budget in the settings. When the pool grows beyond the
+    budget, images are evicted according to the eviction policy until the pool is below the low watermark, and the
+    subreddits are refilled with new images as far as the freed space allows.
+
+    Evicted submissions are remembered so the refill does not download the same images again. The evictions are
+    stored in the image catalog together with the budget they were made under. An eviction is forgotten after
+    EVICTION_LIFETIME seconds or when the budget is raised above its budget, since the image then fits in the pool.
+
+    :param catalog: The image catalog that the images are evicted from.
+    :param blob_store: The blob store that the image files are removed from.
+    """
+    def __init__(self, catalog, blob_store):
+        self.catalog = catalog
+        self.blob_store = blob_store
+        self.settings = Settings.shared()
+
+        # Only a single refresh evicts at a time, so two workers do not evict the same images.
+        self.lock = threading.Lock()
+
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS evictions (
+                    subreddit TEXT NOT NULL COLLATE NOCASE,
+                    fullname TEXT NOT NULL,
+                    size INTEGER,
+                    evicted_at REAL NOT NULL,
+                    budget INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (subreddit, fullname)
+                );
+            """)
+
+            # Adding the budget column to catalogs that were created before evictions were forgotten.
+            columns = [row["name"] for row in self.catalog.connection.execute("PRAGMA table_info(evictions)")]
+            if "budget" not in columns:
+                self.catalog.connection.execute("ALTER TABLE evictions ADD COLUMN budget INTEGER NOT NULL DEFAULT 0")
+
+    def budget(self):
+        """Returns the byte budget of the pool, or 0 if the pool is not limited."""
+        return max(int(self.settings.pool_budget_bytes), 0)
+
+    def enforce(self, downloaded_before):
+        """
+        Evicts images from the pool until it is below the low watermark if it is larger than the budget.
+
+        :param downloaded_before: Only images downloaded before this unix time are evicted, which protects the images
+        that were just downloaded.
+        :return: The catalog entries of the evicted images.
+        """
+        budget = self.budget()
+        if budget == 0:
+            return []
+
+        with self.lock:
+            pool_size = self.catalog.pool_size()
+            if pool_size <= budget:
+                return []
+
+            policy = self.settings.eviction_policy
+            if policy not in EVICTION_POLICIES:
+                print("Pool budget: unknown eviction policy " + policy + ", evicting the least recently shown images")
+                policy = "last_shown"
+
+            evicted_images = []
+            for image in self.catalog.eviction_candidates(policy, downloaded_before):
+                if pool_size <= budget * LOW_WATERMARK:
+                    break
+
+                # Images that share their blob with other images do not free any space until the last one is evicted.
+                freed_bytes = self.blob_store.remove(image["path"], image["digest"])
+                self.catalog.remove_image(image["path"])
+
+                pool_size -= freed_bytes
+                evicted_images.append(image)
+
+            now = time.time()
+            with self.catalog.lock, self.catalog.connection:
+                # Deleting the evictions that are forgotten, so the table does not grow with every eviction.
+                self.catalog.connection.execute("DELETE FROM evictions WHERE evicted_at <= ? OR budget < ?",
+                                                (now - EVICTION_LIFETIME, budget))
+                self.catalog.connection.executemany(
+                    "INSERT OR REPLACE INTO evictions (subreddit, fullname, size, evicted_at, budget) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(image["subreddit"], image["fullname"], image["size"], now, budget) for image in evicted_images])
+
+        print("Pool budget: evicted {} images and {} bytes, the pool uses {} of {} bytes".format(
+            len(evicted_images), sum(image["size"] or 0 for image in evicted_images), pool_size, budget))
+
+        return evicted_images
+
+    def refill_configs(self, subreddit_configs):
+        """
+        Finds the subreddits that have fewer images than configured and how many images they can be refilled to
+        without exceeding the budget. The number of images that fit is estimated from the average image size.
+
+        :param subreddit_configs: The subreddit configurations in the subreddit list.
+        :return: The subreddit configurations to refill with, where the number of images is lowered to what fits.
+        """
+        budget = self.budget()
+        pool_size = self.catalog.pool_size()
+        image_counts = self.catalog.image_counts()
+
+        if budget == 0 or not image_counts:
+            return []
+
+        average_size = pool_size / sum(image_counts.values())
+        free_images = int((budget - pool_size) / average_size) if average_size else 0
+
+        refill_configs = []
+        for name, time_limit, number_of_images in subreddit_configs:
+            if free_images <= 0:
+                break
+
+            image_count = image_counts.get(name.lower(), 0)
+            missing = min(number_of_images - image_count, free_images)
+            if missing > 0:
+                refill_configs.append((name, time_limit, image_count + missing))
+                free_images -= missing
+
+        return refill_configs
+
+    def evicted_fullnames(self, subreddit):
+        """
+        Returns the set of fullnames of the evicted submissions from the given subreddit that should not be downloaded
+        again, i.e. the evictions that were made within EVICTION_LIFETIME seconds under at least the current budget.
+        """
+        budget = self.budget()
+        if budget == 0:
+            return set()
+
+        with self.catalog.lock:
+            return {row["fullname"] for row in self.catalog.connection.execute(
+                "SELECT fullname FROM evictions WHERE subreddit = ? AND evicted_at > ? AND budget >= ?",
+                (subreddit, time.time() - EVICTION_LIFETIME, budget))}
+
+    def forget(self, subreddit):
+        """Forgets the evicted submissions from the given subreddit, e.g. when the subreddit is deleted."""
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.execute("DELETE FROM evictions WHERE subreddit = ?", (subreddit,))
+
+    def metrics(self):
+        """
+        Returns the metrics of the pool.
+
+        :return: A dictionary with the number of bytes the pool uses, the budget, the number of images in the pool and
+        the number of evicted images and bytes.
+        """
+        with self.catalog.lock:
+            evictions, evicted_bytes = self.catalog.connection.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM evictions").fetchone()
+
+        return {"pool_bytes": self.catalog.pool_size(),
+                "budget_bytes": self.budget(),
+                "images": self.catalog.image_count(),
+                "evictions": evictions,
+                "evicted_bytes": evicted_bytes}
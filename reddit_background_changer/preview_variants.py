@@ -0,0 +1,41 @@
+import html
+
+# The factor the display dimensions are multiplied with to find the required image dimensions for each policy.
+PREVIEW_POLICIES = {
+    "exact": 1.0,
+    "headroom": 1.5,
+    "source": None
+}
+
+
+def select_preview_variant(preview_image, display_width, display_height, policy="headroom"):
+    """
+    Selects the smallest variant of a preview image that covers the display. Reddit includes the original image as the
+    "source" of the preview together with a list of downscaled "resolutions", so we can often avoid downloading an
+    original that is far larger than the display.
+
+    :param preview_image: The image from the preview of a submission, i.e. submission.preview["images"][0].
+    :param display_width: The width of the display in pixels.
+    :param display_height: The height of the display in pixels.
+    :param policy: "exact" to require the display size, "headroom" to require 1.5 times the display size and "source"
+    to always use the original image.
+    :return: A dictionary with the url, width and height of the selected variant.
+    """
+    source = preview_image["source"]
+    factor = PREVIEW_POLICIES[policy]
+
+    selected = source
+    if factor is not None:
+        required_width = display_width * factor
+        required_height = display_height * factor
+
+        # Going through the variants from smallest to largest and stopping at the first variant that is large enough.
+        variants = sorted(preview_image.get("resolutions", []) + [source],
+                          key=lambda variant: variant["width"] * variant["height"])
+        for variant in variants:
+            if variant["width"] >= required_width and variant["height"] >= required_height:
+                selected = variant
+                break
+
+    # The urls in the preview are HTML escaped.
+    return {"url": html.unescape(selected["url"]), "width": selected["width"], "height": selected["height"]}
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+
+import prawcore
+
+from reddit_background_changer.settings import Settings
+
+
+class RateLimiter:
+    """
+    Class for limiting the requests to the reddit API from every worker in the application with a token bucket. A
+    request takes a token from the bucket, which is refilled at the configured number of requests per minute and holds
+    at most a small burst of tokens.
+
+    The rate limit headers of the responses are handled by prawcore, whose session waits until the rate limit window
+    resets when reddit reports that the budget is used up. Every worker uses the session of the shared reddit instance,
+    so the bucket only keeps the workers within the configured rate and does not wait for the headers a second time.
+    The responses are still observed, so the metrics show how often reddit reported that the budget was used up.
+
+    :param requests_per_minute: The number of requests per minute that the bucket is refilled with.
+    :param burst: The maximum number of tokens in the bucket, i.e. how many requests can be sent at once.
+    """
+    # The rate limiter that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, requests_per_minute=60, burst=10):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+
+        # The times of the requests in the last minute, the total seconds spent waiting for a token and the number of
+        # times the rate limit headers made prawcore back off.
+        self.request_times = deque()
+        self.wait_seconds = 0
+        self.rate_limited_responses = 0
+        self.backoffs = 0
+
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """Returns the rate limiter that is shared by the whole application, creating it from the settings."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls(Settings.shared().requests_per_minute)
+
+            return cls.shared_instance
+
+    def refill(self, now):
+        """Adds the tokens that have been refilled since the last refill."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it, which must be done before every request."""
+        start_time = time.monotonic()
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.wait_seconds += now - start_time
+                    self.request_times.append(now)
+                    self.forget_old_requests(now)
+                    return
+
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+
+    def observe(self, status_code, headers):
+        """
+        Counts the responses from reddit that were rate limited or that used up the budget, which prawcore backs off
+        for by waiting until the rate limit window resets.
+
+        :param status_code: The status code of the response.
+        :param headers: The headers of the response.
+        """
+        remaining = headers.get("x-ratelimit-remaining")
+
+        with self.lock:
+            if status_code == 429:
+                self.rate_limited_responses += 1
+            elif remaining is not None and float(remaining) < 1:
+                self.backoffs += 1
+
+    def forget_old_requests(self, now):
+        """Forgets the times of the requests that are more than a minute old."""
+        while self.request_times and self.request_times[0] < now - 60:
+            self.request_times.popleft()
+
+    def metrics(self):
+        """
+        Returns the metrics of the rate limiter.
+
+        :return: A dictionary with the number of requests in the last minute, the total seconds spent waiting for a
+        token, the number of responses with status 429 and the number of responses that used up the budget.
+        """
+        with self.lock:
+            self.forget_old_requests(time.monotonic())
+
+            return {"requests_per_minute": len(self.request_times),
+                    "wait_seconds": self.wait_seconds,
+                    "rate_limited_responses": self.rate_limited_responses,
+                    "backoffs": self.backoffs}
+
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """
+    Requestor that sends every request from PRAW through the shared rate limiter, which is passed to praw.Reddit() as
+    the requestor class. Rate limited responses are returned to prawcore, which backs off according to the rate limit
+    headers and raises an error for the request, so the refresh scheduler backs off the subreddit instead of the request
+    being sent again here.
+    """
+    def request(self, *args, **kwargs):
+        rate_limiter = RateLimiter.shared()
+
+        rate_limiter.acquire()
+        response = super(RateLimitedRequestor, self).request(*args, **kwargs)
+        rate_limiter.observe(response.status_code, response.headers)
+
+        return response
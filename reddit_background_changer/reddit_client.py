@@ -0,0 +1,129 @@
+import threading
+import time
+
+import praw
+
+from reddit_background_changer.rate_limiter import RateLimitedRequestor
+from reddit_background_changer.settings import Settings
+
+# The number of seconds that the information about a subreddit is cached for, and for subreddits that do not exist.
+SUBREDDIT_INFO_TTL = 24 * 3600
+MISSING_SUBREDDIT_TTL = 3600
+
+# The maximum number of subreddits that are looked up in a single request.
+INFO_BATCH_SIZE = 100
+
+
+class RedditClient:
+    """
+    Class for the reddit instance that is shared by every worker getting images. The instance is kept for the lifetime
+    of the application, so the access token is reused between refreshes, and is only created again when the
+    credentials in the settings change.
+
+    The client also caches whether each subreddit exists together with its display name and icon, which are looked up
+    for many subreddits at once through /api/info. The cached information expires after a day, or after an hour for
+    subreddits that do not exist.
+    """
+    # The client that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.settings = Settings.shared()
+
+        # The reddit instance and the credentials it was created with.
+        self.reddit_instance = None
+        self.credentials = None
+
+        # Mapping from the lowercase subreddit name to (expiry time, information), where the information is None if the
+        # subreddit does not exist.
+        self.subreddit_info_cache = {}
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.info_requests = 0
+
+        self.lock = threading.RLock()
+
+    @classmethod
+    def shared(cls):
+        """Returns the client that is shared by the whole application, creating it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+
+            return cls.shared_instance
+
+    def reddit(self):
+        """
+        Returns the shared reddit instance, creating it again if the credentials in the settings have changed. Every
+        request from the instance goes through the shared rate limiter.
+
+        :return: The praw reddit instance.
+        """
+        # Loading the most recent settings, which only reads the settings file if it has changed.
+        self.settings.load_settings()
+        credentials = (self.settings.client_id, self.settings.client_secret, self.settings.user_agent)
+
+        with self.lock:
+            if self.reddit_instance is None or credentials != self.credentials:
+                self.reddit_instance = praw.Reddit(client_id=credentials[0], client_secret=credentials[1],
+                                                   user_agent=credentials[2], requestor_class=RateLimitedRequestor)
+                self.credentials = credentials
+
+            return self.reddit_instance
+
+    def subreddit_info(self, name):
+        """
+        Returns the cached information about the given subreddit, looking it up if it is not cached or has expired.
+
+        :param name: The name of the subreddit.
+        :return: A dictionary with the "display_name" and "icon_img" of the subreddit or None if it does not exist.
+        """
+        with self.lock:
+            cached = self.subreddit_info_cache.get(name.lower())
+            if cached is not None and cached[0] > time.time():
+                self.cache_hits += 1
+                return cached[1]
+
+            self.cache_misses += 1
+
+        self.prefetch_subreddit_info([name])
+        with self.lock:
+            return self.subreddit_info_cache[name.lower()][1]
+
+    def prefetch_subreddit_info(self, names):
+        """
+        Looks up the information about the given subreddits that is not cached or has expired, using a single request
+        for up to 100 subreddits. Subreddits that are missing from the response do not exist or can not be accessed.
+
+        :param names: The names of the subreddits.
+        """
+        now = time.time()
+        with self.lock:
+            missing_names = sorted({name.lower() for name in names
+                                    if self.subreddit_info_cache.get(name.lower(), (0, None))[0] <= now})
+
+        reddit = self.reddit()
+        for start in range(0, len(missing_names), INFO_BATCH_SIZE):
+            batch = missing_names[start:start + INFO_BATCH_SIZE]
+            subreddits = reddit.get("api/info", params={"sr_name": ",".join(batch)})
+
+            with self.lock:
+                self.info_requests += 1
+
+                # Caching the subreddits that were not found as well so they are not looked up for every refresh.
+                for name in batch:
+                    self.subreddit_info_cache[name] = (now + MISSING_SUBREDDIT_TTL, None)
+
+                for subreddit in subreddits:
+                    self.subreddit_info_cache[subreddit.display_name.lower()] = (
+                        now + SUBREDDIT_INFO_TTL, {"display_name": subreddit.display_name,
+                                                   "icon_img": subreddit.icon_img or ""})
+
+    def metrics(self):
+        """Returns the number of cache hits and misses and the number of requests made to look up subreddits."""
+        with self.lock:
+            return {"subreddit_info_hits": self.cache_hits,
+                    "subreddit_info_misses": self.cache_misses,
+                    "subreddit_info_requests": self.info_requests}
@@ -0,0 +1,231 @@
+import threading
+import time
+import zlib
+
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.job_manager import JobManager, REFRESH_PRIORITY
+from reddit_background_changer.settings import Settings
+
+# The number of hours between refreshes of a subreddit for each time limit. The top images within a short time limit
+# change quickly, so they are refreshed more often than the top images of all time.
+REFRESH_INTERVALS = {
+    "Now": 1,
+    "Today": 6,
+    "This week": 24,
+    "This month": 72,
+    "This year": 168,
+    "All time": 336
+}
+
+# The subreddits that are due are spread over this many seconds so they are not all refreshed at once.
+STAGGER_WINDOW = 900
+
+# The number of seconds a subreddit is not refreshed after its first failed refresh. The backoff is doubled for each
+# further failure in a row, up to the largest backoff.
+FAILURE_BACKOFF = 300
+MAX_FAILURE_BACKOFF = 24 * 3600
+
+
+class RefreshScheduler:
+    """
+    Class for periodically refreshing the images of every subreddit in the subreddit list. Each subreddit is refreshed
+    according to the interval of its time limit, counted from its last refresh in the image catalog, and the
+    subreddits are staggered by a fixed offset derived from their name. The refreshes run as jobs of the shared job
+    manager with a lower priority than the work the user is waiting for, and are coalesced with a job that is already
+    getting the same images. Every request to reddit goes through the shared rate limiter, so a refresh of many
+    subreddits does not exceed the request budget.
+
+    A refresh that fails, e.g. since the subreddit no longer exists or reddit can not be reached, is not tried again
+    until its backoff has expired, which grows exponentially with the number of failures in a row.
+
+    :param get_subreddits: Function that returns the current list of subreddit configurations.
+    :param check_interval: The number of seconds between checking which subreddits are due.
+    """
+    def __init__(self, get_subreddits, check_interval=60):
+        self.get_subreddits = get_subreddits
+        self.check_interval = check_interval
+
+        self.settings = Settings.shared()
+
+        # The catalog that the time of the last refresh of each subreddit is read from.
+        self.catalog = ImageCatalog()
+
+        # Subreddits that have never been refreshed are due one stagger offset after the scheduler is started.
+        self.start_time = time.time()
+
+        # The lowercase names of the subreddits that are currently being refreshed.
+        self.in_progress = set()
+        self.lock = threading.Lock()
+
+        # Mapping from the lowercase name of each subreddit whose last refresh failed to a tuple with the number of
+        # failures in a row and the time of the last attempt.
+        self.failed_attempts = {}
+
+        self.refreshes = 0
+        self.failed_refreshes = 0
+
+        self.job_manager = JobManager.shared()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts checking for subreddits that are due in a daemon thread."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops checking for subreddits that are due. Refreshes that have already been submitted are finished."""
+        self.stop_event.set()
+
+    def run(self):
+        """Refreshes the subreddits that are due every check interval until the scheduler is stopped."""
+        while not self.stop_event.is_set():
+            try:
+                self.refresh_due_subreddits()
+            except Exception as e:
+                print("Refresh scheduler: " + str(e))
+
+            self.stop_event.wait(self.check_interval)
+
+    def refresh_due_subreddits(self, now=None):
+        """
+        Submits refresh jobs for the subreddits that are due, skipping those that are already being refreshed.
+
+        :param now: The current time, by default time.time().
+        :return: The subreddit configurations that refresh jobs were submitted for.
+        """
+        self.settings.load_settings()
+        if not self.settings.scheduled_refresh:
+            return []
+
+        due_subreddits = self.due_subreddits(time.time() if now is None else now)
+
+        with self.lock:
+            due_subreddits = [config for config in due_subreddits if config[0].lower() not in self.in_progress]
+
+        # Looking up whether the due subreddits exist with a single request instead of one request per subreddit.
+        if due_subreddits:
+            # Importing the reddit client here since it imports PRAW, which is not needed until the first refresh.
+            from reddit_background_changer.reddit_client import RedditClient
+            try:
+                RedditClient.shared().prefetch_subreddit_info([config[0] for config in due_subreddits])
+            except Exception as e:
+                # Backing off every due subreddit since none of them can be refreshed, e.g. when reddit is down.
+                print("Refresh scheduler: " + str(e))
+                with self.lock:
+                    for subreddit_config in due_subreddits:
+                        self.record_failure(subreddit_config[0])
+                return []
+
+        with self.lock:
+            due_subreddits = [config for config in due_subreddits if config[0].lower() not in self.in_progress]
+            self.in_progress.update(config[0].lower() for config in due_subreddits)
+
+        for subreddit_config in due_subreddits:
+            self.refresh(subreddit_config)
+
+        return due_subreddits
+
+    def due_subreddits(self, now):
+        """
+        Finds the subreddits whose refresh interval has passed since their last refresh, skipping the subreddits whose
+        last refresh failed until their backoff has expired.
+
+        :param now: The current time.
+        :return: The subreddit configurations that are due, the most overdue first.
+        """
+        last_refresh_times = self.catalog.last_refresh_times()
+
+        with self.lock:
+            failed_attempts = dict(self.failed_attempts)
+
+        overdue = []
+        for subreddit_config in self.get_subreddits():
+            name, time_limit, _ = subreddit_config
+
+            if name.lower() in failed_attempts:
+                failures, last_attempt = failed_attempts[name.lower()]
+                if now < last_attempt + self.failure_backoff(failures):
+                    continue
+
+            interval = REFRESH_INTERVALS.get(time_limit, 24) * 3600
+
+            last_refresh_time = last_refresh_times.get(name.lower(), self.start_time - interval)
+            due_time = last_refresh_time + interval + self.stagger_offset(name)
+
+            if now >= due_time:
+                overdue.append((now - due_time, tuple(subreddit_config)))
+
+        return [subreddit_config for _, subreddit_config in sorted(overdue, reverse=True)]
+
+    @staticmethod
+    def stagger_offset(name):
+        """Returns the fixed number of seconds in the stagger window that the refresh of a subreddit is offset by."""
+        return zlib.crc32(name.lower().encode("utf-8")) % STAGGER_WINDOW
+
+    @staticmethod
+    def failure_backoff(failures):
+        """Returns the number of seconds a subreddit is not refreshed after the given number of failures in a row."""
+        return min(FAILURE_BACKOFF * 2 ** (failures - 1), MAX_FAILURE_BACKOFF)
+
+    def record_failure(self, name):
+        """Records a failed refresh of the given subreddit, which requires the lock."""
+        failures = self.failed_attempts.get(name.lower(), (0, 0))[0]
+        self.failed_attempts[name.lower()] = (failures + 1, time.time())
+
+    def refresh(self, subreddit_config):
+        """
+        Submits a job that gets the images of the given subreddit configuration, only downloading the images that are
+        missing. The job is cancelled if the subreddit is deleted or changed in the main window while it runs.
+        """
+        # Importing the image getter here since it imports PRAW, which is not needed until the first refresh.
+        from reddit_background_changer.image_getter import ImageGetter
+
+        return self.job_manager.submit(subreddit_config[0].lower(), ImageGetter.shared().get_images,
+                                       tuple(subreddit_config), "../data/images/", priority=REFRESH_PRIORITY,
+                                       cancellable=True, done_callback=self.refresh_done)
+
+    def refresh_done(self, job):
+        """Records the result of a finished refresh job, which is called from the thread that ran the job."""
+        subreddit_config = job.args[0]
+
+        with self.lock:
+            self.in_progress.discard(subreddit_config[0].lower())
+
+            if job.state == "done" and job.result is not None:
+                self.refreshes += 1
+                self.failed_attempts.pop(subreddit_config[0].lower(), None)
+            elif job.state != "cancelled":
+                # Backing off the subreddit since a refresh that failed would otherwise be tried every check interval.
+                self.failed_refreshes += 1
+                self.record_failure(subreddit_config[0])
+
+        self.print_metrics()
+
+    def metrics(self):
+        """
+        Returns the metrics of the refresh scheduler together with the metrics of the shared rate limiter.
+
+        :return: A dictionary with the number of finished and failed refreshes, the number of refreshes in progress,
+        the number of subreddits waiting for their backoff after a failure, the requests to reddit in the last minute
+        and the total seconds spent waiting for the rate limiter.
+        """
+        # Importing the rate limiter here since it imports prawcore, which is not needed until the first refresh.
+        from reddit_background_changer.rate_limiter import RateLimiter
+
+        with self.lock:
+            metrics = {"refreshes": self.refreshes,
+                       "failed_refreshes": self.failed_refreshes,
+                       "refreshes_in_progress": len(self.in_progress),
+                       "backed_off_subreddits": len(self.failed_attempts)}
+
+        metrics.update(RateLimiter.shared().metrics())
+        return metrics
+
+    def print_metrics(self):
+        """Prints the metrics of the refresh scheduler."""
+        print("Refresh scheduler: {refreshes} refreshes, {failed_refreshes} failed and {refreshes_in_progress} in "
+              "progress, {backed_off_subreddits} subreddits waiting after a failure. {requests_per_minute} requests "
+              "in the last minute, waited {wait_seconds:.1f} seconds for the rate limiter and backed off {backoffs} "
+              "times".format(**self.metrics()))
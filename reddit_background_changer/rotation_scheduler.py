@@ -0,0 +1,111 @@
+import os
+import random
+
+from reddit_background_changer.settings import Settings
+
+
+class RotationScheduler:
+    """
+    Class for deciding the order in which the images in the pool are used as the desktop background. The scheduler
+    works like a shuffle bag: every image is put in a shuffled deck and images are taken from the top of the deck until
+    it is empty, at which point the deck is shuffled again. This means that no image is repeated before every other
+    image has been shown.
+
+    The deck is stored in the image catalog so it persists between runs. Each entry in the deck has a random sort key
+    and the top of the deck is the entry with the smallest key, so taking an image and adding a new image are single
+    index lookups. Images that are removed from the catalog are removed from the deck by a trigger.
+
+    Subreddits can be given a weight that decides how many times their images are put in the deck on average, e.g. a
+    weight of 2 shows the images twice as often and a weight of 0.5 only puts half of the images in each deck.
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.settings = Settings.shared()
+
+        with self.catalog.lock, self.catalog.connection:
+            self.catalog.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS rotation_deck (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    sort_key REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS rotation_deck_sort_key ON rotation_deck (sort_key);
+                CREATE INDEX IF NOT EXISTS rotation_deck_path ON rotation_deck (path);
+
+                CREATE TABLE IF NOT EXISTS rotation_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    last_sort_key REAL NOT NULL
+                );
+                INSERT OR IGNORE INTO rotation_state (id, last_sort_key) VALUES (0, 0);
+
+                CREATE TRIGGER IF NOT EXISTS rotation_deck_remove_image AFTER DELETE ON images BEGIN
+                    DELETE FROM rotation_deck WHERE path = old.path;
+                END;
+            """)
+
+    def get_weight(self, subreddit):
+        """Returns the weight of the given subreddit, which is 1 unless it is set in the settings."""
+        return self.settings.subreddit_weights.get(subreddit.lower(), 1)
+
+    def count_copies(self, subreddit):
+        """Returns how many times an image from the given subreddit should be put in the deck, on average its weight."""
+        weight = self.get_weight(subreddit)
+        return int(weight) + (1 if random.random() < weight - int(weight) else 0)
+
+    def pop(self):
+        """
+        Takes the image at the top of the deck, shuffling a new deck first if the deck is empty.
+
+        :return: The path to the image or None if there are no images that can be put in the deck.
+        """
+        with self.catalog.lock, self.catalog.connection:
+            entry = self.catalog.connection.execute(
+                "SELECT id, path, sort_key FROM rotation_deck ORDER BY sort_key LIMIT 1").fetchone()
+
+            if entry is None:
+                self.shuffle()
+                entry = self.catalog.connection.execute(
+                    "SELECT id, path, sort_key FROM rotation_deck ORDER BY sort_key LIMIT 1").fetchone()
+
+                if entry is None:
+                    return None
+
+            self.catalog.connection.execute("DELETE FROM rotation_deck WHERE id = ?", (entry["id"],))
+            self.catalog.connection.execute("UPDATE rotation_state SET last_sort_key = ? WHERE id = 0",
+                                            (entry["sort_key"],))
+
+        return entry["path"]
+
+    def shuffle(self):
+        """Fills the deck with every image in the catalog in a random order. Must be called with the catalog locked."""
+        entries = []
+        for image in self.catalog.connection.execute("SELECT subreddit, path FROM images"):
+            for _ in range(self.count_copies(image["subreddit"])):
+                entries.append((image["path"], random.random()))
+
+        self.catalog.connection.executemany("INSERT INTO rotation_deck (path, sort_key) VALUES (?, ?)", entries)
+        self.catalog.connection.execute("UPDATE rotation_state SET last_sort_key = 0 WHERE id = 0")
+
+    def add(self, path, subreddit):
+        """
+        Adds a new image to the current deck without shuffling the deck again. Since the remaining entries have sort
+        keys that are uniformly distributed above the last key that was taken, the new image is given a random key in
+        the same range so it ends up in a uniformly random position among the remaining entries.
+
+        :param path: The path to the image that was added to the catalog.
+        :param subreddit: The subreddit the image came from.
+        """
+        path = os.path.abspath(path)
+
+        with self.catalog.lock, self.catalog.connection:
+            last_sort_key = self.catalog.connection.execute(
+                "SELECT last_sort_key FROM rotation_state WHERE id = 0").fetchone()[0]
+
+            self.catalog.connection.executemany(
+                "INSERT INTO rotation_deck (path, sort_key) VALUES (?, ?)",
+                [(path, random.uniform(last_sort_key, 1)) for _ in range(self.count_copies(subreddit))])
+
+    def remaining(self):
+        """Returns the number of entries that are left in the current deck."""
+        with self.catalog.lock:
+            return self.catalog.connection.execute("SELECT count(*) FROM rotation_deck").fetchone()[0]
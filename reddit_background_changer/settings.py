@@ -1,46 +1,191 @@
 import json
 import os
+import threading
+
+from reddit_background_changer.storage import write_file_atomically
 
 
 class Settings:
-    def __init__(self):
+    """
+    Class for the settings of the application. A single instance is shared by the whole application through
+    Settings.shared() so every part of the application sees the same settings.
+
+    The settings file is only read again if its modification time or size has changed since it was last loaded, which
+    means that load_settings() is cheap enough to call before every use. Functions that wish to know when the settings
+    change can be subscribed to the settings.
+    """
+    # The instance that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self, path="../resources/settings.json"):
+        self.path = path
+
         # If the settings file does not already exist then initialize the settings file.
-        if "settings.json" not in os.listdir("../resources"):
+        if not os.path.exists(self.path):
             self.initialize_file()
 
         self.client_id = ""
         self.client_secret = ""
         self.user_agent = ""
         self.change_frequency = 0
+        self.download_workers = 4
+        self.preview_policy = "headroom"
+        self.dedup_distance = 4
+        self.lookahead_size = 3
+        self.wallpaper_backend = "auto"
+        self.scheduled_refresh = True
+        self.refresh_workers = 2
+        self.requests_per_minute = 60
+        self.aspect_tolerance = 0.2
+        self.pool_budget_bytes = 0
+        self.eviction_policy = "last_shown"
+        self.instrumentation = False
+        self.normalize_quality = 85
+
+        # The (width, height) of the displays that images must fit, where an empty list means the primary display.
+        self.viability_targets = []
+
+        # Mapping from lowercase subreddit names to how often their images are shown compared to other subreddits.
+        self.subreddit_weights = {}
+
+        # The old blacklist of image filenames, which is migrated to the blacklist file by the Blacklist class.
         self.blacklist = []
 
+        # The modification time and size of the settings file when it was last loaded or saved.
+        self.file_signature = None
+
+        # Functions that are called with the settings each time the settings change.
+        self.listeners = []
+
+        # The settings are loaded from the worker threads as well as the GUI thread.
+        self.lock = threading.RLock()
+
         self.load_settings()
 
-    def load_settings(self):
-        """Loading the current settings from the settings file."""
-        with open("../resources/settings.json", "r") as settings_file:
-            settings = json.load(settings_file)
-            self.client_id = settings["client_id"]
-            self.client_secret = settings["client_secret"]
-            self.user_agent = settings["user_agent"]
-            self.change_frequency = settings["change_frequency"]
-            self.blacklist = settings["blacklist"]
+    @classmethod
+    def shared(cls):
+        """Returns the settings instance that is shared by the whole application, creating it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+
+            return cls.shared_instance
+
+    def subscribe(self, listener):
+        """
+        Subscribes the given function to changes of the settings. Note that the function is called from the thread
+        that changed the settings.
+
+        :param listener: Function that is called with the settings each time they change.
+        """
+        self.listeners.append(listener)
+
+    def notify_listeners(self):
+        """Calls every subscribed function since the settings have changed."""
+        for listener in self.listeners:
+            listener(self)
+
+    def read_file_signature(self):
+        """Returns the modification time and size of the settings file."""
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_settings(self, force=False):
+        """
+        Loading the current settings from the settings file if the file has changed since it was last loaded.
+
+        :param force: If true the settings file is loaded even if it has not changed.
+        :return: True if the settings were loaded from the file, false otherwise.
+        """
+        with self.lock:
+            file_signature = self.read_file_signature()
+            if not force and file_signature == self.file_signature:
+                return False
+
+            with open(self.path, "r") as settings_file:
+                settings = json.load(settings_file)
+                self.client_id = settings["client_id"]
+                self.client_secret = settings["client_secret"]
+                self.user_agent = settings["user_agent"]
+                self.change_frequency = settings["change_frequency"]
+                self.blacklist = settings.get("blacklist", [])
+                self.download_workers = settings.get("download_workers", 4)
+                self.preview_policy = settings.get("preview_policy", "headroom")
+                self.dedup_distance = settings.get("dedup_distance", 4)
+                self.lookahead_size = settings.get("lookahead_size", 3)
+                self.wallpaper_backend = settings.get("wallpaper_backend", "auto")
+                self.scheduled_refresh = settings.get("scheduled_refresh", True)
+                self.refresh_workers = settings.get("refresh_workers", 2)
+                self.requests_per_minute = settings.get("requests_per_minute", 60)
+                self.aspect_tolerance = settings.get("aspect_tolerance", 0.2)
+                self.viability_targets = settings.get("viability_targets", [])
+                self.pool_budget_bytes = settings.get("pool_budget_bytes", 0)
+                self.eviction_policy = settings.get("eviction_policy", "last_shown")
+                self.instrumentation = settings.get("instrumentation", False)
+                self.normalize_quality = settings.get("normalize_quality", 85)
+                self.subreddit_weights = settings.get("subreddit_weights", {})
+
+            self.file_signature = file_signature
+
+        self.notify_listeners()
+        return True
 
     def save_settings(self):
-        """Saving the current settings to the the settings file"""
-        with open("../resources/settings.json", "w") as settings_file:
-            json.dump({"client_id": self.client_id,
-                       "client_secret": self.client_secret,
-                       "user_agent": self.user_agent,
-                       "change_frequency": self.change_frequency,
-                       "blacklist": self.blacklist}, settings_file)
-
-    @staticmethod
-    def initialize_file():
+        """
+        Saving the current settings to the the settings file. The settings are written to a temporary file that then
+        replaces the settings file, so the settings file is never left half written.
+        """
+        with self.lock:
+            self.write_atomically({"client_id": self.client_id,
+                                   "client_secret": self.client_secret,
+                                   "user_agent": self.user_agent,
+                                   "change_frequency": self.change_frequency,
+                                   "blacklist": self.blacklist,
+                                   "download_workers": self.download_workers,
+                                   "preview_policy": self.preview_policy,
+                                   "dedup_distance": self.dedup_distance,
+                                   "lookahead_size": self.lookahead_size,
+                                   "wallpaper_backend": self.wallpaper_backend,
+                                   "scheduled_refresh": self.scheduled_refresh,
+                                   "refresh_workers": self.refresh_workers,
+                                   "requests_per_minute": self.requests_per_minute,
+                                   "aspect_tolerance": self.aspect_tolerance,
+                                   "viability_targets": self.viability_targets,
+                                   "pool_budget_bytes": self.pool_budget_bytes,
+                                   "eviction_policy": self.eviction_policy,
+                                   "instrumentation": self.instrumentation,
+                                   "normalize_quality": self.normalize_quality,
+                                   "subreddit_weights": self.subreddit_weights})
+
+            # Remembering the saved file so our own save is not mistaken for an outside change.
+            self.file_signature = self.read_file_signature()
+
+        self.notify_listeners()
+
+    def initialize_file(self):
         """Initializes the settings file."""
-        with open("../resources/settings.json", "w+") as settings_file:
-            json.dump({"client_id": "",
-                       "client_secret": "",
-                       "username": "",
-                       "change_frequency": 30,
-                       "blacklist": []}, settings_file)
+        self.write_atomically({"client_id": "",
+                               "client_secret": "",
+                               "user_agent": "",
+                               "change_frequency": 30,
+                               "blacklist": [],
+                               "download_workers": 4,
+                               "preview_policy": "headroom",
+                               "dedup_distance": 4,
+                               "lookahead_size": 3,
+                               "wallpaper_backend": "auto",
+                               "scheduled_refresh": True,
+                               "refresh_workers": 2,
+                               "requests_per_minute": 60,
+                               "aspect_tolerance": 0.2,
+                               "viability_targets": [],
+                               "pool_budget_bytes": 0,
+                               "eviction_policy": "last_shown",
+                               "instrumentation": False,
+                               "normalize_quality": 85,
+                               "subreddit_weights": {}})
+
+    def write_atomically(self, settings):
+        """Writes the given settings to a temporary file in the same folder and then replaces the settings file."""
+        write_file_atomically(self.path, json.dumps(settings).encode("utf-8"))
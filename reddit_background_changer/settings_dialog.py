@@ -1,20 +1,18 @@
 from reddit_background_changer.settings import Settings
+from reddit_background_changer.ui_loader import load_ui
 
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 
 
 class SettingsDialog(QtWidgets.QDialog):
-    def __init__(self, background_changer, *args, **kwargs):
+    def __init__(self, *args, **kwargs):
         super(SettingsDialog, self).__init__(*args, **kwargs)
 
-        # Load the UI Page.
-        uic.loadUi("../resources/settingsdialog.ui", self)
+        # Load the UI Page from the precompiled ui module.
+        load_ui("../resources/settingsdialog.ui", self)
 
-        # Used to restart the timer if the change frequency was changed.
-        self.background_changer = background_changer
-
-        # Loading the settings and writing them to their respective line edits.
-        self.settings = Settings()
+        # Using the shared settings and writing them to their respective line edits.
+        self.settings = Settings.shared()
         self.clientIDLineEdit.setText(self.settings.client_id)
         self.clientSecretLineEdit.setText(self.settings.client_secret)
         self.userAgentLineEdit.setText(self.settings.user_agent)
@@ -31,16 +29,17 @@ class SettingsDialog(QtWidgets.QDialog):
         self.settings.client_id = self.clientIDLineEdit.text()
         self.settings.client_secret = self.clientSecretLineEdit.text()
         self.settings.user_agent = self.userAgentLineEdit.text()
-
-        initial_change_frequency = self.settings.change_frequency
         self.settings.change_frequency = self.changeFrequencySpinBox.value()
 
-        # Restarting the background changer timer with the new change frequency if it was changed.
-        if self.settings.change_frequency != initial_change_frequency:
-            self.background_changer.timer.start(self.settings.change_frequency * 60000)
-
+        # Saving notifies the subscribers of the settings, which restarts the background changer timer if needed.
         self.settings.save_settings()
 
+    def showEvent(self, event):
+        """Showing the most recent settings each time the dialog is opened."""
+        self.settings.load_settings()
+        self.cancel()
+        super(SettingsDialog, self).showEvent(event)
+
     def cancel(self):
         """Reverting the text in the line edits back to the initial text."""
         self.clientIDLineEdit.setText(self.settings.client_id)
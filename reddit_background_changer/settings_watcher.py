@@ -0,0 +1,30 @@
+import os
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, pyqtSignal
+
+
+class SettingsWatcher(QObject):
+    """
+    Class that turns changes of the shared settings into a Qt signal. Since the settings can be changed from worker
+    threads, the signal makes sure that the connected slots are called in the thread that owns the receiver.
+
+    The settings file is also watched so changes made outside the application are loaded right away.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, settings, *args, **kwargs):
+        super(SettingsWatcher, self).__init__(*args, **kwargs)
+
+        self.settings = settings
+        self.settings.subscribe(lambda _: self.changed.emit())
+
+        self.file_watcher = QFileSystemWatcher([os.path.abspath(self.settings.path)])
+        self.file_watcher.fileChanged.connect(self.file_changed)
+
+    def file_changed(self, path):
+        """Loading the settings file since it was changed on disk."""
+        # Replacing the file atomically removes the watched file, so the new file has to be watched again.
+        if path not in self.file_watcher.files() and os.path.exists(path):
+            self.file_watcher.addPath(path)
+
+        self.settings.load_settings()
@@ -0,0 +1,42 @@
+import json
+import time
+
+
+class StartupProfile:
+    """
+    Class for recording how long each step of starting the application takes. The steps are marked with the time since
+    the given start time and reported once the tray icon is shown, which is the time the user waits on login.
+
+    :param start_time: The time.perf_counter() value that the steps are measured from, by default the creation time.
+    """
+    def __init__(self, start_time=None):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+
+        # List of (step, milliseconds since the start time) tuples in the order the steps were marked.
+        self.marks = []
+
+    def mark(self, step):
+        """Marks that the given step is done."""
+        self.marks.append((step, (time.perf_counter() - self.start_time) * 1000))
+
+    def finish(self):
+        """Marks that the event loop has started, i.e. that the tray icon is shown, and reports the profile."""
+        self.mark("event loop")
+        self.report()
+
+    def report(self, path="../data/startup_profile.json"):
+        """
+        Prints the steps of the startup and saves them to the given json file so they can be compared between versions.
+
+        :param path: The path to the json file or None if the profile should only be printed.
+        """
+        print("Startup: " + ", ".join("{} after {:.0f} ms".format(step, milliseconds)
+                                       for step, milliseconds in self.marks))
+
+        if path is not None:
+            try:
+                with open(path, "w") as profile_file:
+                    json.dump({"steps": [{"step": step, "milliseconds": milliseconds}
+                                         for step, milliseconds in self.marks]}, profile_file, indent=2)
+            except OSError as e:
+                print("Startup: " + str(e))
@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+
+from reddit_background_changer.image_catalog import ImageCatalog
+
+
+def create_storage_setup():
+    """
+    Sets up the initial folder structure if it does not already exist. This includes creating a "data" folder
+    that contains the two sub-folders "icons"  and "images". The "data" folder will also contain the "subreddits"
+    json file which keeps track of the currently chosen added subreddits and the image catalog.
+    """
+    pathlib.Path("../data/icons").mkdir(parents=True, exist_ok=True)
+    pathlib.Path("../data/images").mkdir(parents=True, exist_ok=True)
+
+    if "subreddits.json" not in os.listdir("../data"):
+        with open("../data/subreddits.json", "w+") as subreddit_file:
+            json.dump([], subreddit_file)
+
+    # Building the catalog from the existing images the first time the application is run with an image catalog.
+    if "catalog.db" not in os.listdir("../data"):
+        ImageCatalog().rebuild()
+
+    # Moving the images from the flat image folder into the blob storage. Once migrated the image folder only contains
+    # the shard folders, so checking for images to migrate is cheap.
+    blob_store = BlobStore.shared()
+    if any(entry.is_file() for entry in os.scandir("../data/images")):
+        print("Storage: migrated {} images to the blob storage".format(blob_store.migrate(ImageCatalog())))
+
+    blob_store.remove_temporary_files()
+
+
+def load_subreddits():
+    """Loads the subreddit configurations from the persistent json file."""
+    with open("../data/subreddits.json", "r") as subreddit_file:
+        return json.load(subreddit_file)
+
+
+def save_subreddits(subreddit_configs):
+    """Saves the subreddit configurations to the persistent json file, replacing the file atomically."""
+    write_file_atomically("../data/subreddits.json", json.dumps(subreddit_configs).encode("utf-8"))
+
+
+def write_file_atomically(path, data):
+    """
+    Writes the given bytes to a temporary file in the same folder and then replaces the file at the given path, so the
+    file is never left half written, e.g. if the application is closed while an icon is saved. The temporary file is
+    flushed to the disk before it replaces the file, so a crash right after the replacement does not leave it empty.
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+class BlobStore:
+    """
+    Class for storing the images of the background image pool by their content. Each image is stored once as a blob
+    named after its SHA-256 digest in a shard folder given by the first two characters of the digest, and the image file
+    of each submission, e.g. "../data/images/3f/wallpapers_t3_abc123.jpg", is a hard link to its blob. Images with the
+    same content in several subreddits therefore share a single blob, and the number of links to a blob is its reference
+    count. A blob is deleted when the last image linking to it is removed.
+
+    Images are downloaded to a temporary file that is moved into place once it is complete, so an interrupted download
+    never leaves a truncated image behind. The image files are spread over 256 shard folders by the hash of their name,
+    so no folder grows large enough to make listing or changing it slow.
+
+    :param blob_folder: The folder that the blobs and the temporary files are stored in.
+    """
+    # The blob store that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    # The number of seconds after which a temporary file is assumed to be left behind by an interrupted download.
+    temporary_file_lifetime = 3600
+
+    def __init__(self, blob_folder="../data/blobs"):
+        self.blob_folder = blob_folder
+        self.temporary_folder = os.path.join(blob_folder, "tmp")
+        pathlib.Path(self.temporary_folder).mkdir(parents=True, exist_ok=True)
+
+        # Guards adding and releasing blobs so a blob is not deleted while a new image is linked to it.
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """Returns the blob store that is shared by the whole application, creating it the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = cls()
+
+            return cls.shared_instance
+
+    @staticmethod
+    def image_path(image_folder, filename):
+        """
+        Returns the path of an image file in its shard folder, creating the shard folder if it does not exist.
+
+        :param image_folder: The folder containing the background image pool, e.g. "../data/images/".
+        :param filename: The filename of the image, e.g. "wallpapers_t3_abc123.jpg".
+        :return: The path to the image file.
+        """
+        shard_folder = os.path.join(image_folder, hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2])
+        os.makedirs(shard_folder, exist_ok=True)
+
+        return os.path.join(shard_folder, filename)
+
+    def blob_path(self, digest):
+        """Returns the path of the blob with the given SHA-256 digest."""
+        return os.path.join(self.blob_folder, digest[:2], digest + ".jpg")
+
+    def temporary_file(self):
+        """
+        Creates a temporary file that a download is written to before it is added to the store.
+
+        :return: A tuple with the open file descriptor and the path of the temporary file.
+        """
+        return tempfile.mkstemp(dir=self.temporary_folder, suffix=".tmp")
+
+    def add(self, temporary_path, digest, path):
+        """
+        Moves a completely written temporary file into the store and links the image file at the given path to it. If
+        a blob with the same content is already stored then the temporary file is discarded and the existing blob is
+        linked instead.
+
+        :param temporary_path: The path to the temporary file from temporary_file().
+        :param digest: The SHA-256 digest of the content of the temporary file as a hex string.
+        :param path: The path that the image file should be linked to.
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        with self.lock:
+            if os.path.exists(blob_path):
+                os.remove(temporary_path)
+            else:
+                os.replace(temporary_path, blob_path)
+
+            self.link(blob_path, path)
+
+    def link(self, blob_path, path):
+        """
+        Links the image file at the given path to a blob, replacing the image file atomically if it exists. The blob is
+        copied instead on file systems that do not support hard links, in which case the blob is not shared.
+        """
+        file_descriptor, link_path = self.temporary_file()
+        os.close(file_descriptor)
+        os.remove(link_path)
+
+        try:
+            os.link(blob_path, link_path)
+        except OSError:
+            shutil.copyfile(blob_path, link_path)
+
+        os.replace(link_path, path)
+
+    def remove(self, path, digest=None):
+        """
+        Removes the image file at the given path and deletes its blob if no other image links to it.
+
+        :param path: The path to the image file.
+        :param digest: The digest of the blob that the image links to, or None if it is unknown, e.g. for images that
+        were added to the catalog by rebuilding it. Unreferenced blobs are then deleted by collect_garbage().
+        :return: The number of bytes that were freed on disk, which is 0 if the blob is still linked to by other images.
+        """
+        freed_bytes = 0
+        try:
+            stat = os.stat(path)
+            os.remove(path)
+
+            # The file is the only link to its content if its link count was 1, e.g. if hard links are not supported.
+            if stat.st_nlink <= 1:
+                freed_bytes = stat.st_size
+        except FileNotFoundError:
+            pass
+
+        if digest is not None:
+            freed_bytes += self.release(digest)
+
+        return freed_bytes
+
+    def release(self, digest):
+        """
+        Deletes the blob with the given digest if it is no longer linked to by any image.
+
+        :return: The number of bytes that were freed on disk.
+        """
+        blob_path = self.blob_path(digest)
+
+        with self.lock:
+            try:
+                stat = os.stat(blob_path)
+                if stat.st_nlink <= 1:
+                    os.remove(blob_path)
+                    return stat.st_size
+            except FileNotFoundError:
+                pass
+
+        return 0
+
+    def digest_file(self, path):
+        """Returns the SHA-256 digest of the file at the given path as a hex string."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def migrate(self, catalog, image_folder="../data/images"):
+        """
+        Moves the images from the flat image folder into the blob storage. Each image is first linked to its blob and
+        then renamed into its shard folder, so the image exists on disk at every point of the migration. The catalog
+        is updated in batches as the images are moved.
+
+        :param catalog: The image catalog whose paths are updated.
+        :param image_folder: The folder containing the background image pool.
+        :return: The number of migrated images.
+        """
+        moves = []
+        migrated = 0
+
+        for entry in os.scandir(image_folder):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+
+            try:
+                digest = self.digest_file(entry.path)
+                blob_path = self.blob_path(digest)
+                path = self.image_path(image_folder, entry.name)
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+                with self.lock:
+                    if os.path.exists(blob_path):
+                        # Sharing the existing blob since an image with the same content was already migrated.
+                        self.link(blob_path, path)
+                        os.remove(entry.path)
+                    else:
+                        try:
+                            os.link(entry.path, blob_path)
+                        except OSError:
+                            shutil.copyfile(entry.path, blob_path)
+                        os.replace(entry.path, path)
+            except OSError as e:
+                print("Storage: " + entry.name + " " + str(e))
+                continue
+
+            moves.append((entry.path, path, digest))
+            migrated += 1
+
+            if len(moves) >= 500:
+                catalog.move_images(moves)
+                moves = []
+
+        catalog.move_images(moves)
+        return migrated
+
+    def remove_temporary_files(self):
+        """Removes the temporary files that were left behind by interrupted downloads."""
+        now = time.time()
+        for entry in os.scandir(self.temporary_folder):
+            try:
+                if entry.stat().st_mtime < now - self.temporary_file_lifetime:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def collect_garbage(self):
+        """
+        Deletes the blobs that no image links to, e.g. the blobs of images that were removed without their digest.
+
+        :return: A tuple with the number of deleted blobs and the number of bytes that were reclaimed.
+        """
+        deleted_blobs = 0
+        reclaimed_bytes = 0
+
+        for shard in os.scandir(self.blob_folder):
+            if not shard.is_dir() or shard.path == os.path.join(self.blob_folder, "tmp"):
+                continue
+
+            for entry in os.scandir(shard.path):
+                with self.lock:
+                    # Using os.stat() since the cached stat of the directory entry has no link count on Windows.
+                    stat = os.stat(entry.path)
+                    if stat.st_nlink <= 1:
+                        os.remove(entry.path)
+                        deleted_blobs += 1
+                        reclaimed_bytes += stat.st_size
+
+        return deleted_blobs, reclaimed_bytes
+
+
+if __name__ == '__main__':
+    # Running the module directly deletes the blobs that are no longer linked to by any image.
+    print("Storage: deleted {} unreferenced blobs and reclaimed {} bytes".format(*BlobStore().collect_garbage()))
@@ -0,0 +1,74 @@
+import json
+import re
+
+# The names of subreddits, which are 2 to 21 letters, digits and underscores.
+SUBREDDIT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_]{1,20}$")
+
+# A multireddit, e.g. "https://www.reddit.com/user/spez/m/favorites" or "/u/spez/m/favorites".
+MULTIREDDIT = re.compile(r"^(?:https?://(?:[a-z]+\.)?reddit\.com)?/?(?:u|user)/([A-Za-z0-9_-]+)/m/([A-Za-z0-9_]+)/?$")
+
+# The time limits that can be chosen in the main window.
+TIME_LIMITS = ("Now", "Today", "This week", "This month", "This year", "All time")
+
+
+def parse_subreddit_list(text, time_limit, number_of_images, get_reddit=None):
+    """
+    Parses a list of subreddits to import into subreddit configurations. The list can be given as:
+
+    - Text with the names of the subreddits separated by whitespace or commas, optionally with a "/r/" prefix. Lines
+      starting with "#" are ignored.
+    - A JSON list of names or of [name, time limit, number of images] configurations like in the subreddit list.
+    - A multireddit, e.g. "https://www.reddit.com/user/spez/m/favorites", whose subreddits are looked up on reddit.
+
+    :param text: The list of subreddits.
+    :param time_limit: The time limit of the subreddits that are given without one.
+    :param number_of_images: The number of images of the subreddits that are given without one.
+    :param get_reddit: Function that returns the reddit instance, which is only called for multireddits.
+    :return: A tuple with the subreddit configurations, without duplicates, and the entries that were not valid.
+    """
+    text = text.strip()
+    entries = []
+
+    multireddit = MULTIREDDIT.match(text)
+    if multireddit is not None:
+        if get_reddit is None:
+            raise ValueError("multireddits can not be imported without a reddit instance")
+
+        redditor, name = multireddit.groups()
+        entries = [subreddit.display_name for subreddit in get_reddit().multireddit(redditor, name).subreddits]
+    elif text.startswith("["):
+        entries = json.loads(text)
+    else:
+        for line in text.splitlines():
+            if not line.strip().startswith("#"):
+                entries += re.split(r"[\s,]+", line.strip())
+
+    subreddit_configs = []
+    invalid_entries = []
+    names = set()
+
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = (entry, time_limit, number_of_images)
+
+        try:
+            name, entry_time_limit, entry_number_of_images = entry
+            name = re.sub(r"^/?r/", "", str(name).strip()).strip("/")
+            entry_number_of_images = int(entry_number_of_images)
+        except (TypeError, ValueError):
+            invalid_entries.append(entry)
+            continue
+
+        if not name:
+            continue
+
+        if SUBREDDIT_NAME.match(name) is None or entry_time_limit not in TIME_LIMITS or entry_number_of_images <= 0:
+            invalid_entries.append(entry)
+            continue
+
+        # Keeping the first configuration of each subreddit.
+        if name.lower() not in names:
+            names.add(name.lower())
+            subreddit_configs.append((name, entry_time_limit, entry_number_of_images))
+
+    return subreddit_configs, invalid_entries
@@ -1,23 +1,24 @@
-import os
-
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
-from reddit_background_changer.settings import Settings
+from reddit_background_changer.blacklist import Blacklist
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.storage import BlobStore
 
 
 class SystemTray:
     """
     Class for creating the icon in the system tray that can be used to open the window and quickly change
-    background manually.
+    background manually. The main window is created the first time it is opened since the application is usually
+    started on login and only sits in the tray.
     """
-    def __init__(self, background_changer, main_window, app):
+    def __init__(self, background_changer, app):
         self.background_changer = background_changer
-        self.main_window = main_window
+        self.main_window = None
         self.app = app
 
-        # Loading the settings from the app_settings json file to get the blacklist.
-        self.settings = Settings()
+        # The shared blacklist that undesirable backgrounds are added to.
+        self.blacklist = Blacklist.shared()
 
         # Setting up the system tray icon itself.
         self.tray = QSystemTrayIcon()
@@ -30,11 +31,11 @@ class SystemTray:
         # Opening the main window when the tray icon is double clicked. We only want to call show() if the activation
         # reason is 2, meaning that the icon was double clicked.
         self.tray.activated.connect(
-            lambda activation_reason: self.main_window.show() if activation_reason == 2 else None)
+            lambda activation_reason: self.show_main_window() if activation_reason == 2 else None)
 
         # Creating an action that opens the main window.
         self.open_window_action = QAction("Open")
-        self.open_window_action.triggered.connect(self.main_window.show)
+        self.open_window_action.triggered.connect(self.show_main_window)
         self.menu.addAction(self.open_window_action)
 
         # Creating an action that exits the application
@@ -53,6 +54,16 @@ class SystemTray:
         # Add the menu to the tray.
         self.tray.setContextMenu(self.menu)
 
+    def show_main_window(self):
+        """Shows the main window, creating it the first time it is opened."""
+        if self.main_window is None:
+            # Importing the main window here since it imports the subreddit model and PRAW, which are not needed until
+            # the window is opened.
+            from reddit_background_changer.main_window import MainWindow
+            self.main_window = MainWindow(self.background_changer)
+
+        self.main_window.show()
+
     def change_background(self):
         """
         Changing the background manually and adding the old background image to the blacklist. We assume that the
@@ -61,11 +72,17 @@ class SystemTray:
         initial_background = self.background_changer.current_background
 
         if initial_background != "":
-            # Removing the initial image from the folder containing the possible backgrounds.
-            os.remove("../data/images/" + initial_background)
-
-            # Adding the initial image to the blacklist and updating the settings with the new blacklist.
-            self.settings.blacklist.append(initial_background)
-            self.settings.save_settings()
+            catalog = self.background_changer.catalog
+            image = catalog.get_image(initial_background)
+
+            # Removing the initial image from the blob store, the catalog containing the possible backgrounds and the
+            # index of perceptual hashes, so it does not make new images look like duplicates.
+            BlobStore.shared().remove(initial_background, image["digest"] if image is not None else None)
+            catalog.remove_image(initial_background)
+            HashIndex.shared().remove(initial_background)
+
+            # Adding the submission of the initial image to the blacklist, which appends it to the blacklist file.
+            if image is not None:
+                self.blacklist.add(image["fullname"])
 
         self.background_changer.change_background()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+from collections import deque
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from PyQt5.QtGui import QImage, QImageReader
+
+from reddit_background_changer.instrumentation import Instrumentation
+from reddit_background_changer.storage import write_file_atomically
+
+
+class ThumbnailCache:
+    """
+    Class for the thumbnails of the images in the background image pool that are shown in the gallery. Thumbnails are
+    decoded and downscaled by a pool of worker threads and stored as small JPEG files, so an image is only decoded once.
+    JPEG images are decoded directly at the thumbnail size, which is much faster than decoding the full image.
+
+    The thumbnails are keyed by the identity of the image file, i.e. its device, inode, size and modification time, so
+    a thumbnail is generated again if the file is replaced, and the images that link to the same blob share a thumbnail.
+
+    Requests are handled newest first and only the newest requests are kept, since the gallery requests the thumbnails
+    of the visible rows and the rows that were scrolled past are no longer needed. A dropped thumbnail is requested
+    again if its row is shown again.
+
+    :param thumbnail_folder: The folder that the thumbnails are stored in.
+    :param thumbnail_size: The largest width and height of a thumbnail in pixels.
+    :param worker_count: The number of threads that generate thumbnails.
+    :param queue_capacity: The largest number of requests that wait for a worker.
+    """
+    def __init__(self, thumbnail_folder="../data/thumbnails", thumbnail_size=160, worker_count=2, queue_capacity=256):
+        self.thumbnail_folder = thumbnail_folder
+        self.thumbnail_size = thumbnail_size
+        self.queue_capacity = queue_capacity
+
+        self.instrumentation = Instrumentation.shared()
+
+        # The waiting requests as (path, callback) tuples, where the newest request is at the right end.
+        self.requests = deque()
+        self.requested_paths = set()
+        self.condition = threading.Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+        # Starting the workers as daemon threads so they do not keep the application alive when it is closed.
+        self.workers = []
+        for _ in range(max(worker_count, 1)):
+            worker = threading.Thread(target=self.work_loop, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def request(self, path, callback):
+        """
+        Requests the thumbnail of the given image, which is loaded in a worker thread. Requests for an image that is
+        already waiting are ignored.
+
+        :param path: The path to the image file.
+        :param callback: Function that is called with (path, thumbnail) from the worker thread, where the thumbnail is
+        a QImage that is null if the image could not be decoded or the request was dropped.
+        """
+        dropped_requests = []
+
+        with self.condition:
+            if path in self.requested_paths:
+                return
+
+            self.requests.append((path, callback))
+            self.requested_paths.add(path)
+
+            # Dropping the oldest requests, which are for rows that have most likely been scrolled past.
+            while len(self.requests) > self.queue_capacity:
+                dropped_path, dropped_callback = self.requests.popleft()
+                self.requested_paths.discard(dropped_path)
+                self.dropped += 1
+                dropped_requests.append((dropped_path, dropped_callback))
+
+            self.condition.notify()
+
+        # Telling the requesters that the thumbnails were not loaded so they can be requested again. The callbacks are
+        # called without holding the condition, so a callback that requests a thumbnail again does not deadlock.
+        for dropped_path, dropped_callback in dropped_requests:
+            dropped_callback(dropped_path, QImage())
+
+    def work_loop(self):
+        """Continuously loads the thumbnail of the newest request."""
+        while True:
+            with self.condition:
+                while not self.requests:
+                    self.condition.wait()
+
+                path, callback = self.requests.pop()
+                self.requested_paths.discard(path)
+
+            try:
+                thumbnail = self.load(path)
+            except Exception as e:
+                print("Thumbnail cache: " + str(e))
+                thumbnail = QImage()
+
+            callback(path, thumbnail)
+
+    def thumbnail_path(self, path):
+        """
+        Returns the path of the thumbnail of the given image in its shard folder.
+
+        :raises OSError: If the image does not exist.
+        """
+        stat = os.stat(path)
+        key = hashlib.sha1("{}-{}-{}-{}".format(stat.st_dev, stat.st_ino, stat.st_size,
+                                                stat.st_mtime_ns).encode("utf-8")).hexdigest()
+
+        return os.path.join(self.thumbnail_folder, key[:2], key + ".jpg")
+
+    def load(self, path):
+        """
+        Loads the thumbnail of the given image from the cache, generating and storing it if it is not cached.
+
+        :param path: The path to the image file.
+        :return: The thumbnail as a QImage, which is null if the image does not exist or could not be decoded.
+        """
+        try:
+            thumbnail_path = self.thumbnail_path(path)
+        except OSError:
+            return QImage()
+
+        if os.path.exists(thumbnail_path):
+            thumbnail = QImage(thumbnail_path)
+            if not thumbnail.isNull():
+                # The counters are updated under the condition since every worker loads thumbnails at the same time.
+                with self.condition:
+                    self.hits += 1
+                return thumbnail
+
+        with self.condition:
+            self.misses += 1
+
+        with self.instrumentation.timer("gallery.generate_thumbnail"):
+            # Letting the reader decode at the thumbnail size, which JPEG images support without decoding every pixel.
+            reader = QImageReader(path)
+            if reader.size().isValid():
+                reader.setScaledSize(reader.size().scaled(self.thumbnail_size, self.thumbnail_size,
+                                                          Qt.KeepAspectRatio))
+
+            thumbnail = reader.read()
+            if thumbnail.isNull():
+                return thumbnail
+
+            # Storing the thumbnail through a temporary file, so a half written thumbnail is never loaded.
+            data = QByteArray()
+            buffer = QBuffer(data)
+            buffer.open(QIODevice.WriteOnly)
+            thumbnail.save(buffer, "JPG", 85)
+            buffer.close()
+
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            write_file_atomically(thumbnail_path, bytes(data))
+
+        return thumbnail
+
+    def remove(self, path):
+        """Removes the cached thumbnail of the given image, which must be called before the image is removed."""
+        try:
+            os.remove(self.thumbnail_path(path))
+        except OSError:
+            pass
+
+    def metrics(self):
+        """Returns the number of thumbnails that were loaded from the cache, generated and dropped."""
+        with self.condition:
+            return {"hits": self.hits, "misses": self.misses, "dropped": self.dropped}
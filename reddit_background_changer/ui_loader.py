@@ -0,0 +1,90 @@
+import hashlib
+import importlib.util
+import io
+import os
+import pathlib
+import tempfile
+
+# The folder containing the python modules compiled from the ui files.
+COMPILED_UI_FOLDER = "../data/compiled_ui"
+
+# The ui files that are compiled ahead of time.
+UI_FILES = ["../resources/mainwindow.ui", "../resources/settingsdialog.ui"]
+
+
+def load_ui(ui_path, widget):
+    """
+    Sets up the given widget from the ui file at the given path, like uic.loadUi(), but using the python module that
+    was compiled from the ui file. Executing the compiled module is faster than parsing the ui file and does not import
+    uic at all. The ui file is compiled first if it has not been compiled or if it changed since it was compiled, and
+    uic.loadUi() is used if compiling fails.
+
+    :param ui_path: The path to the ui file.
+    :param widget: The widget that is set up, which gets the child widgets of the ui file as attributes.
+    """
+    try:
+        compiled_module = load_compiled_ui(ui_path)
+    except Exception as e:
+        print("UI loader: " + str(e))
+
+        from PyQt5 import uic
+        uic.loadUi(ui_path, widget)
+        return
+
+    # Setting up the widget with the generated Ui_ class and moving the child widgets onto the widget itself.
+    ui_class = next(value for name, value in vars(compiled_module).items() if name.startswith("Ui_"))
+    ui = ui_class()
+    ui.setupUi(widget)
+
+    for name, child in vars(ui).items():
+        setattr(widget, name, child)
+
+
+def load_compiled_ui(ui_path):
+    """
+    Imports the python module compiled from the ui file at the given path, compiling it first if needed. A compiled
+    module is identified by the hash of the ui file, so changing the ui file makes it compile again.
+
+    :param ui_path: The path to the ui file.
+    :return: The compiled module.
+    """
+    with open(ui_path, "rb") as ui_file:
+        ui_hash = hashlib.sha1(ui_file.read()).hexdigest()[:16]
+
+    module_name = "ui_" + pathlib.Path(ui_path).stem + "_" + ui_hash
+    module_path = os.path.join(COMPILED_UI_FOLDER, module_name + ".py")
+
+    if not os.path.exists(module_path):
+        compile_ui(ui_path, module_path)
+
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def compile_ui(ui_path, module_path):
+    """Compiles the ui file at the given path into a python module, which is written atomically."""
+    from PyQt5 import uic
+
+    source = io.StringIO()
+    uic.compileUi(ui_path, source)
+
+    # Removing the modules compiled from older versions of the ui file.
+    pathlib.Path(COMPILED_UI_FOLDER).mkdir(parents=True, exist_ok=True)
+    prefix = "ui_" + pathlib.Path(ui_path).stem + "_"
+    for filename in os.listdir(COMPILED_UI_FOLDER):
+        if filename.startswith(prefix) and len(filename) == len(os.path.basename(module_path)):
+            os.remove(os.path.join(COMPILED_UI_FOLDER, filename))
+
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=COMPILED_UI_FOLDER, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w") as module_file:
+        module_file.write(source.getvalue())
+    os.replace(temporary_path, module_path)
+
+
+if __name__ == '__main__':
+    # Compiling the ui files ahead of time so the first start of the application does not have to.
+    for path in UI_FILES:
+        load_compiled_ui(path)
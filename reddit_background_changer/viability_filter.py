@@ -0,0 +1,113 @@
+import numpy as np
+
+# The reasons that a submission is rejected as a desktop background, in the order they are checked. A submission is
+# rejected for the first reason that applies, and the position of the reason in this tuple plus one is its code.
+REJECTION_REASONS = ("not_media", "video", "too_small", "aspect_ratio", "blacklisted")
+
+# The code of a submission that is viable.
+VIABLE = 0
+BLACKLISTED = REJECTION_REASONS.index("blacklisted") + 1
+
+
+class ViabilityFilter:
+    """
+    Class for checking whether the submissions in a page of a listing are viable as desktop backgrounds. The page is
+    turned into columns with the width, height, media domain flag, video flag and fullname of each submission, and the
+    whole page is checked in a single vectorized pass instead of one submission at a time.
+
+    An image is viable if it is at least as large as one of the target displays and its aspect ratio is within the
+    aspect tolerance of the same display. The number of rejected submissions is counted for each rejection reason.
+
+    :param targets: The (width, height) of each target display, e.g. the sizes of every connected monitor.
+    :param aspect_tolerance: The largest difference between the aspect ratio of an image and a display.
+    :param blacklist: The fullnames of the submissions that are never viable, e.g. the shared Blacklist.
+    """
+    def __init__(self, targets, aspect_tolerance=0.2, blacklist=()):
+        self.targets = np.array(targets, dtype=np.float64).reshape(-1, 2)
+        self.aspect_tolerance = aspect_tolerance
+        self.blacklist = blacklist
+
+        # The number of submissions that were checked, that were viable and that were rejected for each reason.
+        self.checked = 0
+        self.viable = 0
+        self.rejections = dict.fromkeys(REJECTION_REASONS, 0)
+
+    @classmethod
+    def from_settings(cls, settings, backend, blacklist):
+        """
+        Creates a filter from the "viability_targets" and "aspect_tolerance" settings. If no target displays are set
+        then the primary display is the only target, which is the size reported by the wallpaper backend.
+
+        :param settings: The settings of the application.
+        :param backend: The wallpaper backend that the size of the primary display is read from.
+        :param blacklist: The blacklist of submissions that are never viable.
+        :return: The viability filter.
+        """
+        targets = [(int(width), int(height)) for width, height in settings.viability_targets]
+        if not targets:
+            targets = [backend.display_geometry()[0]]
+
+        return cls(targets, settings.aspect_tolerance, blacklist)
+
+    def signature(self):
+        """
+        Returns a string describing the thresholds of the filter, e.g. "2560x1440,1920x1080~0.2". The size checks of a
+        submission only have to be done again if the signature changes.
+        """
+        return ",".join("{}x{}".format(int(width), int(height)) for width, height in self.targets) + \
+            "~" + str(self.aspect_tolerance)
+
+    def check_sizes(self, widths, heights, media, video):
+        """
+        Checks every part of the viability that does not depend on the blacklist for a whole page of submissions.
+
+        :param widths: The widths of the images, where submissions without an image can have any width.
+        :param heights: The heights of the images, where submissions without an image can have any height.
+        :param media: Whether each submission is hosted on the reddit media domain.
+        :param video: Whether each submission is a video.
+        :return: A NumPy array with the code of each submission, which is VIABLE or the code of its rejection reason.
+        """
+        media = np.asarray(media, dtype=bool)
+        video = np.asarray(video, dtype=bool)
+
+        # Using a size of zero for submissions without an image so they are never large enough for a display.
+        has_image = media & ~video
+        widths = np.where(has_image, np.asarray(widths, dtype=np.float64), 0)
+        heights = np.where(has_image, np.asarray(heights, dtype=np.float64), 0)
+
+        # Comparing every image against every target display, giving a matrix with a row for each image.
+        large_enough = (widths[:, None] >= self.targets[None, :, 0]) & (heights[:, None] >= self.targets[None, :, 1])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            aspect_ratios = np.where(heights > 0, widths / heights, 0)
+        target_aspect_ratios = self.targets[:, 0] / self.targets[:, 1]
+        similar_aspect_ratio = np.abs(aspect_ratios[:, None] - target_aspect_ratios[None, :]) <= self.aspect_tolerance
+
+        return np.select([~media, video, ~large_enough.any(axis=1), ~(large_enough & similar_aspect_ratio).any(axis=1)],
+                         [1, 2, 3, 4], VIABLE).astype(np.int8)
+
+    def check_blacklist(self, fullnames, codes):
+        """
+        Rejects the viable submissions that are in the blacklist and counts the viable and rejected submissions of the
+        page. The blacklist is checked separately from the sizes since it changes while the sizes do not.
+
+        :param fullnames: The fullnames of the submissions.
+        :param codes: The codes of the submissions from check_sizes().
+        :return: A NumPy array with the final code of each submission.
+        """
+        codes = np.array(codes, dtype=np.int8)
+        blacklisted = np.fromiter((fullname in self.blacklist for fullname in fullnames), dtype=bool,
+                                  count=len(codes))
+        codes[(codes == VIABLE) & blacklisted] = BLACKLISTED
+
+        counts = np.bincount(codes, minlength=len(REJECTION_REASONS) + 1)
+        self.checked += len(codes)
+        self.viable += int(counts[VIABLE])
+        for code, reason in enumerate(REJECTION_REASONS, start=1):
+            self.rejections[reason] += int(counts[code])
+
+        return codes
+
+    def metrics(self):
+        """Returns the number of checked and viable submissions and the number of rejections for each reason."""
+        return {"checked": self.checked, "viable": self.viable, "rejections": dict(self.rejections)}
@@ -0,0 +1,154 @@
+import ctypes
+import pathlib
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from reddit_background_changer.settings import Settings
+
+
+class WallpaperBackend:
+    """
+    Base class for the platform specific parts of changing the desktop background, i.e. applying a wallpaper and
+    querying the display geometry. Subclasses implement apply_wallpaper() and query_display_geometry().
+
+    Every apply is timed so the latency of changing the background can be measured, and the display geometry is only
+    queried once since it is needed for every submission that is checked.
+    """
+    # The backend that is shared by the whole application.
+    shared_instance = None
+    shared_instance_lock = threading.Lock()
+
+    def __init__(self):
+        # The durations in seconds of the most recent applies.
+        self.apply_latencies = deque(maxlen=1000)
+
+        self.display_geometry_cache = None
+
+    @classmethod
+    def shared(cls):
+        """Returns the backend that is shared by the whole application, creating it from the settings the first time."""
+        with cls.shared_instance_lock:
+            if cls.shared_instance is None:
+                cls.shared_instance = create_backend(Settings.shared().wallpaper_backend)
+
+            return cls.shared_instance
+
+    def apply(self, path):
+        """
+        Sets the image at the given path as the desktop background and records how long it took.
+
+        :param path: The absolute path to the image.
+        """
+        start_time = time.perf_counter()
+        self.apply_wallpaper(path)
+        self.apply_latencies.append(time.perf_counter() - start_time)
+
+    def display_geometry(self):
+        """
+        Returns the sizes of the displays, querying them the first time.
+
+        :return: A list of (width, height) tuples with the primary display first.
+        """
+        if self.display_geometry_cache is None:
+            self.display_geometry_cache = self.query_display_geometry()
+
+        return self.display_geometry_cache
+
+    def invalidate_display_geometry(self):
+        """Makes the next call to display_geometry() query the displays again, e.g. after the resolution changed."""
+        self.display_geometry_cache = None
+
+    def apply_wallpaper(self, path):
+        raise NotImplementedError
+
+    def query_display_geometry(self):
+        raise NotImplementedError
+
+
+class WindowsBackend(WallpaperBackend):
+    """Backend that uses the Windows API to change the desktop background."""
+    def apply_wallpaper(self, path):
+        # 20 is SPI_SETDESKWALLPAPER. The call returns 0 if the wallpaper could not be set.
+        if not ctypes.windll.user32.SystemParametersInfoW(20, 0, path, 0):
+            raise ctypes.WinError()
+
+    def query_display_geometry(self):
+        return [(ctypes.windll.user32.GetSystemMetrics(0), ctypes.windll.user32.GetSystemMetrics(1))]
+
+
+class GnomeBackend(WallpaperBackend):
+    """Backend that uses gsettings to change the desktop background on GNOME and other freedesktop environments."""
+    def apply_wallpaper(self, path):
+        uri = pathlib.Path(path).absolute().as_uri()
+
+        # Setting both the light and the dark variant since newer versions of GNOME use the dark variant in dark mode.
+        for key in ("picture-uri", "picture-uri-dark"):
+            subprocess.run(["gsettings", "set", "org.gnome.desktop.background", key, uri],
+                           check=key == "picture-uri", stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def query_display_geometry(self):
+        try:
+            output = subprocess.run(["xrandr", "--current"], check=True, stdout=subprocess.PIPE,
+                                    universal_newlines=True).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("Wallpaper backend: " + str(e))
+            return [(1920, 1080)]
+
+        # Lines of connected outputs look like "DP-1 connected primary 2560x1440+0+0 ...".
+        geometry = []
+        for line in output.splitlines():
+            match = re.search(r" connected (primary )?(\d+)x(\d+)\+", line)
+            if match:
+                size = (int(match.group(2)), int(match.group(3)))
+                if match.group(1):
+                    geometry.insert(0, size)
+                else:
+                    geometry.append(size)
+
+        return geometry or [(1920, 1080)]
+
+
+class HeadlessBackend(WallpaperBackend):
+    """
+    Backend that only records the applied wallpapers, used to measure and test the application on machines without a
+    desktop, e.g. build agents.
+    """
+    def __init__(self, geometry=None, apply_delay=0):
+        super(HeadlessBackend, self).__init__()
+
+        self.geometry = geometry or [(1920, 1080)]
+
+        # The number of seconds each apply takes, used to simulate a slow desktop.
+        self.apply_delay = apply_delay
+
+        self.applied_wallpapers = []
+
+    def apply_wallpaper(self, path):
+        if self.apply_delay:
+            time.sleep(self.apply_delay)
+
+        self.applied_wallpapers.append(path)
+
+    def query_display_geometry(self):
+        return list(self.geometry)
+
+
+def create_backend(name="auto"):
+    """
+    Creates the wallpaper backend with the given name.
+
+    :param name: "windows", "gnome", "headless" or "auto" to pick the backend that matches the platform.
+    :return: The new backend.
+    """
+    if name == "auto":
+        name = "windows" if sys.platform == "win32" else "gnome"
+
+    return {
+        "windows": WindowsBackend,
+        "gnome": GnomeBackend,
+        "headless": HeadlessBackend
+    }[name]()
@@ -1,19 +1,14 @@
 from PyQt5.QtCore import *
 
 
-class Worker(QRunnable):
+class WorkerSignals(QObject):
     """
-    Class that defines the behavior of a worker that can a function in a separate thread.
+    Class that defines the signals that the jobs of the job manager report through. The job manager calls the emit
+    functions from its worker threads, and the signals are delivered to the slots in the main thread since the GUI can
+    only be updated safely from the main thread.
 
-    Inherits from QRunnable to handler worker thread setup.
+    progress: (name, done, total) describing the progress of the work.
+    result: the finished job, whose result is the object returned by the function.
     """
-    def __init__(self, function, *args, **kwargs):
-        super(Worker, self).__init__()
-
-        self.function = function
-        self.args = args
-        self.kwargs = kwargs
-
-    def run(self):
-        """"Running the runner function with passed args, kwargs."""
-        self.function(*self.args, **self.kwargs)
+    progress = pyqtSignal(str, int, int)
+    result = pyqtSignal(object)
@@ -0,0 +1,35 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# Making the packages importable no matter which folder the tests are run from, and letting Qt run without a display.
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_FOLDER)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope="session")
+def workspace():
+    """
+    Runs the tests in a temporary copy of the folder layout of the application, since the application finds its data
+    and settings relative to the working directory. The workspace is removed after the tests.
+    """
+    from benchmarks.suite import prepare_workspace
+
+    working_directory = os.getcwd()
+    root = prepare_workspace()
+
+    yield root
+
+    os.chdir(working_directory)
+    shutil.rmtree(str(root), ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def application():
+    """Creates the Qt application, which must exist before pixmaps or widgets are created."""
+    from PyQt5.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,65 @@
+import hashlib
+import os
+
+import pytest
+
+from benchmarks.fake_reddit import create_jpeg
+from reddit_background_changer.background_changer import BackgroundChanger
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.storage import BlobStore
+
+
+@pytest.fixture
+def background_changer(application, workspace):
+    return BackgroundChanger(start_timer=False, prefetch=False)
+
+
+def write_image(path, data):
+    with open(str(path), "wb") as image_file:
+        image_file.write(data)
+    return str(path)
+
+
+def test_complete_jpeg_with_trailing_data_is_valid(application, tmp_path):
+    data = create_jpeg(64, 64, 0)
+
+    assert BackgroundChanger.validate_image(write_image(tmp_path / "complete.jpg", data))
+    assert BackgroundChanger.validate_image(write_image(tmp_path / "padded.jpg", data + b"\0" * 64))
+
+
+def test_truncated_jpeg_is_invalid(application, tmp_path):
+    data = create_jpeg(64, 64, 0)
+
+    assert not BackgroundChanger.validate_image(write_image(tmp_path / "truncated.jpg", data[:-64]))
+
+
+def test_quarantine_removes_every_image_of_the_blob(background_changer, tmp_path):
+    blob_store = BlobStore.shared()
+    data = b"broken image"
+    digest = hashlib.sha256(data).hexdigest()
+
+    paths = []
+    for fullname in ("t3_first", "t3_second"):
+        path = os.path.abspath(blob_store.image_path("../data/images", "wallpapers_{}.jpg".format(fullname)))
+        blob_store.add(write_image(tmp_path / fullname, data), digest, path)
+        background_changer.catalog.add_image("wallpapers", fullname, path, phash=7, digest=digest)
+        HashIndex.shared().add(7, path)
+        paths.append(path)
+
+    quarantine_folder = str(tmp_path / "quarantine")
+    background_changer.quarantine_image(paths[0], quarantine_folder)
+
+    with open(os.path.join(quarantine_folder, os.path.basename(paths[0])), "rb") as quarantined_file:
+        assert quarantined_file.read() == data
+    assert background_changer.catalog.images_with_digest(digest) == []
+    assert not any(os.path.exists(path) for path in paths)
+    assert not os.path.exists(blob_store.blob_path(digest))
+    assert HashIndex.shared().find_near_duplicate(7, 0) is None
+
+
+def test_change_interval_has_a_minimum(background_changer, monkeypatch):
+    monkeypatch.setattr(background_changer.settings, "change_frequency", 0)
+    assert background_changer.change_interval() == 60
+
+    monkeypatch.setattr(background_changer.settings, "change_frequency", 30)
+    assert background_changer.change_interval() == 30 * 60
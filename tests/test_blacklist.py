@@ -0,0 +1,26 @@
+import os
+
+from reddit_background_changer.blacklist import Blacklist
+
+
+def test_added_fullnames_are_appended_once(tmp_path):
+    path = tmp_path / "blacklist.txt"
+    blacklist = Blacklist(str(path))
+    blacklist.add_many(["t3_a", "t3_b", "t3_a"])
+    blacklist.add("t3_b")
+
+    assert "t3_a" in blacklist and "t3_b" in blacklist
+    assert path.read_text() == "t3_a\nt3_b\n"
+    assert len(Blacklist(str(path))) == 2
+
+
+def test_file_with_mostly_duplicates_is_compacted(tmp_path):
+    path = tmp_path / "blacklist.txt"
+    path.write_text("t3_b\nt3_a\nt3_b\nt3_b\nt3_a\n\n")
+
+    blacklist = Blacklist(str(path))
+
+    assert len(blacklist) == 2
+    assert blacklist.line_count == 2
+    assert path.read_text() == "t3_a\nt3_b\n"
+    assert os.listdir(str(tmp_path)) == ["blacklist.txt"]
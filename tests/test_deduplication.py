@@ -0,0 +1,50 @@
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.image_getter import ImageGetter
+
+
+def test_finds_closest_hash_within_distance():
+    index = HashIndex()
+    index.add(0b0000, "a.jpg")
+    index.add(0b1111, "b.jpg")
+
+    assert index.find_near_duplicate(0b0111, 1) == "b.jpg"
+    assert index.find_near_duplicate(0b0011, 1) is None
+    assert HashIndex().find_near_duplicate(0, 64) is None
+
+
+def test_removing_a_hash_moves_the_last_hash_into_its_place():
+    index = HashIndex(capacity=2)
+    for position, path in enumerate(["a.jpg", "b.jpg", "c.jpg"]):
+        index.add(1 << (8 * position), path)
+
+    index.remove("a.jpg")
+    index.remove("missing.jpg")
+
+    assert len(index) == 2
+    assert index.find_near_duplicate(1, 0) is None
+    assert index.find_near_duplicate(1 << 16, 0) == "c.jpg"
+    assert index.find_near_duplicate(1 << 8, 0) == "b.jpg"
+
+
+def test_adding_a_path_again_replaces_its_hash():
+    index = HashIndex()
+    index.add(0, "a.jpg")
+    index.add(2 ** 64 - 1, "a.jpg")
+
+    assert len(index) == 1
+    assert index.find_near_duplicate(0, 8) is None
+
+
+def test_image_getter_skips_near_duplicates_within_a_refresh_and_of_the_pool(workspace, monkeypatch):
+    image_getter = ImageGetter.shared()
+    monkeypatch.setattr(image_getter, "hash_index", HashIndex())
+    monkeypatch.setattr(image_getter.settings, "dedup_distance", 2)
+    image_getter.hash_index.add(0b1111 << 8, "pool.jpg")
+    refresh = {"batch_hashes": HashIndex(), "skipped_duplicates": 0}
+
+    assert not image_getter.skip_duplicate(refresh, 0b1111, "a.jpg")
+    assert image_getter.skip_duplicate(refresh, 0b0111, "b.jpg")
+    assert image_getter.skip_duplicate(refresh, 0b0111 << 8, "c.jpg")
+
+    assert refresh["skipped_duplicates"] == 2
+    assert len(refresh["batch_hashes"]) == 1
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fake_reddit import FakeRedditServer
+from reddit_background_changer.downloader import DownloadPipeline
+
+# The number of images that are downloaded and the number of seconds every request to the server is delayed, which
+# keeps a request in flight long enough for the other workers to start theirs.
+IMAGE_COUNT = 24
+LATENCY = 0.05
+
+
+@pytest.fixture
+def server(workspace):
+    with FakeRedditServer(latency=LATENCY) as server:
+        yield server
+
+
+def download(server, worker_count):
+    """Downloads the images with the given number of workers and returns the finished batch."""
+    pipeline = DownloadPipeline(worker_count)
+    batch = pipeline.start_batch("scaling", IMAGE_COUNT)
+
+    with tempfile.TemporaryDirectory() as save_folder:
+        for index in range(IMAGE_COUNT):
+            pipeline.submit(batch, "{}/images/scaling/{}/640x360.jpg".format(server.url, index),
+                            os.path.join(save_folder, "{}.jpg".format(index)))
+        batch.wait()
+
+        assert len(os.listdir(save_folder)) == batch.downloaded
+
+    return batch
+
+
+def test_downloads_every_image(server):
+    batch = download(server, 4)
+
+    assert batch.downloaded == IMAGE_COUNT
+    assert batch.failed == 0
+    assert batch.bytes_downloaded > 0
+
+
+def test_single_worker_downloads_one_image_at_a_time(server):
+    download(server, 1)
+
+    assert server.peak_in_flight_requests == 1
+    assert len(server.client_addresses) == 1
+
+
+def test_workers_download_concurrently_over_pooled_connections(server):
+    download(server, 8)
+
+    # Every worker waits for the latency of its request, so the workers have several requests in flight at once.
+    assert server.peak_in_flight_requests >= 4
+
+    # The workers reuse the connections of the shared session instead of opening one connection per image.
+    assert len(server.client_addresses) <= 8
+
+
+def test_fetch_many_downloads_into_memory_concurrently(server):
+    pipeline = DownloadPipeline(8)
+    urls = ["{}/images/fetch/{}/108x60.jpg".format(server.url, index) for index in range(IMAGE_COUNT)]
+
+    contents = pipeline.fetch_many(urls + [server.url + "/missing"])
+
+    assert all(content.startswith(b"\xff\xd8") for content in contents[:-1])
+    assert contents[-1] is None
+    assert server.peak_in_flight_requests >= 4
@@ -0,0 +1,66 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+from reddit_background_changer import icon_cache
+from reddit_background_changer.icon_cache import IconCache
+from reddit_background_changer.subreddit_model import SubredditModel
+
+
+class Catalog:
+    """Stand-in for the image catalog with the icon of every subreddit."""
+    def __init__(self, icons):
+        self.icons_by_subreddit = icons
+
+    def icons(self):
+        return list(self.icons_by_subreddit.items())
+
+
+def save_icon(path, color):
+    image = QImage(32, 32, QImage.Format_RGB32)
+    image.fill(color)
+    image.save(str(path))
+    return str(path)
+
+
+def test_changed_icon_is_loaded_again(application, tmp_path):
+    old_icon = save_icon(tmp_path / "old.png", Qt.red)
+    new_icon = save_icon(tmp_path / "new.png", Qt.blue)
+    cache = IconCache(Catalog({"Wallpapers": old_icon}))
+
+    assert cache.icon("wallpapers").toImage().pixelColor(0, 0) == Qt.red
+
+    cache.invalidate("Wallpapers", new_icon)
+    assert cache.icon("wallpapers").toImage().pixelColor(0, 0) == Qt.blue
+
+    cache.invalidate("Wallpapers")
+    assert cache.icon("wallpapers") is None
+
+
+def test_icon_invalidated_while_loading_is_not_cached(application, tmp_path, monkeypatch):
+    old_icon = save_icon(tmp_path / "old.png", Qt.red)
+    new_icon = save_icon(tmp_path / "new.png", Qt.blue)
+    cache = IconCache(Catalog({"wallpapers": old_icon}))
+
+    def load_while_invalidated(path):
+        # The icon is changed by a thread getting images after the old file has been read.
+        pixmap = QPixmap(path)
+        cache.invalidate("wallpapers", new_icon)
+        return pixmap
+
+    monkeypatch.setattr(icon_cache, "QPixmap", load_while_invalidated)
+    assert cache.icon("wallpapers").toImage().pixelColor(0, 0) == Qt.red
+    monkeypatch.undo()
+
+    assert "wallpapers" not in cache.pixmaps
+    assert cache.icon("wallpapers").toImage().pixelColor(0, 0) == Qt.blue
+
+
+def test_model_repaints_rows_whose_icon_changed(application, workspace):
+    model = SubredditModel(None, [("wallpapers", "All time", 10), ("aww", "All time", 10)])
+    changed_rows = []
+    model.dataChanged.connect(lambda top_left, bottom_right, roles: changed_rows.append((top_left.row(), roles)))
+
+    model.invalidate_icon("Wallpapers", None)
+    application.processEvents()
+
+    assert changed_rows == [(0, [Qt.DecorationRole])]
@@ -0,0 +1,54 @@
+import collections
+import os
+import random
+
+import pytest
+
+from reddit_background_changer import image_catalog
+from reddit_background_changer.image_catalog import ImageCatalog
+
+# The number of random images that are picked when checking how often each image is picked.
+PICKS = 4000
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / "catalog.db"))
+    yield catalog
+    catalog.connection.close()
+
+
+def add_images_with_gap(catalog, tmp_path):
+    """Adds two images whose ids are 1 and 100, so 98 removed images left a gap between them."""
+    paths = [str(tmp_path / "{}.jpg".format(index)) for index in range(100)]
+    for index, path in enumerate(paths):
+        catalog.add_image("wallpapers", "t3_{}".format(index), path)
+    catalog.remove_images(paths[1:-1])
+
+    return paths[0], paths[-1]
+
+
+def pick_counts(catalog):
+    random.seed(0)
+    return collections.Counter(catalog.random_image() for _ in range(PICKS))
+
+
+def test_random_image_of_empty_catalog_is_none(catalog):
+    assert catalog.random_image() is None
+
+
+def test_random_image_is_not_skewed_by_id_gaps(catalog, tmp_path):
+    first, last = add_images_with_gap(catalog, tmp_path)
+    counts = pick_counts(catalog)
+
+    assert set(counts) == {os.path.abspath(first), os.path.abspath(last)}
+    assert 0.4 < counts[os.path.abspath(first)] / PICKS < 0.6
+
+
+def test_random_image_skips_rows_when_ids_are_sparse(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_catalog, "RANDOM_ID_ATTEMPTS", 0)
+    first, last = add_images_with_gap(catalog, tmp_path)
+    counts = pick_counts(catalog)
+
+    assert set(counts) == {os.path.abspath(first), os.path.abspath(last)}
+    assert 0.4 < counts[os.path.abspath(first)] / PICKS < 0.6
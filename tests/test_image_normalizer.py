@@ -0,0 +1,100 @@
+import os
+
+from PyQt5.QtGui import QImage
+
+from benchmarks.fake_reddit import create_jpeg
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.image_normalizer import ImageNormalizer, fit_target, normalize_file
+from reddit_background_changer.storage import BlobStore
+
+TARGETS = [(1920, 1080), (1280, 1024)]
+ASPECT_TOLERANCE = 0.2
+QUALITY = 80
+
+
+def write_image(path, data):
+    with open(str(path), "wb") as file:
+        file.write(data)
+
+    return str(path)
+
+
+def normalize(path, tmp_path, quality=QUALITY):
+    return normalize_file(path, str(tmp_path), TARGETS, ASPECT_TOLERANCE, quality)
+
+
+def test_fit_target_picks_the_largest_viable_display():
+    assert fit_target(3840, 2160, TARGETS, ASPECT_TOLERANCE) == (1920, 1080)
+    assert fit_target(1600, 1200, TARGETS, ASPECT_TOLERANCE) == (1280, 1024)
+
+
+def test_fit_target_is_none_for_images_that_are_too_small_or_too_narrow():
+    assert fit_target(1280, 720, TARGETS, ASPECT_TOLERANCE) is None
+    assert fit_target(2000, 4000, TARGETS, ASPECT_TOLERANCE) is None
+
+
+def test_normalize_file_fits_the_image_to_its_display(tmp_path):
+    path = write_image(tmp_path / "large.jpg", create_jpeg(3840, 2160, 0))
+
+    result = normalize(path, tmp_path)
+
+    assert (result["width"], result["height"]) == (1920, 1080)
+    assert result["size"] == os.path.getsize(result["temporary_path"])
+    assert QImage(result["temporary_path"]).size().width() == 1920
+
+    # The image file itself is only replaced by the image normalizer.
+    assert QImage(path).width() == 3840
+
+
+def test_normalize_file_keeps_images_that_do_not_shrink(tmp_path):
+    path = write_image(tmp_path / "small.jpg", create_jpeg(640, 360, 0))
+
+    # The image is not scaled and encoding it at the highest quality does not make it smaller.
+    result = normalize(path, tmp_path, quality=100)
+
+    assert result["temporary_path"] is None
+    assert result["size"] == os.path.getsize(path)
+
+
+def test_normalize_file_does_not_write_jpeg_bytes_to_other_formats(tmp_path):
+    png_path = str(tmp_path / "large.png")
+    QImage(3840, 2160, QImage.Format_RGB32).save(png_path, "PNG")
+
+    # A PNG image that was saved with the extension of a JPEG is not re-encoded either.
+    disguised_path = write_image(tmp_path / "disguised.jpg", open(png_path, "rb").read())
+
+    for path in (png_path, disguised_path):
+        result = normalize(path, tmp_path)
+
+        assert not result["corrupt"]
+        assert result["temporary_path"] is None
+        assert (result["width"], result["height"]) == (3840, 2160)
+
+
+def test_normalize_file_reports_corrupt_images(tmp_path):
+    path = write_image(tmp_path / "corrupt.jpg", b"\xff\xd8 not an image")
+
+    assert normalize(path, tmp_path) == {"path": path, "corrupt": True}
+
+
+def test_normalizer_removes_corrupt_images_from_the_pool(workspace):
+    catalog = ImageCatalog()
+    blob_store = BlobStore.shared()
+
+    path = os.path.abspath("../data/images/corrupt.jpg")
+    file_descriptor, temporary_path = blob_store.temporary_file()
+    with os.fdopen(file_descriptor, "wb") as file:
+        file.write(b"\xff\xd8 not an image")
+    blob_store.add(temporary_path, "corrupt-digest", path)
+    catalog.add_image("wallpapers", "t3_corrupt", path, digest="corrupt-digest")
+
+    normalizer = ImageNormalizer(catalog, blob_store, worker_count=1)
+    try:
+        report = normalizer.normalize([path], TARGETS, ASPECT_TOLERANCE, QUALITY)
+    finally:
+        normalizer.shutdown()
+
+    assert report["corrupt"] == [path]
+    assert catalog.get_image(path) is None
+    assert not os.path.exists(path)
+    assert not os.path.exists(blob_store.blob_path("corrupt-digest"))
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from reddit_background_changer.job_manager import JobManager, REFRESH_PRIORITY, USER_PRIORITY
+
+
+@pytest.fixture
+def job_manager(workspace):
+    return JobManager(worker_count=1)
+
+
+def block(job_manager):
+    """Submits a job that keeps the only worker busy until the returned event is set."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job(cancel_event=None):
+        started.set()
+        release.wait(5)
+
+    job = job_manager.submit("block", blocking_job, cancellable=True)
+    started.wait(5)
+    return job, release
+
+
+def record(order, name):
+    order.append(name)
+
+
+def test_same_work_is_coalesced(job_manager):
+    blocking_job, release = block(job_manager)
+    order = []
+    done = []
+
+    first = job_manager.submit("wallpapers", record, order, "fetch", done_callback=done.append)
+    second = job_manager.submit("wallpapers", record, order, "fetch", done_callback=done.append)
+    release.set()
+    job_manager.wait_until_idle()
+
+    assert first is second
+    assert order == ["fetch"]
+    assert done == [first, first]
+    assert job_manager.metrics()["coalesced"] == 1
+
+
+def test_user_jobs_start_before_refreshes(job_manager):
+    blocking_job, release = block(job_manager)
+    order = []
+
+    job_manager.submit("aww", record, order, "refresh", priority=REFRESH_PRIORITY)
+    job_manager.submit("wallpapers", record, order, "user", priority=USER_PRIORITY)
+    release.set()
+    job_manager.wait_until_idle()
+
+    assert order == ["user", "refresh"]
+
+
+def test_superseding_cancels_pending_and_running_jobs(job_manager):
+    running_job, release = block(job_manager)
+    order = []
+    cancelled = []
+
+    pending_job = job_manager.submit("block", record, order, "old", done_callback=cancelled.append)
+    new_job = job_manager.submit("block", record, order, "new", supersede=True)
+
+    assert pending_job.state == "cancelled"
+    assert cancelled == [pending_job]
+    assert running_job.cancelled()
+
+    release.set()
+    job_manager.wait_until_idle()
+
+    assert running_job.state == "cancelled"
+    assert new_job.state == "done"
+    assert order == ["new"]
+
+
+def test_cancel_counts_the_jobs_it_cancelled(job_manager):
+    running_job, release = block(job_manager)
+    job_manager.submit("block", record, [], "pending")
+
+    assert job_manager.cancel("block") == 2
+    assert job_manager.cancel("block") == 0
+    assert job_manager.cancel("missing") == 0
+
+    release.set()
+    job_manager.wait_until_idle()
+
+
+def test_failed_job_records_its_error(job_manager):
+    def fail():
+        raise ValueError("broken")
+
+    job = job_manager.submit("wallpapers", fail)
+    job_manager.wait_until_idle()
+
+    assert job.state == "failed"
+    assert str(job.error) == "broken"
@@ -0,0 +1,20 @@
+import pytest
+
+from reddit_background_changer.job_manager import Job
+from reddit_background_changer.main_window import MainWindow
+
+
+@pytest.fixture
+def main_window(application, workspace):
+    return MainWindow(None)
+
+
+def test_failed_sync_shows_its_error(main_window):
+    job = Job("wallpapers", None, (("wallpapers", "All time", 10), "../data/images/"), 0)
+    job.state = "failed"
+    job.error = ValueError("received 503 HTTP response")
+
+    main_window.show_sync_result(job)
+
+    assert main_window.statusBar().currentMessage() == \
+        "/r/wallpapers: failed getting images: received 503 HTTP response"
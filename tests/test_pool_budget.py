@@ -0,0 +1,74 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.pool_budget import EVICTION_LIFETIME, PoolBudget
+from reddit_background_changer.settings import Settings
+from reddit_background_changer.storage import BlobStore
+
+# The size in bytes of every image in the pool.
+IMAGE_SIZE = 100
+
+
+@pytest.fixture
+def pool(workspace, tmp_path, monkeypatch):
+    """Creates a pool of three images that were shown in order, with a budget that fits two of them."""
+    monkeypatch.setattr(Settings.shared(), "pool_budget_bytes", 2 * IMAGE_SIZE)
+    monkeypatch.setattr(Settings.shared(), "eviction_policy", "last_shown")
+
+    catalog = ImageCatalog(str(tmp_path / "catalog.db"))
+    blob_store = BlobStore(str(tmp_path / "blobs"))
+
+    for index in range(3):
+        data = bytes([index]) * IMAGE_SIZE
+        digest = hashlib.sha256(data).hexdigest()
+        file_descriptor, temporary_path = blob_store.temporary_file()
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(data)
+
+        path = str(tmp_path / "t3_{}.jpg".format(index))
+        blob_store.add(temporary_path, digest, path)
+        catalog.add_image("wallpapers", "t3_{}".format(index), path, size=IMAGE_SIZE, downloaded_at=index + 1,
+                          digest=digest)
+        catalog.record_shown(path)
+
+    yield PoolBudget(catalog, blob_store)
+    catalog.connection.close()
+
+
+def test_evicts_least_recently_shown_images_below_the_low_watermark(pool):
+    evicted_images = pool.enforce(time.time())
+
+    assert [image["fullname"] for image in evicted_images] == ["t3_0", "t3_1"]
+    assert pool.catalog.pool_size() == IMAGE_SIZE
+    assert pool.evicted_fullnames("wallpapers") == {"t3_0", "t3_1"}
+
+
+def test_refills_subreddits_as_far_as_the_budget_allows(pool):
+    pool.enforce(time.time())
+
+    assert pool.refill_configs([("wallpapers", "All time", 5), ("aww", "All time", 5)]) == \
+        [("wallpapers", "All time", 2)]
+
+
+def test_evictions_are_forgotten_when_the_budget_is_raised(pool, monkeypatch):
+    pool.enforce(time.time())
+
+    monkeypatch.setattr(pool.settings, "pool_budget_bytes", 4 * IMAGE_SIZE)
+    assert pool.evicted_fullnames("wallpapers") == set()
+
+    monkeypatch.setattr(pool.settings, "pool_budget_bytes", 0)
+    assert pool.evicted_fullnames("wallpapers") == set()
+
+
+def test_evictions_are_forgotten_after_their_lifetime(pool):
+    pool.enforce(time.time())
+
+    with pool.catalog.lock, pool.catalog.connection:
+        pool.catalog.connection.execute("UPDATE evictions SET evicted_at = ? WHERE fullname = 't3_0'",
+                                        (time.time() - EVICTION_LIFETIME - 1,))
+
+    assert pool.evicted_fullnames("wallpapers") == {"t3_1"}
@@ -0,0 +1,40 @@
+from reddit_background_changer.preview_variants import select_preview_variant
+
+
+def variant(width, height):
+    return {"url": "https://preview.redd.it/image.jpg?width={}&amp;s=signature".format(width), "width": width,
+            "height": height}
+
+
+# A preview in the same form as reddit's, with the resolutions in an arbitrary order and the original as the source.
+PREVIEW_IMAGE = {"source": variant(5120, 2880),
+                 "resolutions": [variant(640, 360), variant(3840, 2160), variant(108, 60), variant(2560, 1440),
+                                 variant(1920, 1080)]}
+
+
+def selected_width(display_width, display_height, policy):
+    return select_preview_variant(PREVIEW_IMAGE, display_width, display_height, policy)["width"]
+
+
+def test_exact_policy_selects_the_smallest_variant_that_covers_the_display():
+    assert selected_width(1920, 1080, "exact") == 1920
+    assert selected_width(1921, 1080, "exact") == 2560
+
+
+def test_headroom_policy_requires_one_and_a_half_times_the_display():
+    assert selected_width(1920, 1080, "headroom") == 3840
+    assert selected_width(1280, 720, "headroom") == 1920
+
+
+def test_source_policy_always_selects_the_original():
+    assert selected_width(640, 360, "source") == 5120
+
+
+def test_original_is_selected_if_no_variant_covers_the_display():
+    assert selected_width(7680, 4320, "exact") == 5120
+    assert select_preview_variant({"source": variant(800, 600)}, 1920, 1080, "exact")["width"] == 800
+
+
+def test_selected_url_is_unescaped():
+    assert select_preview_variant(PREVIEW_IMAGE, 1920, 1080, "exact") == {
+        "url": "https://preview.redd.it/image.jpg?width=1920&s=signature", "width": 1920, "height": 1080}
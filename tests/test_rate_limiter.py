@@ -0,0 +1,90 @@
+import prawcore
+import pytest
+
+from reddit_background_changer import rate_limiter
+from reddit_background_changer.rate_limiter import RateLimitedRequestor, RateLimiter
+
+
+class Clock:
+    """Stand-in for the time module, where sleeping advances the clock right away."""
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+class Response:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+def test_burst_is_sent_at_once_and_the_rest_at_the_rate(clock):
+    limiter = RateLimiter(requests_per_minute=60, burst=3)
+
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.slept == 0
+
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.slept == pytest.approx(2)
+    assert limiter.metrics()["requests_per_minute"] == 5
+    assert limiter.metrics()["wait_seconds"] == pytest.approx(2)
+
+
+def test_tokens_refill_while_idle_up_to_the_burst(clock):
+    limiter = RateLimiter(requests_per_minute=60, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 60
+    for _ in range(2):
+        limiter.acquire()
+    assert clock.slept == 0
+
+    limiter.acquire()
+    assert clock.slept == pytest.approx(1)
+
+
+def test_rate_limit_headers_are_counted_without_waiting(clock):
+    limiter = RateLimiter(requests_per_minute=60, burst=1)
+
+    limiter.observe(200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "300"})
+    limiter.observe(429, {"retry-after": "300"})
+    limiter.acquire()
+
+    assert clock.slept == 0
+    assert limiter.metrics()["backoffs"] == 1
+    assert limiter.metrics()["rate_limited_responses"] == 1
+
+
+def test_rate_limited_request_is_sent_once(clock, monkeypatch):
+    monkeypatch.setattr(RateLimiter, "shared_instance", RateLimiter(requests_per_minute=60, burst=10))
+
+    requests = []
+
+    def request(requestor, *args, **kwargs):
+        requests.append(args)
+        return Response(429, {"retry-after": "60"})
+
+    monkeypatch.setattr(prawcore.Requestor, "request", request)
+    requestor = RateLimitedRequestor(user_agent="reddit_background_changer tests")
+    response = requestor.request("GET", "https://oauth.reddit.com/r/aww/top")
+
+    assert response.status_code == 429
+    assert len(requests) == 1
+    assert clock.slept == 0
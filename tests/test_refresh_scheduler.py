@@ -0,0 +1,39 @@
+import time
+
+from reddit_background_changer.refresh_scheduler import FAILURE_BACKOFF, MAX_FAILURE_BACKOFF, RefreshScheduler
+
+
+def test_failure_backoff_doubles_up_to_the_largest_backoff():
+    assert RefreshScheduler.failure_backoff(1) == FAILURE_BACKOFF
+    assert RefreshScheduler.failure_backoff(3) == 4 * FAILURE_BACKOFF
+    assert RefreshScheduler.failure_backoff(100) == MAX_FAILURE_BACKOFF
+
+
+def test_failed_subreddit_is_skipped_until_its_backoff_expires(workspace):
+    subreddit_config = ("backoff_test", "Now", 10)
+    scheduler = RefreshScheduler(lambda: [subreddit_config])
+
+    # A subreddit that was never refreshed is due within the stagger window after the scheduler started.
+    now = time.time() + 1000
+    assert scheduler.due_subreddits(now) == [subreddit_config]
+
+    with scheduler.lock:
+        for _ in range(3):
+            scheduler.record_failure("Backoff_Test")
+
+    assert scheduler.due_subreddits(now) == []
+    assert scheduler.due_subreddits(time.time() + RefreshScheduler.failure_backoff(3) + 1) == [subreddit_config]
+
+
+def test_subreddits_with_short_time_limits_are_due_sooner(workspace):
+    subreddit_configs = [("hourly_test", "Now", 10), ("weekly_test", "This week", 10)]
+    scheduler = RefreshScheduler(lambda: subreddit_configs)
+
+    with scheduler.catalog.lock, scheduler.catalog.connection:
+        scheduler.catalog.connection.executemany(
+            "INSERT INTO refreshes (subreddit, refreshed_at, images_downloaded, bytes_downloaded, "
+            "estimated_source_bytes, disk_bytes) VALUES (?, ?, 0, 0, 0, 0)",
+            [(name, time.time()) for name, _, _ in subreddit_configs])
+
+    assert scheduler.due_subreddits(time.time() + 2 * 3600) == [("hourly_test", "Now", 10)]
+    assert len(scheduler.due_subreddits(time.time() + 25 * 3600)) == 2
@@ -0,0 +1,92 @@
+import collections
+import os
+import random
+
+import pytest
+
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.rotation_scheduler import RotationScheduler
+
+# The number of images in the catalog and the number of decks that are drawn when checking the subreddit weights.
+IMAGE_COUNT = 10
+DECKS = 200
+
+
+@pytest.fixture
+def scheduler(workspace, tmp_path, monkeypatch):
+    random.seed(0)
+    catalog = ImageCatalog(str(tmp_path / "catalog.db"))
+
+    scheduler = RotationScheduler(catalog)
+    monkeypatch.setattr(scheduler.settings, "subreddit_weights", {})
+
+    yield scheduler
+    catalog.connection.close()
+
+
+def add_images(scheduler, tmp_path, subreddit, count):
+    paths = [os.path.abspath(str(tmp_path / "{}_{}.jpg".format(subreddit, index))) for index in range(count)]
+    for index, path in enumerate(paths):
+        scheduler.catalog.add_image(subreddit, "t3_{}_{}".format(subreddit, index), path)
+
+    return paths
+
+
+def draw_deck(scheduler):
+    """Takes the images of one whole deck, starting with a newly shuffled deck."""
+    deck = [scheduler.pop()]
+    while scheduler.remaining():
+        deck.append(scheduler.pop())
+
+    return deck
+
+
+def test_empty_catalog_has_no_image(scheduler):
+    assert scheduler.pop() is None
+
+
+def test_every_image_is_shown_once_before_the_deck_is_refilled(scheduler, tmp_path):
+    paths = add_images(scheduler, tmp_path, "wallpapers", IMAGE_COUNT)
+
+    first_deck = draw_deck(scheduler)
+    second_deck = draw_deck(scheduler)
+
+    assert sorted(first_deck) == sorted(paths)
+    assert sorted(second_deck) == sorted(paths)
+    assert first_deck != second_deck
+
+
+def test_added_image_is_shown_in_the_current_deck(scheduler, tmp_path):
+    paths = add_images(scheduler, tmp_path, "wallpapers", IMAGE_COUNT)
+    shown = [scheduler.pop() for _ in range(IMAGE_COUNT // 2)]
+
+    new_path = add_images(scheduler, tmp_path, "EarthPorn", 1)[0]
+    scheduler.add(new_path, "EarthPorn")
+
+    assert sorted(shown + draw_deck(scheduler)) == sorted(paths + [new_path])
+
+
+def test_removed_image_is_taken_out_of_the_deck(scheduler, tmp_path):
+    paths = add_images(scheduler, tmp_path, "wallpapers", IMAGE_COUNT)
+    shown = scheduler.pop()
+
+    removed_path = next(path for path in paths if path != shown)
+    scheduler.catalog.remove_images([removed_path])
+
+    assert removed_path not in draw_deck(scheduler)
+    assert scheduler.remaining() == 0
+
+
+def test_subreddit_weights_decide_how_often_images_are_shown(scheduler, tmp_path, monkeypatch):
+    add_images(scheduler, tmp_path, "wallpapers", IMAGE_COUNT)
+    add_images(scheduler, tmp_path, "EarthPorn", IMAGE_COUNT)
+    add_images(scheduler, tmp_path, "spaceporn", IMAGE_COUNT)
+    monkeypatch.setattr(scheduler.settings, "subreddit_weights", {"earthporn": 2, "spaceporn": 0.5})
+
+    shown = collections.Counter()
+    for _ in range(DECKS):
+        shown.update(os.path.basename(path).split("_")[0] for path in draw_deck(scheduler))
+
+    assert shown["wallpapers"] == IMAGE_COUNT * DECKS
+    assert shown["EarthPorn"] == 2 * IMAGE_COUNT * DECKS
+    assert shown["spaceporn"] == pytest.approx(0.5 * IMAGE_COUNT * DECKS, rel=0.1)
@@ -0,0 +1,24 @@
+import json
+import os
+
+from reddit_background_changer.settings import Settings
+
+
+def test_missing_settings_file_is_initialized(tmp_path):
+    path = tmp_path / "settings.json"
+    settings = Settings(str(path))
+
+    assert json.loads(path.read_text())["change_frequency"] == 30
+    assert settings.change_frequency == 30
+    assert os.listdir(str(tmp_path)) == ["settings.json"]
+
+
+def test_saved_settings_replace_the_file(tmp_path):
+    path = tmp_path / "settings.json"
+    settings = Settings(str(path))
+    settings.download_workers = 12
+    settings.save_settings()
+
+    assert json.loads(path.read_text())["download_workers"] == 12
+    assert Settings(str(path)).download_workers == 12
+    assert os.listdir(str(tmp_path)) == ["settings.json"]
@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+from reddit_background_changer import storage
+from reddit_background_changer.storage import BlobStore, write_file_atomically
+
+
+@pytest.fixture
+def blob_store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def add_image(blob_store, data, path):
+    """Writes the data to a temporary file of the store and adds it as the image at the given path."""
+    file_descriptor, temporary_path = blob_store.temporary_file()
+    with os.fdopen(file_descriptor, "wb") as file:
+        file.write(data)
+
+    digest = hashlib.sha256(data).hexdigest()
+    blob_store.add(temporary_path, digest, str(path))
+    return digest
+
+
+def test_write_file_atomically_replaces_file(tmp_path):
+    path = tmp_path / "subreddits.json"
+    path.write_bytes(b"old")
+
+    write_file_atomically(str(path), b"new")
+
+    assert path.read_bytes() == b"new"
+    assert os.listdir(str(tmp_path)) == ["subreddits.json"]
+
+
+def test_write_file_atomically_keeps_old_file_if_writing_fails(tmp_path, monkeypatch):
+    path = tmp_path / "subreddits.json"
+    path.write_bytes(b"old")
+
+    def fail(file_descriptor):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage.os, "fsync", fail)
+    with pytest.raises(OSError):
+        write_file_atomically(str(path), b"new")
+
+    assert path.read_bytes() == b"old"
+    assert os.listdir(str(tmp_path)) == ["subreddits.json"]
+
+
+def test_images_with_same_content_share_one_blob(blob_store, tmp_path):
+    first_digest = add_image(blob_store, b"image", tmp_path / "first.jpg")
+    second_digest = add_image(blob_store, b"image", tmp_path / "second.jpg")
+
+    assert first_digest == second_digest
+    assert os.stat(blob_store.blob_path(first_digest)).st_nlink == 3
+    assert os.listdir(blob_store.temporary_folder) == []
+
+
+def test_blob_is_deleted_with_its_last_image(blob_store, tmp_path):
+    digest = add_image(blob_store, b"image", tmp_path / "first.jpg")
+    add_image(blob_store, b"image", tmp_path / "second.jpg")
+
+    # The blob is still linked to by the second image, so removing the first image frees nothing.
+    assert blob_store.remove(str(tmp_path / "first.jpg"), digest) == 0
+    assert os.stat(blob_store.blob_path(digest)).st_nlink == 2
+
+    assert blob_store.remove(str(tmp_path / "second.jpg"), digest) == len(b"image")
+    assert not os.path.exists(blob_store.blob_path(digest))
+    assert not os.path.exists(str(tmp_path / "second.jpg"))
+
+
+def test_release_keeps_linked_blobs(blob_store, tmp_path):
+    digest = add_image(blob_store, b"image", tmp_path / "first.jpg")
+
+    assert blob_store.release(digest) == 0
+    assert os.path.exists(blob_store.blob_path(digest))
+
+    os.remove(str(tmp_path / "first.jpg"))
+    assert blob_store.release(digest) == len(b"image")
+    assert blob_store.release(digest) == 0
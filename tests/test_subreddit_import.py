@@ -0,0 +1,65 @@
+import pytest
+
+from reddit_background_changer.subreddit_import import parse_subreddit_list
+
+
+class FakeSubreddit:
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+
+class FakeReddit:
+    """Stand-in for the reddit instance that records the multireddits that are looked up."""
+    def __init__(self, names):
+        self.names = names
+        self.lookups = []
+
+    def multireddit(self, redditor, name):
+        self.lookups.append((redditor, name))
+
+        multireddit = FakeSubreddit(name)
+        multireddit.subreddits = [FakeSubreddit(subreddit_name) for subreddit_name in self.names]
+        return multireddit
+
+
+def test_text_list_uses_the_default_configuration():
+    text = "# My favorites\nwallpapers, /r/EarthPorn\n  r/spaceporn   CityPorn/\n"
+
+    assert parse_subreddit_list(text, "This week", 10) == ([
+        ("wallpapers", "This week", 10),
+        ("EarthPorn", "This week", 10),
+        ("spaceporn", "This week", 10),
+        ("CityPorn", "This week", 10),
+    ], [])
+
+
+def test_duplicates_keep_the_first_configuration():
+    text = '[["wallpapers", "Today", 5], "Wallpapers", ["r/WALLPAPERS", "All time", 50]]'
+
+    assert parse_subreddit_list(text, "This week", 10) == ([("wallpapers", "Today", 5)], [])
+
+
+def test_invalid_entries_are_reported_without_stopping_the_import():
+    text = '["a", "has space", ["wallpapers", "Forever", 5], ["EarthPorn", "Today", "many"], ' \
+           '["spaceporn", "Today", 0], ["CityPorn"], "MapPorn"]'
+
+    subreddit_configs, invalid_entries = parse_subreddit_list(text, "Today", 10)
+
+    assert subreddit_configs == [("MapPorn", "Today", 10)]
+    assert invalid_entries == [("a", "Today", 10), ("has space", "Today", 10), ["wallpapers", "Forever", 5],
+                               ["EarthPorn", "Today", "many"], ["spaceporn", "Today", 0], ["CityPorn"]]
+
+
+def test_multireddit_is_looked_up_on_reddit():
+    reddit = FakeReddit(["wallpapers", "EarthPorn"])
+
+    subreddit_configs, _ = parse_subreddit_list("https://www.reddit.com/user/spez/m/favorites/", "Today", 10,
+                                                lambda: reddit)
+
+    assert reddit.lookups == [("spez", "favorites")]
+    assert subreddit_configs == [("wallpapers", "Today", 10), ("EarthPorn", "Today", 10)]
+
+
+def test_multireddit_needs_a_reddit_instance():
+    with pytest.raises(ValueError):
+        parse_subreddit_list("/u/spez/m/favorites", "Today", 10)
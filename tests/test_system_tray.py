@@ -0,0 +1,36 @@
+import os
+
+from reddit_background_changer.blacklist import Blacklist
+from reddit_background_changer.deduplication import HashIndex
+from reddit_background_changer.image_catalog import ImageCatalog
+from reddit_background_changer.system_tray import SystemTray
+
+
+class BackgroundChanger:
+    """Stand-in for the background changer that shows the given background."""
+    def __init__(self, catalog, current_background):
+        self.catalog = catalog
+        self.current_background = current_background
+        self.changes = 0
+
+    def change_background(self):
+        self.changes += 1
+
+
+def test_changing_the_background_removes_the_old_background(application, workspace):
+    path = os.path.abspath("../data/images/wallpapers_t3_tray.jpg")
+    with open(path, "wb") as image_file:
+        image_file.write(b"image")
+
+    catalog = ImageCatalog()
+    catalog.add_image("wallpapers", "t3_tray", path, phash=42)
+    HashIndex.shared().add(42, path)
+
+    background_changer = BackgroundChanger(catalog, path)
+    SystemTray(background_changer, application).change_background()
+
+    assert background_changer.changes == 1
+    assert not os.path.exists(path)
+    assert not catalog.contains_path(path)
+    assert "t3_tray" in Blacklist.shared()
+    assert HashIndex.shared().find_near_duplicate(42, 0) is None
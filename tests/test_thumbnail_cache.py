@@ -0,0 +1,50 @@
+import threading
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage
+
+from reddit_background_changer.thumbnail_cache import ThumbnailCache
+
+
+def save_image(path):
+    image = QImage(640, 320, QImage.Format_RGB32)
+    image.fill(Qt.green)
+    image.save(str(path))
+    return str(path)
+
+
+def test_thumbnail_is_generated_once_and_then_cached(application, workspace, tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"), thumbnail_size=80, worker_count=1)
+    path = save_image(tmp_path / "image.jpg")
+
+    generated = cache.load(path)
+    cached = cache.load(path)
+
+    assert (generated.width(), generated.height()) == (80, 40)
+    assert (cached.width(), cached.height()) == (80, 40)
+    assert cache.metrics() == {"hits": 1, "misses": 1, "dropped": 0}
+
+
+def test_dropped_requests_are_reported_without_holding_the_lock(application, workspace, tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"), worker_count=1, queue_capacity=1)
+
+    # Keeping the worker busy so the next requests wait in the queue.
+    started = threading.Event()
+    release = threading.Event()
+    cache.request("busy", lambda path, thumbnail: started.set() or release.wait(5))
+    assert started.wait(5)
+
+    requested_again = []
+
+    def request_from_another_thread(path, thumbnail):
+        # E.g. the gallery delivers the callback to the GUI thread, which requests the thumbnail again right away.
+        thread = threading.Thread(target=cache.request, args=(path, lambda path, thumbnail: None))
+        thread.start()
+        thread.join(1)
+        requested_again.append(not thread.is_alive())
+
+    cache.request("first", request_from_another_thread)
+    cache.request("second", lambda path, thumbnail: None)
+    release.set()
+
+    assert requested_again == [True]
@@ -0,0 +1,58 @@
+from reddit_background_changer.viability_filter import BLACKLISTED, REJECTION_REASONS, VIABLE, ViabilityFilter
+
+TARGETS = [(1920, 1080), (1280, 1024)]
+
+
+def code(reason):
+    return REJECTION_REASONS.index(reason) + 1
+
+
+def test_check_sizes_gives_the_first_rejection_reason():
+    viability_filter = ViabilityFilter(TARGETS, aspect_tolerance=0.2)
+
+    codes = viability_filter.check_sizes(
+        widths=[3840, 3840, 3840, 1280, 2000, 1200, 0],
+        heights=[2160, 2160, 2160, 720, 3000, 1000, 0],
+        media=[True, False, True, True, True, True, True],
+        video=[False, False, True, False, False, False, False])
+
+    assert codes.tolist() == [VIABLE, code("not_media"), code("video"), code("too_small"), code("aspect_ratio"),
+                              code("too_small"), code("too_small")]
+
+
+def test_image_is_viable_for_any_display_with_a_similar_aspect_ratio():
+    viability_filter = ViabilityFilter(TARGETS, aspect_tolerance=0.2)
+
+    # The 5:4 image is too narrow for the 16:9 display but fits the 5:4 display, and the 4:3 images are within the
+    # aspect tolerance of the 5:4 display only.
+    codes = viability_filter.check_sizes([1500, 1600], [1200, 1200], [True, True], [False, False])
+
+    assert codes.tolist() == [VIABLE, VIABLE]
+    assert ViabilityFilter(TARGETS[:1], 0.2).check_sizes([2000], [1500], [True], [False]).tolist() == \
+        [code("aspect_ratio")]
+
+
+def test_check_blacklist_only_rejects_viable_submissions():
+    viability_filter = ViabilityFilter(TARGETS, blacklist={"t3_a", "t3_c"})
+
+    codes = viability_filter.check_blacklist(["t3_a", "t3_b", "t3_c"], [VIABLE, VIABLE, code("video")])
+
+    assert codes.tolist() == [BLACKLISTED, VIABLE, code("video")]
+
+
+def test_check_blacklist_counts_the_page():
+    viability_filter = ViabilityFilter(TARGETS, blacklist={"t3_a"})
+
+    viability_filter.check_blacklist(["t3_a", "t3_b", "t3_c"], [VIABLE, VIABLE, code("video")])
+    viability_filter.check_blacklist(["t3_d"], [code("too_small")])
+
+    assert viability_filter.metrics() == {
+        "checked": 4,
+        "viable": 1,
+        "rejections": {"not_media": 0, "video": 1, "too_small": 1, "aspect_ratio": 0, "blacklisted": 1},
+    }
+
+
+def test_signature_changes_with_the_thresholds():
+    assert ViabilityFilter(TARGETS, 0.2).signature() == "1920x1080,1280x1024~0.2"
+    assert ViabilityFilter(TARGETS, 0.1).signature() != ViabilityFilter(TARGETS, 0.2).signature()